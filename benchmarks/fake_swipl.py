@@ -0,0 +1,175 @@
+""" Scripted stand-in of the SWI-Prolog toplevel for benchmarks
+Understands just enough of the toplevel the Swipl class talks to: asserted and
+consulted facts, fact lookups answered one solution per ';', findnsols batches,
+double negated proofs and halt. Run as: python benchmarks/fake_swipl.py -q +tty
+"""
+import os
+import re
+import sys
+import termios
+import tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from prolog.term import Atom, Compound, TermError, Var, parse_term, resolve, unify
+
+PROMPT = "\n\n?- "
+ASSERT = re.compile(r"^assertz?\(\((.*)\)\)$", re.DOTALL)
+CONSULT = re.compile(r"^\['(.*)'\]$")
+PROVE = re.compile(r"^\\\+ \\\+ \((.*)\)$", re.DOTALL)
+FINDNSOLS = re.compile(r"^findnsols\((\d+), \[(.*?)\], \((.*)\), (\w+)\)$", re.DOTALL)
+
+
+class Toplevel:
+    def __init__(self):
+        self.facts = {}
+
+    def write(self, text: str) -> None:
+        os.write(1, text.encode())
+
+    def read_char(self) -> str:
+        char = os.read(0, 1)
+        if not char:
+            sys.exit(0)
+        return char.decode()
+
+    def read_line(self) -> str:
+        line = []
+        while True:
+            char = self.read_char()
+            if char in "\r\n":
+                # the terminal echo the client skips with readline()
+                self.write("".join(line) + "\n")
+                return "".join(line)
+            line.append(char)
+
+    def serve(self) -> None:
+        self.write("?- ")
+        while True:
+            goal = self.read_line().strip()
+            if goal.endswith("."):
+                goal = goal[:-1]
+            if goal.startswith("halt"):
+                return
+            try:
+                self.answer(goal)
+            except TermError as e:
+                self.write(f"ERROR: Syntax error: {e}{PROMPT}")
+
+    def answer(self, goal: str) -> None:
+        match = ASSERT.match(goal)
+        if match:
+            self.add(match.group(1))
+            return self.write("true." + PROMPT)
+
+        match = CONSULT.match(goal)
+        if match:
+            with open(match.group(1)) as file:
+                for line in file:
+                    line = line.strip().rstrip(".")
+                    match = ASSERT.match(line[3:]) if line.startswith(":- ") else None
+                    if match:
+                        self.add(match.group(1))
+            return self.write("true." + PROMPT)
+
+        match = PROVE.match(goal)
+        if match:
+            found = next(self.solve(parse_term(match.group(1))), None)
+            return self.write(("false." if found is None else "true.") + PROMPT)
+
+        match = FINDNSOLS.match(goal)
+        if match:
+            return self.batches(
+                int(match.group(1)),
+                [Var(v.strip()) for v in match.group(2).split(",")],
+                parse_term(match.group(3)),
+                match.group(4),
+            )
+
+        if goal.startswith("set_prolog_flag("):
+            return self.write("true." + PROMPT)
+
+        term = parse_term(goal)
+        names = [v for v in dict.fromkeys(variables(term)) if not v.startswith("_")]
+        solutions = list(self.solve(term))
+
+        if not solutions:
+            return self.write("false." + PROMPT)
+        if not names:
+            return self.write("true." + PROMPT)
+
+        for i, bindings in enumerate(solutions):
+            text = ",\n".join(
+                f"{n} = {write(resolve(n, bindings))}" for n in names
+            )
+            if i == len(solutions) - 1:
+                return self.write(text + "." + PROMPT)
+            self.write(text + " ")
+            if self.read_char() != ";":
+                return self.write("." + PROMPT)
+            self.write(";\n")
+
+    def batches(self, size: int, names: list, term, var: str) -> None:
+        rows = [
+            "[" + ", ".join(write(resolve(n, b)) for n in names) + "]"
+            for b in self.solve(term)
+        ]
+        for i in range(0, len(rows) + 1, size):
+            text = f"{var} = [{', '.join(rows[i : i + size])}]"
+            if i + size > len(rows):
+                return self.write(text + "." + PROMPT)
+            self.write(text + " ")
+            if self.read_char() != ";":
+                return self.write("." + PROMPT)
+            self.write(";\n")
+
+    def add(self, clause: str) -> None:
+        term = parse_term(clause)
+        self.facts.setdefault(key(term), []).append(term)
+
+    def solve(self, term):
+        for fact in self.facts.get(key(term), ()):
+            bindings = {}
+            if unify(term, fact, bindings):
+                yield bindings
+
+
+def key(term) -> tuple:
+    if isinstance(term, Compound):
+        return term.name, len(term.args)
+    return term, 0
+
+
+def variables(term):
+    if isinstance(term, Var):
+        yield term
+    elif isinstance(term, Compound):
+        for arg in term.args:
+            yield from variables(arg)
+    elif isinstance(term, list):
+        for item in term:
+            yield from variables(item)
+
+
+def write(term) -> str:
+    if isinstance(term, (Var, Atom)):
+        return str(term)
+    elif isinstance(term, str):
+        return '"' + term.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    elif isinstance(term, list):
+        return "[" + ", ".join(map(write, term)) + "]"
+    elif isinstance(term, Compound):
+        return f"{term.name}({', '.join(map(write, term.args))})"
+    return repr(term)
+
+
+if __name__ == "__main__":
+    if os.isatty(0):
+        # like swipl +tty, single characters such as ';' are read without enter
+        attributes = termios.tcgetattr(0)
+        tty.setcbreak(0)
+    try:
+        Toplevel().serve()
+    finally:
+        if os.isatty(0):
+            termios.tcsetattr(0, termios.TCSADRAIN, attributes)
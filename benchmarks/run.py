@@ -0,0 +1,223 @@
+""" Benchmarks of loading, querying, parsing and hydration
+Usage: python benchmarks/run.py [--swipl PATH] [--output results.json]
+Runs against swipl found on PATH, otherwise against the scripted fake toplevel.
+Results are printed as json so they can be compared across commits
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from prolog import Predicate, QuerySet
+from prolog.encoder import encode, encode_facts
+from prolog.query import normalize_value
+from prolog.swipl import Swipl
+
+FAKE_SWIPL = f"{sys.executable} {os.path.join(ROOT, 'benchmarks', 'fake_swipl.py')}"
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+    children: List[str]
+
+
+def people(n: int) -> List[Person]:
+    return [Person(f"person{i}", i % 100, [f"child{i}", "Wednesday"]) for i in range(n)]
+
+
+class Rows:
+    """ Session answering every query with the same rows, measures hydration only """
+
+    def __init__(self, rows: List[dict]):
+        self.rows = rows
+
+    def query(self, _, lazy=False, timeout=None):
+        for row in self.rows:
+            yield row.copy()
+
+
+def measure(func: Callable[[], object], ops: int, repeat: int) -> Dict[str, float]:
+    """ Runs func repeat times, func does ops operations per run """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        "ops": ops,
+        "best_s": best,
+        "median_s": statistics.median(times),
+        "ops_per_s": ops / best if best else float("inf"),
+    }
+
+
+def latency(func: Callable[[], object], calls: int) -> Dict[str, float]:
+    """ Times every call of func separately """
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "calls": calls,
+        "mean_s": statistics.mean(times),
+        "p50_s": times[len(times) // 2],
+        "p95_s": times[int(len(times) * 0.95)],
+    }
+
+
+def bench_engine(
+    path: str, facts: int, line_facts: int, calls: int, repeat: int
+) -> dict:
+    lines = [str(p) for p in people(facts)]
+    results = {}
+
+    def load_lines():
+        engine = Swipl(path)
+        try:
+            engine.load_lines(lines[:line_facts])
+        finally:
+            engine.halt()
+
+    def load_bulk():
+        engine = Swipl(path)
+        try:
+            engine.load_bulk(lines)
+        finally:
+            engine.halt()
+
+    results["load_lines"] = measure(load_lines, min(facts, line_facts), repeat)
+    results["load_bulk"] = measure(load_bulk, facts, repeat)
+
+    engine = Swipl(path)
+    try:
+        engine.load_bulk(lines)
+        single = f'person("person{facts // 2}", Age, _).'
+        results["query_single"] = latency(lambda: list(engine.query(single)), calls)
+        multi = "person(Name, 7, _)."
+        results["query_multi"] = latency(lambda: list(engine.query(multi)), calls)
+        results["query_multi"]["answers"] = len(list(engine.query(multi)))
+        results["query_batches"] = latency(
+            lambda: list(engine.query_batches(multi, 100)), calls
+        )
+        results["fetchall_batches"] = measure(
+            lambda: Person.filter().fetchall(engine, batch_size=1000), facts, repeat
+        )
+    finally:
+        engine.halt()
+    return results
+
+
+def bench_python(facts: int, repeat: int) -> dict:
+    instances = people(facts)
+    answer = b'Name = "person1",\r\nAge = 12,\r\nChildren = ["child1", "Wednesday"] '
+    values = ["Gomez", 52, ["Wednesday", "Pugsley"], 1.5, [[1, 2], ["a"]]] * 20
+    rows = [
+        {"name": p.name, "age": p.age, "children": p.children} for p in instances
+    ]
+    filtered = QuerySet("person(Name, 13, Children)", {"age": 13}, Person, Rows(rows))
+
+    return {
+        "process_multi_res": measure(
+            lambda: [Swipl.process_multi_res(answer) for _ in range(facts)],
+            facts,
+            repeat,
+        ),
+        "normalize_value": measure(
+            lambda: [normalize_value(v) for v in values for _ in range(facts // 100)],
+            len(values) * (facts // 100),
+            repeat,
+        ),
+        "encode": measure(
+            lambda: [encode(v) for v in values for _ in range(facts // 100)],
+            len(values) * (facts // 100),
+            repeat,
+        ),
+        "encode_facts": measure(
+            lambda: list(encode_facts(instances)), facts, repeat
+        ),
+        "predicate_str": measure(
+            lambda: [str(p) for p in instances], facts, repeat
+        ),
+        "hydrate": measure(lambda: filtered.fetchall(), facts, repeat),
+        **{
+            f"hydrate_{rows}": measure(
+                lambda: filtered.fetchall(rows=rows), facts, repeat
+            )
+            for rows in ("tuple", "namedtuple", "slots")
+        },
+    }
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--swipl", default=shutil.which("swipl"))
+    parser.add_argument("--fake", action="store_true", help="use the fake toplevel")
+    parser.add_argument("--facts", type=int, default=5000)
+    parser.add_argument(
+        "--line-facts",
+        type=int,
+        default=200,
+        help="facts loaded one round trip each by the load_lines benchmark",
+    )
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file to write the json results to")
+    options = parser.parse_args()
+
+    fake = options.fake or not options.swipl
+    path = FAKE_SWIPL if fake else options.swipl
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "engine": "fake" if fake else path,
+        "facts": options.facts,
+        "results": {
+            **bench_engine(
+                path,
+                options.facts,
+                options.line_facts,
+                options.calls,
+                options.repeat,
+            ),
+            **bench_python(options.facts, options.repeat),
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
-from .prolog import Prolog
-from .orm import Predicate
+from .version import __version__
+from .prolog import Prolog, AsyncProlog
+from .sharding import ShardedProlog
+from .orm import Predicate, Param
 from .query import QueryVar, QuerySet
+from .term import Atom
+from .encoder import encode, encode_facts
+from .swipl import SwiplPool, AsyncSwipl, QueryCache, Metrics, SlowQueryLog
 
 ANONYMOUS_QV = QueryVar("_")
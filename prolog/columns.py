@@ -0,0 +1,110 @@
+import typing
+
+from array import array
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+KINDS = ("list", "array", "numpy")
+TYPECODES = {bool: "b", int: "q", float: "d"}
+# kinds of numpy dtypes accepted for the annotation, ints are widened to floats
+NUMPY_KINDS = {bool: "b", int: "i", float: "if", str: "U"}
+Column = typing.Union[list, array, "ConstantColumn", typing.Any]
+
+
+class ConstantColumn(typing.Sequence):
+    """ Column of one value repeated length times, nothing is copied """
+
+    __slots__ = ("value", "length")
+
+    def __init__(self, value: typing.Any, length: int):
+        self.value = value
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ConstantColumn(self.value, len(range(*index.indices(self.length))))
+        if not -self.length <= index < self.length:
+            raise IndexError("ConstantColumn index out of range")
+        return self.value
+
+    def __iter__(self) -> typing.Iterator:
+        return repeat(self.value, self.length)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ConstantColumn):
+            return self.length == other.length and (
+                not self.length or self.value == other.value
+            )
+        return list(self) == other
+
+    def __repr__(self) -> str:
+        return f"ConstantColumn({self.value!r}, {self.length})"
+
+
+def field_types(dataclass: type) -> typing.Dict[str, typing.Any]:
+    """ Annotations of the dataclass, a dict has no fields """
+    try:
+        return typing.get_type_hints(dataclass)
+    except (NameError, TypeError):
+        return dict(getattr(dataclass, "__annotations__", {}))
+
+
+def typed_column(values: list, annotation: typing.Any, kind: str) -> Column:
+    """ Converts the column to an array of the annotated type, columns which
+    are not of the type (or have no array type) are kept as lists """
+    if kind == "array" and annotation in TYPECODES:
+        try:
+            return array(TYPECODES[annotation], values)
+        except (TypeError, OverflowError):
+            return values
+    elif kind == "numpy" and annotation in NUMPY_KINDS:
+        try:
+            column = numpy.asarray(values)
+        except (TypeError, ValueError):
+            return values
+        if column.ndim == 1 and column.dtype.kind in NUMPY_KINDS[annotation]:
+            return column.astype(float) if annotation is float else column
+    return values
+
+
+def constant_column(value: typing.Any, length: int, kind: str) -> Column:
+    if kind == "numpy" and isinstance(value, (bool, int, float, str)):
+        # read-only view of a single element
+        return numpy.broadcast_to(numpy.asarray(value), (length,))
+    return ConstantColumn(value, length)
+
+
+def to_columns(
+    keys: typing.Sequence[str],
+    values: typing.Sequence[list],
+    length: int,
+    pre_set: typing.Dict[str, typing.Any],
+    dataclass: type,
+    kind: str = "list",
+) -> typing.Dict[str, Column]:
+    """ Makes the columns of solutions, pre_set values are broadcast
+    Columns are ordered as the fields of the dataclass """
+    assert kind in KINDS, f"Kind must be one of {KINDS}"
+    if kind == "numpy" and numpy is None:
+        raise ImportError("numpy is required for numpy columns")
+
+    types = field_types(dataclass)
+    fetched = dict(zip(keys, values))
+    names = list(types) or [*keys, *(k for k in pre_set if k not in fetched)]
+    columns = {}
+
+    for name in names:
+        if name in pre_set:
+            columns[name] = constant_column(pre_set[name], length, kind)
+        elif name in fetched:
+            columns[name] = typed_column(fetched[name], types.get(name), kind)
+        elif types:
+            columns[name] = typed_column([], types[name], kind)
+    return columns
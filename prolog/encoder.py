@@ -0,0 +1,228 @@
+import math
+import re
+import typing
+
+from dataclasses import fields, is_dataclass
+from operator import attrgetter
+from prolog.query import QueryVar
+from prolog.term import Atom, Compound
+
+SOLO_ATOM = re.compile(r"[a-z][a-zA-Z0-9_]*\Z")
+STRING_ESCAPES = {
+    **{c: f"\\x{c:x}\\" for c in range(32)},
+    ord("\\"): "\\\\",
+    ord('"'): '\\"',
+    ord("\n"): "\\n",
+    ord("\t"): "\\t",
+    ord("\r"): "\\r",
+    127: "\\x7f\\",
+}
+ATOM_ESCAPES = {**STRING_ESCAPES, ord('"'): '"', ord("'"): "\\'"}
+Writer = typing.Callable[[typing.Any, typing.List[str]], None]
+
+
+def encode(value: typing.Any) -> str:
+    """ Encodes a python value as a prolog term
+    str - string, Atom - atom, bool - true/false, None - null, list and tuple - list,
+    dict - SWI dict, Compound and dataclass instances - compound term,
+    QueryVar - written as is, other values (set, Decimal, datetime, ...) - string
+    of their str() """
+    out: typing.List[str] = []
+    write(value, out)
+    return "".join(out)
+
+
+def write(value: typing.Any, out: typing.List[str]) -> None:
+    """ Appends parts of the encoded value to out """
+    writer = WRITERS.get(type(value))
+    if writer is not None:
+        return writer(value, out)
+
+    # subclasses (QueryVar, Atom, str enums, ...) are looked up in order
+    for cls, writer in SUBCLASS_WRITERS:
+        if isinstance(value, cls):
+            return writer(value, out)
+
+    if is_dataclass(value):
+        return fact_encoder(type(value)).write(value, out)
+    write_string(str(value), out)
+
+
+def write_string(value: str, out: typing.List[str]) -> None:
+    out.append('"' + value.translate(STRING_ESCAPES) + '"')
+
+
+def write_atom(value: str, out: typing.List[str]) -> None:
+    if SOLO_ATOM.match(value) or value == "[]":
+        out.append(value)
+    else:
+        out.append("'" + value.translate(ATOM_ESCAPES) + "'")
+
+
+def write_raw(value: str, out: typing.List[str]) -> None:
+    out.append(value)
+
+
+def write_bool(value: bool, out: typing.List[str]) -> None:
+    out.append("true" if value else "false")
+
+
+def write_int(value: int, out: typing.List[str]) -> None:
+    out.append(str(int(value)))
+
+
+def write_float(value: float, out: typing.List[str]) -> None:
+    if math.isnan(value):
+        out.append("1.5NaN")
+    elif math.isinf(value):
+        out.append("1.0Inf" if value > 0 else "-1.0Inf")
+    else:
+        text = repr(float(value))
+        # prolog floats need the fraction part: 1e+100 -> 1.0e+100
+        out.append(text if "." in text else text.replace("e", ".0e"))
+
+
+def write_none(_: None, out: typing.List[str]) -> None:
+    out.append("null")
+
+
+def write_list(value: typing.Sequence, out: typing.List[str]) -> None:
+    out.append("[")
+    for i, item in enumerate(value):
+        if i:
+            out.append(", ")
+        write(item, out)
+    out.append("]")
+
+
+def write_dict(value: dict, out: typing.List[str]) -> None:
+    out.append("_{")
+    for i, (key, item) in enumerate(value.items()):
+        if i:
+            out.append(", ")
+        if isinstance(key, int) and not isinstance(key, bool):
+            write_int(key, out)
+        else:
+            write_atom(str(key), out)
+        out.append(": ")
+        write(item, out)
+    out.append("}")
+
+
+def write_compound(value: Compound, out: typing.List[str]) -> None:
+    write_atom(value.name, out)
+    write_args(value.args, out)
+
+
+def write_args(args: typing.Iterable, out: typing.List[str]) -> None:
+    out.append("(")
+    for i, arg in enumerate(args):
+        if i:
+            out.append(", ")
+        write(arg, out)
+    out.append(")")
+
+
+WRITERS: typing.Dict[type, Writer] = {
+    str: write_string,
+    Atom: write_atom,
+    QueryVar: write_raw,
+    bool: write_bool,
+    int: write_int,
+    float: write_float,
+    type(None): write_none,
+    list: write_list,
+    tuple: write_list,
+    dict: write_dict,
+    Compound: write_compound,
+}
+# order matters: QueryVar and Atom before str, bool before int
+SUBCLASS_WRITERS: typing.Tuple[typing.Tuple[type, Writer], ...] = (
+    (QueryVar, write_raw),
+    (Atom, write_atom),
+    (Compound, write_compound),
+    (str, write_string),
+    (bool, write_bool),
+    (int, write_int),
+    (float, write_float),
+    (dict, write_dict),
+    (list, write_list),
+    (tuple, write_list),
+)
+
+
+class FactEncoder:
+    """ Encodes instances of a dataclass as facts, made once per class """
+
+    def __init__(self, name: str, field_names: typing.Sequence[str]):
+        self.name = name
+        self.fields = tuple(field_names)
+        self.functor = encode(Atom(name))
+        self.values = attrgetter(*self.fields) if len(self.fields) > 1 else None
+
+    def arguments(self, instance: typing.Any) -> tuple:
+        if self.values is not None:
+            return self.values(instance)
+        return tuple(getattr(instance, f) for f in self.fields)
+
+    def write(self, instance: typing.Any, out: typing.List[str]) -> None:
+        """ Appends the term of the instance without the full stop """
+        out.append(self.functor)
+        if self.fields:
+            write_args(self.arguments(instance), out)
+
+    def __call__(self, instance: typing.Any) -> str:
+        out: typing.List[str] = []
+        self.write(instance, out)
+        out.append(".")
+        return "".join(out)
+
+    def clause(self, values: typing.Sequence) -> str:
+        """ Fact of values ordered as the fields """
+        out = [self.functor]
+        if values:
+            write_args(values, out)
+        out.append(".")
+        return "".join(out)
+
+
+FACT_ENCODERS: typing.Dict[type, FactEncoder] = {}
+
+
+def fact_encoder(cls: type) -> FactEncoder:
+    """ Cached encoder of the dataclass, models use the encoder of their template """
+    encoder = FACT_ENCODERS.get(cls)
+    if encoder is None:
+        template = getattr(cls, "template", None)
+        if template is not None:
+            encoder = template().encoder
+        else:
+            encoder = FactEncoder(cls.__name__.lower(), [f.name for f in fields(cls)])
+        FACT_ENCODERS[cls] = encoder
+    return encoder
+
+
+def encode_facts(
+    items: typing.Iterable[typing.Any], name: typing.Optional[str] = None
+) -> typing.Iterator[str]:
+    """ Streams clauses of dataclass (Predicate) instances, one per item
+    Raw tuples are facts of the predicate name
+    Usage: prolog.load_bulk(encode_facts(rows, "person")) """
+    functor = encode(Atom(name)) if name is not None else None
+    encoder = None
+    cls = None
+
+    for item in items:
+        if isinstance(item, tuple) and not is_dataclass(item):
+            if functor is None:
+                raise TypeError("Name of the predicate is needed to encode tuples")
+            out = [functor]
+            write_args(item, out)
+            out.append(".")
+            yield "".join(out)
+            continue
+
+        if type(item) is not cls:
+            cls = type(item)
+            encoder = fact_encoder(cls)
+        yield encoder(item)
@@ -0,0 +1,122 @@
+import csv
+import json
+import os
+import typing
+
+from itertools import islice
+from dataclasses import is_dataclass
+from prolog.columns import field_types
+from prolog.encoder import fact_encoder, FactEncoder
+
+FORMATS = ("csv", "jsonl")
+Source = typing.Union[str, "os.PathLike[str]", typing.Iterable[typing.Any]]
+Progress = typing.Callable[[int], typing.Any]
+
+
+def parse_bool(text: str) -> bool:
+    return text.strip().lower() in ("1", "true", "yes")
+
+
+CASTERS: typing.Dict[typing.Any, typing.Callable[[str], typing.Any]] = {
+    str: str,
+    int: int,
+    float: float,
+    bool: parse_bool,
+}
+
+
+def casters(model: type) -> typing.List[typing.Callable[[str], typing.Any]]:
+    """ Converters of csv cells to the annotated field types, cells of
+    other types (lists, dicts) are json """
+    return [CASTERS.get(t, json.loads) for t in field_types(model).values()]
+
+
+def source_format(source: Source, format: typing.Optional[str]) -> typing.Optional[str]:
+    if format is None and isinstance(source, (str, os.PathLike)):
+        extension = os.path.splitext(os.fspath(source))[1].lstrip(".").lower()
+        format = "jsonl" if extension == "ndjson" else extension
+    assert format is None or format in FORMATS, f"Format must be one of {FORMATS}"
+    return format
+
+
+def read_lines(
+    source: Source, format: str, fields: typing.Sequence[str], model: type
+) -> typing.Iterator[typing.Sequence]:
+    """ Values of the rows of a csv (with a header) or jsonl file or of its lines """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            yield from read_lines(file, format, fields, model)
+        return
+
+    if format == "jsonl":
+        for line in source:
+            if line.strip():
+                row = json.loads(line)
+                yield [row[f] for f in fields] if isinstance(row, dict) else row
+        return
+
+    cast = casters(model)
+    reader = csv.reader(source)
+    header = next(reader, None)
+    if header is None:
+        return
+    try:
+        columns = [header.index(f) for f in fields]
+    except ValueError:
+        raise ValueError(f"Header {header} has to name the fields {list(fields)}")
+    for row in reader:
+        if row:
+            yield [c(row[i]) for c, i in zip(cast, columns)]
+
+
+def clauses(
+    model: type, source: Source, format: typing.Optional[str] = None
+) -> typing.Iterator[str]:
+    """ Streams facts of the model from model instances, tuples or dicts of
+    values, or from a csv/jsonl file (or lines of it if format is set) """
+    encoder: FactEncoder = fact_encoder(model)
+    format = source_format(source, format)
+
+    if format is not None:
+        for values in read_lines(source, format, encoder.fields, model):
+            yield encoder.clause(values)
+        return
+
+    for item in source:
+        if isinstance(item, dict):
+            yield encoder.clause([item[f] for f in encoder.fields])
+        elif is_dataclass(item):
+            yield encoder(item)
+        else:
+            yield encoder.clause(item)
+
+
+def rows(
+    model: type, source: Source, format: typing.Optional[str] = None
+) -> typing.Iterator[typing.Sequence]:
+    """ Values of the facts ordered as the fields, read as clauses does """
+    encoder: FactEncoder = fact_encoder(model)
+    format = source_format(source, format)
+
+    if format is not None:
+        yield from read_lines(source, format, encoder.fields, model)
+        return
+
+    for item in source:
+        if isinstance(item, dict):
+            yield [item[f] for f in encoder.fields]
+        elif is_dataclass(item):
+            yield encoder.arguments(item)
+        else:
+            yield item
+
+
+def chunks(
+    lines: typing.Iterator[str], chunk_size: int
+) -> typing.Iterator[typing.List[str]]:
+    """ Fixed size chunks, the next one is read when the previous one is loaded """
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,2 +1,3 @@
 from .model import Predicate
+from .template import Param, PreparedQuery
 from .partial_fields import PartialField
@@ -1,38 +1,87 @@
 from prolog.query import QueryVar, QuerySet
-from prolog.predicate import predicate
 from prolog.orm.exceptions import ORMException
+from prolog.orm.template import Template, PreparedQuery
 from prolog.orm.utils import process_var
-from typing import Union
+from typing import Any, List, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from prolog.prolog import Prolog
 
 Arg = Union[str, int, list, QueryVar]
 
 
 class Predicate:
+    """ Base of the models, every dataclass field is an argument of the predicate
+    Declarations are set with the inner Meta class:
+        dynamic - declare the predicate dynamic
+        incremental - declare it dynamic with incremental tabling of its dependents
+        table - table the predicate, dynamic and incremental if set
+        index - fields whose JIT indexes are built right after loading the facts
+        shard_key - field partitioning the facts over the shards of ShardedProlog
+    """
+
+    @classmethod
+    def template(cls) -> Template:
+        """ Compiled pattern of the predicate, cached on first use """
+        template = cls.__dict__.get("_template")
+        if template is None:
+            template = Template(cls)
+            cls._template = template
+        return template
+
     @classmethod
     def filter(cls, *args: Arg, **kwargs) -> QuerySet:
         # TODO: type checks
-        query_args = []
-        pre_set = dict()
-
-        format_args = ", ".join("{}" for _ in cls.__annotations__)
-        format_predicate = predicate(f"{cls.__name__.lower()}({format_args})")
-
-        for i, required_name in enumerate(cls.__annotations__):
-            query_arg = QueryVar(required_name.capitalize())
-            if required_name in kwargs:
-                query_arg = kwargs[required_name]
-                pre_set[required_name] = query_arg
-            elif len(args) > i:
-                query_arg = args[i]
-                pre_set[required_name] = query_arg
-            query_args.append(query_arg)
+        template = cls.template()
+        query_args, pre_set = template.arguments(args, kwargs)
 
         for k, v in pre_set.items():
             pre_set[k] = process_var(v)
 
-        return QuerySet(format_predicate(*query_args), pre_set=pre_set, dataclass=cls)
+        return QuerySet(template.format(*query_args), pre_set=pre_set, dataclass=cls)
+
+    @classmethod
+    def declarations(cls) -> List[str]:
+        """ Directives of the predicate set with the Meta class """
+        meta = getattr(cls, "Meta", None)
+        indicator = cls.template().indicator
+        directives = []
+
+        if getattr(meta, "table", False):
+            # facts of a tabled predicate are asserted, so it is tabled dynamic
+            incremental = getattr(meta, "incremental", False)
+            options = "(dynamic, incremental)" if incremental else "dynamic"
+            directives.append(f":- table({indicator} as {options}).")
+        elif getattr(meta, "incremental", False):
+            directives.append(f":- dynamic([{indicator}], [incremental(true)]).")
+        elif getattr(meta, "dynamic", False):
+            directives.append(f":- dynamic({indicator}).")
+        return directives
+
+    @classmethod
+    def index_goals(cls) -> List[str]:
+        """ Goals which make SWI build the JIT indexes of Meta.index fields
+        SWI indexes arguments on demand, the first call with a bound argument
+        pays for the index, so the goals are called right after loading """
+        template = cls.template()
+        goals = []
+
+        for field in getattr(getattr(cls, "Meta", None), "index", ()):
+            if field not in template.fields:
+                raise ORMException(f"{cls.__name__} has no field {field!r} to index")
+            args = ["'$swi_py_index'" if f == field else "_" for f in template.fields]
+            goals.append(f"ignore({template.name}({', '.join(args)}))")
+        return goals
+
+    @classmethod
+    def prepare(cls, *args: Any, **kwargs: Any) -> PreparedQuery:
+        """ Prepares a reusable query, arguments set to Param are bound later
+        Usage: Person.prepare(name=Param).bind(name="Gomez") """
+        return PreparedQuery(cls, *args, **kwargs)
+
+    def delete(self, session: "Prolog") -> bool:
+        """ Retracts the fact from the session """
+        return session.retract(self)
 
     def __str__(self):
-        args = ", ".join("{}" for _ in self.__annotations__)
-        query_set = predicate(f"{self.__class__.__name__.lower()}({args}).")
-        return query_set(*(getattr(self, n) for n in self.__annotations__))
+        return self.template().encoder(self)
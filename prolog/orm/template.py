@@ -0,0 +1,100 @@
+from prolog.query import QueryVar, QuerySet
+from prolog.predicate import predicate
+from prolog.encoder import encode, FactEncoder
+from prolog.orm.exceptions import ORMException
+from prolog.orm.utils import process_var
+from typing import Any, Dict, List, Tuple, Type, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from prolog.orm.model import Predicate
+
+
+class Param:
+    """ Placeholder of an argument bound to a prepared query later """
+
+
+class Template:
+    """ Compiled predicate pattern of a model, made once per class """
+
+    def __init__(self, model: Type["Predicate"]):
+        self.name = model.__name__.lower()
+        self.fields: Tuple[str, ...] = tuple(model.__annotations__)
+        self.variables = tuple(QueryVar(f.capitalize()) for f in self.fields)
+        self.pattern = f"{self.name}({', '.join('{}' for _ in self.fields)})"
+        self.format = predicate(self.pattern)
+        self.indicator = f"{self.name}/{len(self.fields)}"
+        self.encoder = FactEncoder(self.name, self.fields)
+
+    def arguments(
+        self, args: tuple, kwargs: Dict[str, Any]
+    ) -> Tuple[List[Any], Dict[str, Any]]:
+        """ Query arguments with variables for unset fields and the preset fields """
+        query_args = list(self.variables)
+        pre_set = dict()
+
+        for i, name in enumerate(self.fields):
+            if name in kwargs:
+                query_args[i] = pre_set[name] = kwargs[name]
+            elif len(args) > i:
+                query_args[i] = pre_set[name] = args[i]
+
+        return query_args, pre_set
+
+
+class PreparedQuery:
+    """ Query of a model with constants formatted once, only params are bound """
+
+    def __init__(self, model: Type["Predicate"], *args: Any, **kwargs: Any):
+        template = model.template()
+        query_args, pre_set = template.arguments(args, kwargs)
+
+        self.model = model
+        self.params: List[str] = []
+        parts = []
+
+        for name, value in zip(template.fields, query_args):
+            if value is Param or isinstance(value, Param):
+                self.params.append(name)
+                del pre_set[name]
+                parts.append("{}")
+            else:
+                parts.append(encode(value).replace("{", "{{").replace("}", "}}"))
+
+        self.pattern = f"{template.name}({', '.join(parts)})"
+        self.pre_set = {k: process_var(v) for k, v in pre_set.items()}
+
+    def bind(self, *args: Any, **kwargs: Any) -> QuerySet:
+        """ Makes a query set with params bound positionally or by name
+        Raises: ORMException of params which are not bound, of more values than
+        params and of names which are not params left to bind """
+        if len(args) > len(self.params):
+            raise ORMException(
+                f"{self.pattern!r} has {len(self.params)} params, "
+                f"{len(args)} values were given"
+            )
+        for name in kwargs:
+            if name in self.params[: len(args)]:
+                raise ORMException(f"Param {name!r} of {self.pattern!r} is bound twice")
+            if name not in self.params:
+                raise ORMException(f"{name!r} is not a param of {self.pattern!r}")
+
+        values = list(args)
+        for name in self.params[len(args) :]:
+            if name not in kwargs:
+                raise ORMException(f"Param {name!r} of {self.pattern!r} is not bound")
+            values.append(kwargs[name])
+
+        pre_set = self.pre_set.copy()
+        for name, value in zip(self.params, values):
+            pre_set[name] = process_var(value)
+
+        return QuerySet(
+            self.pattern.format(*map(encode, values)),
+            pre_set=pre_set,
+            dataclass=self.model,
+        )
+
+    __call__ = bind
+
+    def __repr__(self) -> str:
+        return f"<PreparedQuery {self.pattern}>"
@@ -0,0 +1,219 @@
+import typing
+
+from prolog.encoder import encode
+from prolog.query import QuerySet
+from prolog.swipl.swipl import Swipl
+from prolog.term import Atom, Compound, Var, TermError, parse_term
+
+if typing.TYPE_CHECKING:
+    from prolog.query import Session
+
+QUOTES = "\"'`"
+ARG_VAR = "SwiPyArg"
+
+
+class Statistics(typing.NamedTuple):
+    """ Number of facts of a predicate and of distinct values of every argument """
+
+    size: int
+    cardinalities: typing.Tuple[int, ...]
+
+
+class Step(typing.NamedTuple):
+    """ Goal of a plan with its estimated number of solutions, None for goals
+    which are kept in place """
+
+    goal: str
+    rows: typing.Optional[float]
+
+
+def top_level(text: str) -> str:
+    """ The text with everything inside brackets and quotes blanked out """
+    masked = []
+    depth = 0
+    quote = None
+    escaped = False
+
+    for char in text:
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            masked.append(" ")
+            continue
+        if char in QUOTES:
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        masked.append(char if depth == 0 and char not in ")]}" else " ")
+    return "".join(masked)
+
+
+def split_goals(text: str, separator: str) -> typing.List[str]:
+    """ Splits the text at the separator written outside of brackets and quotes """
+    parts = []
+    start = 0
+    for i, char in enumerate(top_level(text)):
+        if char == separator:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def goal_text(name: str, args: typing.List[str]) -> str:
+    functor = encode(Atom(name))
+    return f"{functor}({', '.join(args)})" if args else functor
+
+
+def is_bound(term: typing.Any, bound: typing.Set[str]) -> bool:
+    """ Whether the term has no free variables when the bound ones are set """
+    if isinstance(term, Var):
+        return term != "_" and term in bound
+    elif isinstance(term, Compound):
+        return all(is_bound(arg, bound) for arg in term.args)
+    elif isinstance(term, list):
+        return all(is_bound(item, bound) for item in term)
+    return True
+
+
+def variables(term: typing.Any) -> typing.Set[str]:
+    """ Named variables of the term """
+    if isinstance(term, Var):
+        return set() if term == "_" else {term}
+    elif isinstance(term, Compound):
+        return set().union(*map(variables, term.args))
+    elif isinstance(term, list):
+        return set().union(*map(variables, term))
+    return set()
+
+
+class Planner:
+    """ Reorders independent conjuncts of queries so the most selective goals
+    with the most bound arguments run first
+    Goals of predicates made of facts are moved, any other goal (rules, builtins,
+    negations, operators) stays in place and splits the query into parts which
+    are planned one by one. The statistics are read from the engine on first use
+    and dropped by refresh(). Solutions may come in another order """
+
+    def __init__(self, session: "Session"):
+        self.session = session
+        self.statistics: typing.Dict[
+            typing.Tuple[str, int], typing.Optional[Statistics]
+        ] = {}
+
+    def refresh(self) -> None:
+        """ Drops the statistics after the facts changed """
+        self.statistics.clear()
+
+    def stats(self, name: str, arity: int) -> typing.Optional[Statistics]:
+        """ Statistics of the predicate, None if it is not made of facts """
+        key = (name, arity)
+        if key in self.statistics:
+            return self.statistics[key]
+        # the queries reading the statistics are planned too
+        self.statistics[key] = None
+
+        head = goal_text(name, ["_"] * arity)
+        facts = QuerySet(
+            f"current_predicate({encode(Atom(name))}/{arity}), "
+            f"\\+ predicate_property({head}, imported_from(_)), "
+            f"\\+ (clause({head}, SwiPyBody), SwiPyBody \\== true)"
+        )
+        stats = None
+        if facts.exists(self.session):
+            cardinalities = []
+            for i in range(arity):
+                args = [ARG_VAR if j == i else "_" for j in range(arity)]
+                distinct = QuerySet(f"distinct({ARG_VAR}, {goal_text(name, args)})")
+                cardinalities.append(distinct.count(self.session))
+            stats = Statistics(QuerySet(head).count(self.session), tuple(cardinalities))
+
+        self.statistics[key] = stats
+        return stats
+
+    def estimate(
+        self, term: typing.Any, bound: typing.Set[str]
+    ) -> typing.Optional[float]:
+        """ Solutions of the goal when the bound variables are set, arguments are
+        taken as independent """
+        if isinstance(term, Atom):
+            term = Compound(term, ())
+        if not isinstance(term, Compound):
+            return None
+        stats = self.stats(term.name, len(term.args))
+        if stats is None:
+            return None
+
+        rows = float(stats.size)
+        for arg, cardinality in zip(term.args, stats.cardinalities):
+            if cardinality and is_bound(arg, bound):
+                rows /= cardinality
+        return rows
+
+    def order(
+        self, goals: typing.List[str], bound: typing.Set[str]
+    ) -> typing.List[Step]:
+        """ Greedy order of a conjunction, the goal with the least estimated
+        solutions runs first. Goals which can't be moved are kept in place """
+        steps: typing.List[Step] = []
+        movable: typing.List[typing.Tuple[str, typing.Any]] = []
+
+        def flush() -> None:
+            while movable:
+                rows, i = min(
+                    (self.estimate(term, bound), i)
+                    for i, (_, term) in enumerate(movable)
+                )
+                goal, term = movable.pop(i)
+                steps.append(Step(goal, rows))
+                bound.update(variables(term))
+
+        for goal in goals:
+            try:
+                term = parse_term(goal)
+            except TermError:
+                term = None
+            if term is not None and self.estimate(term, set()) is not None:
+                movable.append((goal, term))
+                continue
+            flush()
+            steps.append(Step(goal, None))
+            # variables of a goal kept in place are taken as bound after it
+            bound.update(Swipl.query_variables(goal))
+        flush()
+        return steps
+
+    def steps(self, query: str) -> typing.List[typing.List[Step]]:
+        """ Plans of every branch of the query """
+        plans = []
+        for branch in split_goals(query, ";"):
+            if "->" in top_level(branch):
+                plans.append([Step(branch, None)])
+            else:
+                plans.append(self.order(split_goals(branch, ","), set()))
+        return plans
+
+    def plan(self, query_set: QuerySet) -> QuerySet:
+        """ Query set with the conjuncts in the planned order """
+        prolog = "; ".join(
+            ", ".join(step.goal for step in branch)
+            for branch in self.steps(query_set.prolog)
+        )
+        return query_set if prolog == query_set.prolog else query_set.clone(prolog)
+
+    def explain(self, query_set: QuerySet) -> str:
+        """ The planned order with the estimated solutions of every goal """
+        lines = []
+        for b, branch in enumerate(self.steps(query_set.prolog)):
+            if b:
+                lines.append(";")
+            for i, step in enumerate(branch, 1):
+                rows = "kept in place" if step.rows is None else f"~{step.rows:g} rows"
+                lines.append(f"{i}. {step.goal}  ({rows})")
+        return "\n".join(lines)
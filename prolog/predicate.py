@@ -1,6 +1,6 @@
 import ast
 from typing import Dict
-from .query import normalize_value
+from .encoder import encode
 
 Qvs = Dict[str, str]
 
@@ -9,9 +9,9 @@ def predicate(predicate_pattern: str):
     """ Translate a predicate """
 
     def format_predicate(*args):
-        args = [normalize_value(a).replace("'", '"') for a in args]
-        return predicate_pattern.format(*args)
+        return predicate_pattern.format(*map(encode, args))
 
+    format_predicate.pattern = predicate_pattern
     return format_predicate
 
 
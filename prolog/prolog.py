@@ -1,25 +1,78 @@
+import re
 import typing
 import types
+import weakref
 import ast
 
+from functools import partial
 from inspect import getsource, isclass
+from prolog.encoder import encode, fact_encoder
+from prolog.orm import Predicate
 from prolog.predicate import predicate, DEFINITIONS, Qvs
 from prolog.query import QueryVar, QuerySet
-from prolog.swipl import Swipl
+from prolog.swipl import Swipl, AsyncSwipl, LibSwipl, QueryCache, Observer
+from prolog.swipl.exception import SWICompileError
+from prolog.swipl.swipl import DEFAULT_ARGS, BULK_CHUNK_SIZE
+from prolog.ingest import Source, Progress, clauses, chunks
+from prolog.planner import Planner, split_goals, top_level
+from prolog.translations import TranslationCache, Translation
+from prolog.views import MaterializedView
+from prolog.term import parse_term, unify, TermError
+from prolog.utils import strip_dot
+from prolog.snapshot import snapshot_key, read_key, write_key
 
 PREDICATE_ONE_DEP = "{0}({2}) :- {1}({3})."
+NAME = re.compile(r"\s*('(?:[^'\\]|\\.)*'|[^\s(]+)")
+T = typing.TypeVar("T")
 CONSTS: Qvs = {"_": QueryVar("_")}
-
-
-class Prolog(Swipl):
-    def __init__(
-        self,
-        path_to_swipl: str,
-        args: typing.Optional[typing.List[str]] = None,
-        predicates: typing.Optional[typing.List[str]] = None,
-    ):
-        super().__init__(path_to_swipl, args)
-        self.predicates = predicates or []
+BACKENDS = ("pexpect", "libswipl")
+# subclasses of sessions running on libswipl, made once per class
+LIBSWIPL_CLASSES: typing.Dict[type, type] = {}
+
+
+def libswipl_class(cls: type) -> type:
+    """ Subclass of the session class whose engine is the in-process libswipl """
+    backend = LIBSWIPL_CLASSES.get(cls)
+    if backend is None:
+        backend = LIBSWIPL_CLASSES[cls] = type(cls.__name__, (cls, LibSwipl), {})
+    return backend
+
+
+def clause_head(clause: str) -> str:
+    """ Head of the clause, a fact is its own head """
+    neck = top_level(clause).find(":-")
+    return clause if neck < 0 else clause[:neck]
+
+
+def functor(text: str) -> typing.Tuple[str, int]:
+    """ Name and arity of the term, read without parsing its arguments """
+    text = strip_dot(text.strip())
+    match = NAME.match(text)
+    if match is None:
+        return "", 0
+    name = match.group(1)
+    if name.startswith("'"):
+        # written as encode writes it, quoted only if needed
+        try:
+            name = encode(parse_term(name))
+        except TermError:
+            pass
+    rest = text[match.end() :].strip()
+    if rest.startswith("(") and rest.endswith(")"):
+        return name, len(split_goals(rest[1:-1], ","))
+    return name, 0
+
+
+class KnowledgeBase:
+    """ Container of predicates translated from python definitions """
+
+    predicates: typing.List[str]
+    # predicates before the watermark are loaded to the engine
+    loaded: int = 0
+    # models whose Meta declarations were added to predicates
+    declared: typing.List[typing.Type[Predicate]]
+    # translated definitions kept on disk between processes
+    translations: typing.Optional[TranslationCache] = None
 
     def predicate(
         self,
@@ -29,13 +82,26 @@ class Prolog(Swipl):
         spec_parser: typing.Optional[
             typing.Callable[[list, str, typing.Callable, list], str]
         ] = None,
+        table: typing.Union[bool, str] = False,
     ):
         """ Assign free predicate with decorator / with source
+        With a translation cache the translated clauses are read from it, unless
+        source_sub or spec_parser is set
         :param func: wrapped function
         :param source:
         :param source_sub:
         :param spec_parser:
+        :param table: table the derived predicate, "incremental" makes the table
+        follow changes of incremental dynamic predicates it depends on
         """
+        if func is None and source is None:
+            return partial(
+                self.predicate,
+                source_sub=source_sub,
+                spec_parser=spec_parser,
+                table=table,
+            )
+
         if isclass(func):
             format_args = ", ".join("{}" for _ in func.__annotations__)
             query_set = predicate(
@@ -46,6 +112,36 @@ class Prolog(Swipl):
             )
             return func
 
+        if self.translations is None or source_sub or spec_parser:
+            return self.translate(func, source, source_sub, spec_parser, table)
+
+        key = self.translations.key(func, source, table)
+        translation = self.translations.get(key)
+        if translation is None:
+            start = len(self.predicates)
+            result = self.translate(func, source, None, None, table)
+            translation = Translation(
+                self.predicates[start:], getattr(result, "pattern", None)
+            )
+            self.translations.set(key, translation)
+            return result
+
+        for clause in translation.clauses:
+            self << clause
+        if translation.pattern is not None:
+            return predicate(translation.pattern)
+
+    def translate(
+        self,
+        func: typing.Optional[types.FunctionType],
+        source: typing.Optional[str],
+        source_sub: typing.Optional[typing.Callable[[str], str]],
+        spec_parser: typing.Optional[
+            typing.Callable[[list, str, typing.Callable, list], str]
+        ],
+        table: typing.Union[bool, str],
+    ):
+        """ Translates the definition from its source, see predicate """
         if not source:
             source = getsource(func)
 
@@ -59,6 +155,11 @@ class Prolog(Swipl):
         for a in code.args.args:
             qvs[a.arg] = a.arg.upper()
 
+        if table:
+            # asserted clauses need the tabled predicate to be dynamic
+            options = "(dynamic, incremental)" if table == "incremental" else "dynamic"
+            self << f":- table({code.name.lower()}/{len(args)} as {options})."
+
         for e in code.body:
             if e.__class__ is ast.Assign:
                 if e.value.__class__ is not ast.Call:
@@ -79,10 +180,6 @@ class Prolog(Swipl):
 
         raise RuntimeError("Undefined return or yield expression")
 
-    def load_predicates(self) -> None:
-        """ Loads assigned predicates to the local swi-prolog session """
-        self.load_lines(self.predicates)
-
     @staticmethod
     def query_var(prolog_name: str) -> QueryVar:
         prolog_name = prolog_name.capitalize()
@@ -99,7 +196,76 @@ class Prolog(Swipl):
 
     def __lshift__(self, pred: str):
         """ Add predicate using lshift """
+        if isinstance(pred, Predicate) and type(pred) not in self.declared:
+            self.declare(type(pred))
         self.predicates.append(str(pred))
+        self.invalidate()
+
+    def declare(self, model: typing.Type[Predicate]) -> None:
+        """ Adds directives set with the Meta class of the model, called on the
+        first fact of the model so it only has to be called before rules using
+        the model are added """
+        if model not in self.declared:
+            self.declared.append(model)
+            self.predicates.extend(model.declarations())
+            self.invalidate()
+
+    def index_goals(self) -> typing.List[str]:
+        """ Goals building the indexes requested by the declared models """
+        return [goal for model in self.declared for goal in model.index_goals()]
+
+    def invalidate(self) -> None:
+        """ Called when the knowledge base changes """
+
+    def unregister(self, clause: typing.Any) -> typing.Optional[bool]:
+        """ Removes the clause from predicates
+        Returns whether it was loaded or None if it is not registered """
+        clause = strip_dot(str(clause))
+        for i, registered in enumerate(self.predicates):
+            if strip_dot(registered) == clause:
+                del self.predicates[i]
+                if i < self.loaded:
+                    self.loaded -= 1
+                    return True
+                return False
+        return None
+
+    def unregister_all(self, head: typing.Any) -> int:
+        """ Removes the facts and rules whose head unifies with the head from
+        predicates, as retractall/1 does in the engine. Heads which can't be
+        parsed match on name and arity
+        Returns the number of removed clauses """
+        text = strip_dot(str(head))
+        try:
+            term = parse_term(text)
+        except TermError:
+            term = None
+        name, arity = functor(text)
+        kept, removed, loaded = [], 0, self.loaded
+
+        for i, registered in enumerate(self.predicates):
+            if registered.startswith(name):
+                clause = clause_head(strip_dot(registered))
+                if functor(clause) == (name, arity) and self.unifies(term, clause):
+                    removed += 1
+                    if i < loaded:
+                        self.loaded -= 1
+                    continue
+            kept.append(registered)
+
+        self.predicates[:] = kept
+        return removed
+
+    @staticmethod
+    def unifies(term: typing.Any, head: str) -> bool:
+        """ Whether the head of a registered clause unifies with the term, heads
+        which can't be parsed (or a term which couldn't be) unify """
+        if term is None:
+            return True
+        try:
+            return unify(term, parse_term(head))
+        except TermError:
+            return True
 
     def __rshift__(self, query: str) -> QuerySet[dict]:
         """ Making a query using rshift """
@@ -197,3 +363,296 @@ class Prolog(Swipl):
     def prolog_definition(node: typing.Any, qvs: Qvs):
         """ Find a definition """
         return DEFINITIONS.get(node.__class__)(node, qvs)
+
+
+class Prolog(Swipl, KnowledgeBase):
+    planner: typing.Optional[Planner] = None
+
+    def __new__(cls, *args, backend: str = "pexpect", **kwargs):
+        assert backend in BACKENDS, f"Backend must be one of {BACKENDS}"
+        if backend == "libswipl" and not issubclass(cls, LibSwipl):
+            cls = libswipl_class(cls)
+        return super().__new__(cls)
+
+    def __init__(
+        self,
+        path_to_swipl: str,
+        args: typing.Optional[typing.List[str]] = None,
+        predicates: typing.Optional[typing.List[str]] = None,
+        protocol: str = "toplevel",
+        cache: typing.Optional[QueryCache] = None,
+        state: typing.Optional[str] = None,
+        observer: typing.Optional[Observer] = None,
+        timeout: typing.Optional[float] = None,
+        backend: str = "pexpect",
+        planner: bool = False,
+        translation_cache: typing.Optional[str] = None,
+    ):
+        """
+        :param state: path of a snapshot of the loaded predicates, the session
+        boots from it if it exists and it is rebuilt when the predicates change
+        :param observer: receives timing events of the session
+        :param timeout: default deadline of queries in seconds
+        :param backend: "pexpect" - SWI-Prolog toplevel in a child process,
+        "libswipl" - SWI-Prolog embedded through ctypes, see prolog.swipl.libswipl
+        :param planner: reorder goals of composed queries by statistics of the
+        facts, see prolog.planner
+        :param translation_cache: directory keeping definitions translated by
+        predicate between processes, see prolog.translations
+        """
+        self.state = state
+        self.state_key = read_key(state) if state else None
+        if self.state_key is not None:
+            args = ["-x", state, *(DEFAULT_ARGS if args is None else args)]
+        self.views: "weakref.WeakSet[MaterializedView]" = weakref.WeakSet()
+
+        super().__init__(path_to_swipl, args, protocol, cache, observer, timeout)
+        self.predicates = predicates or []
+        self.declared = []
+        self.planner = Planner(self) if planner else None
+        if translation_cache is not None:
+            self.translations = TranslationCache(translation_cache)
+
+    def spawn(self) -> None:
+        super().spawn()
+        self.loaded = 0
+        self.ingested: typing.Set[type] = set()
+        for view in list(self.views):
+            view.invalidate()
+
+    def materialize(self, query_set: QuerySet[T]) -> MaterializedView[T]:
+        """ Fetches the solutions of the query set once and keeps them in memory,
+        the view follows the changes made with load_predicates, ingest, retract
+        and retractall, see prolog.views
+        Usage: view = prolog.materialize(Person.filter(age=13)) """
+        view = MaterializedView(query_set, self)
+        self.views.add(view)
+        return view
+
+    def load_predicates(self, chunk_size: typing.Optional[int] = None) -> None:
+        """ Loads predicates assigned since the previous call to the local
+        swi-prolog session
+        :param chunk_size: load in bulk with one round trip per chunk of predicates
+        """
+        if self.state is None:
+            return self.sync_predicates(chunk_size)
+
+        key = snapshot_key(self.predicates)
+        if key == self.state_key:
+            # the session booted from the snapshot of these predicates
+            self.loaded = len(self.predicates)
+            for goal in self.index_goals():
+                self.call(goal)
+            return
+
+        if self.loaded == 0 and self.args[:1] == ["-x"]:
+            # booted from a stale snapshot, its clauses have to go
+            self.args = self.args[2:]
+            self.spawn()
+
+        self.sync_predicates(chunk_size)
+        self.save_state(self.state)
+        write_key(self.state, key)
+        self.state_key = key
+
+    def sync_predicates(self, chunk_size: typing.Optional[int] = None) -> None:
+        if self.loaded == len(self.predicates):
+            return
+
+        while self.loaded < len(self.predicates):
+            if chunk_size:
+                chunk = self.predicates[self.loaded : self.loaded + chunk_size]
+                try:
+                    self.load_chunk(chunk)
+                except SWICompileError:
+                    # the views can't tell which clauses compiled
+                    for view in list(self.views):
+                        view.invalidate()
+                    raise
+                finally:
+                    # a consulted chunk keeps the clauses which compiled
+                    self.loaded += len(chunk)
+            else:
+                chunk = [self.predicates[self.loaded]]
+                self.load_lines(chunk)
+                self.loaded += 1
+            for view in list(self.views):
+                view.loaded(chunk)
+
+        for goal in self.index_goals():
+            self.call(goal)
+        if self.planner is not None:
+            self.planner.refresh()
+
+    def ingest(
+        self,
+        model: type,
+        source: Source,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        progress: typing.Optional[Progress] = None,
+        format: typing.Optional[str] = None,
+    ) -> int:
+        """ Streams facts of the model into the engine, a chunk is read from the
+        source after the previous one is loaded. The facts are not kept in
+        predicates, so they are not replayed to pools, but a snapshot saved
+        after them holds them. The first ingest of the model in a session
+        booted from a snapshot retracts its facts and loads its registered
+        clauses again, so ingesting the same source does not duplicate facts
+        :param source: model instances, tuples or dicts of values, or a path of
+        a csv (with a header of field names) or jsonl file
+        :param progress: called with the number of loaded facts after every chunk
+        :param format: "csv" or "jsonl" for an open file, a path is read by its
+        extension
+        Returns the number of loaded facts """
+        if issubclass(model, Predicate):
+            self.declare(model)
+        self.load_predicates()
+        if self.args[:1] == ["-x"] and model not in self.ingested:
+            self.reset_facts(model)
+        self.ingested.add(model)
+
+        loaded = 0
+        for chunk in chunks(clauses(model, source, format), chunk_size):
+            loaded += self.load_chunk(chunk)
+            if progress is not None:
+                progress(loaded)
+
+        if issubclass(model, Predicate):
+            for goal in model.index_goals():
+                self.call(goal)
+        if self.planner is not None:
+            self.planner.refresh()
+        for view in list(self.views):
+            view.invalidate()
+        return loaded
+
+    def reset_facts(self, model: type) -> None:
+        """ Retracts the clauses of the model from the engine and loads the
+        registered ones again """
+        encoder = fact_encoder(model)
+        if encoder.fields:
+            head = f"{encoder.functor}({', '.join(['_'] * len(encoder.fields))})"
+        else:
+            head = encoder.functor
+        self.call(f"retractall({head})")
+        registered = [
+            clause
+            for clause in self.predicates[: self.loaded]
+            if clause.startswith(encoder.functor + "(") or clause == head + "."
+        ]
+        if registered:
+            self.load_chunk(registered)
+
+    def execute_many(
+        self,
+        queries: typing.Sequence[typing.Union[str, QuerySet]],
+        timeout: typing.Optional[float] = None,
+        rows: str = "object",
+    ) -> typing.List[list]:
+        """ Runs independent queries in one round trip
+        Usage: people, [ann] = prolog.execute_many([prolog >> person(X, 13), "a(1)"])
+        Returns a list of results per query: rows (see QuerySet.fetch) or a single
+        proof of querysets without variables, answers of string queries
+        Raises: SWIQueryError of the first query which raised, SWIQueryTimeout """
+        answers = super().execute_many(
+            [q.expression if isinstance(q, QuerySet) else q for q in queries], timeout
+        )
+        return [
+            list(q.results(a, self.observer, True, rows))
+            if isinstance(q, QuerySet)
+            else a
+            for q, a in zip(queries, answers)
+        ]
+
+    def retract(self, clause: typing.Any) -> bool:
+        """ Retracts the clause from the session and predicates """
+        if self.unregister(clause) is False:
+            return True
+        clause = strip_dot(str(clause))
+        retracted = super().retract(clause)
+        if retracted:
+            if self.planner is not None:
+                self.planner.refresh()
+            for view in list(self.views):
+                view.retracted(clause)
+        return retracted
+
+    def retractall(self, head: typing.Any) -> None:
+        """ Retracts all clauses unifying with the head (e.g. Person.filter(age=13))
+        from the session and predicates """
+        self.unregister_all(head)
+        head = strip_dot(str(head))
+        super().retractall(head)
+        if self.planner is not None:
+            self.planner.refresh()
+        for view in list(self.views):
+            view.retracted_all(head)
+
+
+class AsyncProlog(AsyncSwipl, KnowledgeBase):
+    def __init__(
+        self,
+        path_to_swipl: str,
+        args: typing.Optional[typing.List[str]] = None,
+        predicates: typing.Optional[typing.List[str]] = None,
+        timeout: typing.Optional[float] = None,
+        translation_cache: typing.Optional[str] = None,
+    ):
+        super().__init__(path_to_swipl, args, timeout)
+        self.predicates = predicates or []
+        self.declared = []
+        if translation_cache is not None:
+            self.translations = TranslationCache(translation_cache)
+
+    async def load_predicates(self, chunk_size: int = 1000) -> None:
+        """ Loads predicates assigned since the previous call to the local
+        swi-prolog session """
+        if self.loaded == len(self.predicates):
+            return
+
+        while self.loaded < len(self.predicates):
+            chunk = self.predicates[self.loaded : self.loaded + chunk_size]
+            try:
+                await self.load_lines(chunk, chunk_size)
+            finally:
+                self.loaded += len(chunk)
+
+        for goal in self.index_goals():
+            await self.call(goal)
+
+    async def ingest(
+        self,
+        model: type,
+        source: Source,
+        chunk_size: int = 1000,
+        progress: typing.Optional[Progress] = None,
+        format: typing.Optional[str] = None,
+    ) -> int:
+        """ Streams facts of the model into the engine, see Prolog.ingest """
+        if issubclass(model, Predicate):
+            self.declare(model)
+        await self.load_predicates()
+
+        loaded = 0
+        for chunk in chunks(clauses(model, source, format), chunk_size):
+            await self.load_lines(chunk, chunk_size)
+            loaded += len(chunk)
+            if progress is not None:
+                progress(loaded)
+
+        if issubclass(model, Predicate):
+            for goal in model.index_goals():
+                await self.call(goal)
+        return loaded
+
+    async def retract(self, clause: typing.Any) -> bool:
+        """ Retracts the clause from the session and predicates """
+        if self.unregister(clause) is False:
+            return True
+        return await super().retract(strip_dot(str(clause)))
+
+    async def retractall(self, head: typing.Any) -> None:
+        """ Retracts all clauses unifying with the head from the session
+        and predicates """
+        self.unregister_all(head)
+        await super().retractall(strip_dot(str(head)))
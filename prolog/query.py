@@ -1,22 +1,34 @@
+from contextlib import closing
+from time import perf_counter
+from prolog.columns import Column, to_columns
+from prolog.rows import ROWS, row_maker
+from prolog.swipl.swipl import Swipl
 from typing import (
     Any,
+    AsyncIterator,
     Dict,
+    Iterable,
     Iterator,
+    List,
+    Sequence,
     Union,
     Type,
     Tuple,
     Optional,
     Generic,
-    NoReturn,
     TypeVar,
     TYPE_CHECKING,
 )
 
 if TYPE_CHECKING:
-    from prolog.prolog import Prolog
+    from prolog.prolog import Prolog, AsyncProlog
+    from prolog.swipl import SwiplPool, Observer
 
 QS_Foreign = Union[str, "QuerySet"]
+Session = Union["Prolog", "SwiplPool"]
 T = TypeVar("T")
+AGGREGATE_VAR = "SwiPyAggregate"
+AGGREGATES = ("count", "sum", "min", "max", "bag", "set")
 
 
 def normalize_value(v: Any):
@@ -27,6 +39,38 @@ def normalize_value(v: Any):
     return repr(v)
 
 
+def unbatch(batches: Iterator[list]) -> Iterator[Any]:
+    with closing(batches):
+        for batch in batches:
+            yield from batch
+
+
+def route(session: Session, query_set: "QuerySet") -> Session:
+    """ Session of a sharded knowledge base picks the shards of the query set """
+    router = getattr(session, "route", None)
+    return session if router is None else router(query_set)
+
+
+def combine(function: str, values: List[Any]) -> Any:
+    """ Combines partial aggregates (of several shards) into one """
+    if function in ("count", "sum"):
+        return sum(values)
+    elif function == "min":
+        return min(values)
+    elif function == "max":
+        return max(values)
+    elif function == "bag":
+        return [item for part in values for item in part]
+    elif function == "set":
+        items = [item for part in values for item in part]
+        try:
+            items.sort()
+        except TypeError:
+            items.sort(key=lambda item: (type(item).__name__, repr(item)))
+        return [item for i, item in enumerate(items) if not i or item != items[i - 1]]
+    raise QueryError(f"Can't combine {function} aggregates")
+
+
 class QueryError(Exception):
     pass
 
@@ -48,55 +92,368 @@ class QuerySet(Generic[T]):
         prolog: str,
         pre_set: Optional[Dict[str, Any]] = None,
         dataclass: Type[T] = dict,
-        session: Optional["Prolog"] = None,
+        session: Optional[Session] = None,
     ):
         self.prolog = prolog if not prolog.endswith(".") else prolog[:-1]
         self.pre_set = pre_set or {}
         self.dataclass = dataclass
         self.session = session
 
-    def __imul__(self, qs: QS_Foreign) -> NoReturn:
-        self.prolog = self.__mul__(qs)
+    def __imul__(self, qs: QS_Foreign) -> "QuerySet":
+        self.prolog = self.__mul__(qs).prolog
+        return self
 
     def __mul__(self, qs: QS_Foreign) -> "QuerySet":
-        return QuerySet(self.prolog + ", " + str(qs))
+        return QuerySet(self.prolog + ", " + str(qs), session=self.session)
 
-    def __iadd__(self, qs: QS_Foreign) -> NoReturn:
+    def __iadd__(self, qs: QS_Foreign) -> "QuerySet":
         self.prolog = self.__add__(qs).prolog
+        return self
 
     def __add__(self, qs: QS_Foreign) -> "QuerySet":
-        return QuerySet(self.prolog + "; " + str(qs))
+        return QuerySet(self.prolog + "; " + str(qs), session=self.session)
 
     def __str__(self) -> str:
         return self.prolog
 
+    def clone(self, prolog: str) -> "QuerySet[T]":
+        """ Query set of another goal with the same model, pre_set and session """
+        return QuerySet(prolog, dict(self.pre_set), self.dataclass, self.session)
+
+    def limit(self, n: int) -> "QuerySet[T]":
+        """ Stops the search after n solutions (limit/2) """
+        return self.clone(f"limit({int(n)}, ({self.prolog}))")
+
+    def offset(self, k: int) -> "QuerySet[T]":
+        """ Skips the first k solutions inside the engine (offset/2) """
+        return self.clone(f"offset({int(k)}, ({self.prolog}))")
+
+    def order_by(self, *fields: str, desc: bool = False) -> "QuerySet[T]":
+        """ Orders solutions by fields (order_by/2), all solutions are
+        searched before the first one is returned
+        Usage: Person.filter().order_by("age").offset(20).limit(10) """
+        assert fields, "Fields to order by must be set"
+        order = "desc" if desc else "asc"
+        spec = ", ".join(f"{order}({self.variable(f)})" for f in fields)
+        return self.clone(f"order_by([{spec}], ({self.prolog}))")
+
+    def distinct(self, *fields: str) -> "QuerySet[T]":
+        """ Drops duplicate solutions, of the whole query or of the fields
+        (distinct/1, distinct/2) """
+        if not fields:
+            return self.clone(f"distinct(({self.prolog}))")
+        variables = ", ".join(self.variable(f) for f in fields)
+        return self.clone(f"distinct([{variables}], ({self.prolog}))")
+
     def fetch(
-        self, session: Optional["Prolog"] = None, only_prove: bool = False
+        self,
+        session: Optional[Session] = None,
+        only_prove: bool = False,
+        batch_size: Optional[int] = None,
+        rows: str = "object",
+        timeout: Optional[float] = None,
     ) -> Iterator[Union[T, bool]]:
+        """ Lazily fetches solutions
+        :param batch_size: fetch solutions in batches of batch_size per round trip,
+        the next batch is requested when the consumer runs out of the previous one
+        :param rows: "object" - instances of the dataclass, "tuple" - tuples of
+        values ordered as fields, "namedtuple" - namedtuples of the model,
+        "slots" - light rows of the model decoding toplevel values when read
+        :param timeout: deadline in seconds (default: the session's), the goal is
+        stopped inside the engine and SWIQueryTimeout is raised
+        """
         session = session or self.session
         assert session, "Session must be set"
+        assert rows in ROWS, f"Rows must be one of {ROWS}"
+        session = route(session, self)
+        expression = self.plan(session).expression
+
+        if batch_size:
+            answers = unbatch(session.query_batches(expression, batch_size, timeout))
+        else:
+            answers = session.query(expression, rows == "slots", timeout)
+
+        with closing(answers):
+            yield from self.results(
+                answers, getattr(session, "observer", None), only_prove, rows
+            )
+
+    def results(
+        self,
+        answers: Iterable[Union[dict, bool]],
+        observer: Optional["Observer"] = None,
+        only_prove: bool = False,
+        rows: str = "object",
+    ) -> Iterator[Union[T, bool]]:
+        """ Makes results of answers of the engine, see fetch """
+        make = self.hydrate if rows == "object" else None
 
-        for data in session.query(self.expression):
+        for data in answers:
             if isinstance(data, bool):
                 if not only_prove:
                     raise QueryError(f"Query returned proof {self.prolog!r}")
                 yield data
-            data.update(self.pre_set)
-            yield self.dataclass(**data)
+                continue
+            if make is None:
+                make = row_maker(rows, self.dataclass, self.pre_set, data)
+            if observer is None:
+                yield make(data)
+                continue
+
+            start = perf_counter()
+            result = make(data)
+            observer.hydrated(self.dataclass, perf_counter() - start)
+            yield result
+
+    def hydrate(self, data: dict) -> T:
+        data.update(self.pre_set)
+        return self.dataclass(**data)
+
+    def fetchall(
+        self,
+        session: Optional[Session] = None,
+        batch_size: Optional[int] = None,
+        rows: str = "object",
+        timeout: Optional[float] = None,
+    ) -> Tuple[T, ...]:
+        return tuple(
+            self.fetch(session, batch_size=batch_size, rows=rows, timeout=timeout)
+        )
+
+    def fetch_columns(
+        self,
+        session: Optional[Session] = None,
+        batch_size: Optional[int] = None,
+        kind: str = "list",
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Column]:
+        """ Fetches solutions as columns instead of rows, no row objects are made
+        :param kind: "list" - lists, "array" - typed array.array columns of int,
+        float and bool fields, "numpy" - numpy arrays of int, float, bool and str
+        fields, other columns stay lists. Types come from the dataclass annotations
+        Columns of pre_set values are a single value broadcast to the length,
+        values of variables a solution leaves unbound are None
+        """
+        session = session or self.session
+        assert session, "Session must be set"
+        session = route(session, self)
+        expression = self.plan(session).expression
+
+        if batch_size:
+            answers = unbatch(session.query_batches(expression, batch_size, timeout))
+        else:
+            answers = session.query(expression, timeout=timeout)
+
+        variables = (v.lower() for v in Swipl.query_variables(self.prolog))
+        keys = tuple(k for k in variables if k not in self.pre_set)
+        values: List[list] = [[] for _ in keys]
+        length = 0
+
+        with closing(answers):
+            for data in answers:
+                if isinstance(data, bool):
+                    raise QueryError(f"Query returned proof {self.prolog!r}")
+                for key, column in zip(keys, values):
+                    column.append(data.get(key))
+                length += 1
+
+        return to_columns(keys, values, length, self.pre_set, self.dataclass, kind)
 
-    def fetchall(self, session: Optional["Prolog"] = None) -> Tuple[T, ...]:
-        return tuple(self.fetch(session))
+    def fetchone(
+        self, session: Optional[Session] = None, timeout: Optional[float] = None
+    ) -> T:
+        query_set = self.first(session)
+        with closing(query_set.fetch(session, timeout=timeout)) as fetch:
+            for data in fetch:
+                return data
 
-    def fetchone(self, session: Optional["Prolog"] = None) -> T:
-        for data in self.fetch(session):
-            (session or self.session).send_dot()
-            return data
+    def prove(
+        self, session: Optional[Session] = None, timeout: Optional[float] = None
+    ) -> bool:
+        query_set = self.first(session)
+        with closing(
+            query_set.fetch(session, only_prove=True, timeout=timeout)
+        ) as fetch:
+            for data in fetch:
+                return data
 
-    def prove(self, session: Optional["Prolog"] = None) -> bool:
-        for data in self.fetch(session, only_prove=True):
-            (session or self.session).send_dot()
-            return data
+    def first(self, session: Optional[Session] = None) -> "QuerySet[T]":
+        """ The query set stopping at the first solution (once/1), answers under a
+        deadline or of the json driver are collected before they are read """
+        return self.clone(f"once(({self.plan(session).prolog}))")
+
+    def plan(self, session: Optional[Session] = None) -> "QuerySet[T]":
+        """ The query set with goals reordered by the planner of the session """
+        planner = getattr(session or self.session, "planner", None)
+        return self if planner is None else planner.plan(self)
+
+    def explain(self, session: Optional[Session] = None) -> str:
+        """ Order of the goals chosen by the planner of the session with the
+        estimated solutions of every goal """
+        planner = getattr(session or self.session, "planner", None)
+        assert planner, "Session must have a planner"
+        return planner.explain(self)
+
+    def variable(self, field: str) -> str:
+        """ Variable of the query holding the field """
+        for var in Swipl.query_variables(self.prolog):
+            if var.lower() == field.lower():
+                return var
+        raise QueryError(f"{field!r} is not a variable of {self.prolog!r}")
+
+    def aggregate_all(self, template: str, session: Optional[Session] = None) -> Any:
+        """ Aggregates solutions inside the engine with aggregate_all/3
+        Returns the result or None if the aggregation failed (min/max of nothing)
+        Results of several shards are combined
+        Usage: qs.aggregate_all("max(Age)") """
+        session = session or self.session
+        assert session, "Session must be set"
+        session = route(session, self)
+
+        prolog = self.plan(session).prolog
+        goal = f"aggregate_all({template}, ({prolog}), {AGGREGATE_VAR})."
+        with closing(session.query(goal)) as answers:
+            values = [
+                data[AGGREGATE_VAR.lower()]
+                for data in answers
+                if isinstance(data, dict)
+            ]
+        if len(values) > 1:
+            return combine(template.split("(", 1)[0], values)
+        return values[0] if values else None
+
+    def count(self, session: Optional[Session] = None) -> int:
+        return self.aggregate_all("count", session)
+
+    def sum(self, field: str, session: Optional[Session] = None) -> Any:
+        return self.aggregate_all(f"sum({self.variable(field)})", session)
+
+    def min(self, field: str, session: Optional[Session] = None) -> Any:
+        return self.aggregate_all(f"min({self.variable(field)})", session)
+
+    def max(self, field: str, session: Optional[Session] = None) -> Any:
+        return self.aggregate_all(f"max({self.variable(field)})", session)
+
+    def exists(self, session: Optional[Session] = None) -> bool:
+        """ Checks the query has a solution, the search stops at the first one """
+        return self.first(session).aggregate_all("count", session) > 0
+
+    def group_by(self, *fields: str) -> "GroupBy":
+        """ Groups solutions by fields for aggregate
+        Usage: Person.filter().group_by("age").aggregate(n="count") """
+        return GroupBy(self, fields)
+
+    async def afetch(
+        self,
+        session: Optional["AsyncProlog"] = None,
+        only_prove: bool = False,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Union[T, bool]]:
+        """ Lazily fetches solutions from an asyncio session, see fetch """
+        session = session or self.session
+        assert session, "Session must be set"
+        session = route(session, self)
+        expression = self.plan(session).expression
+
+        answers = session.query(expression, timeout)
+        try:
+            async for data in answers:
+                if isinstance(data, bool):
+                    if not only_prove:
+                        raise QueryError(f"Query returned proof {self.prolog!r}")
+                    yield data
+                    continue
+                yield self.hydrate(data)
+        finally:
+            await answers.aclose()
+
+    async def afetchall(
+        self, session: Optional["AsyncProlog"] = None, timeout: Optional[float] = None
+    ) -> Tuple[T, ...]:
+        return tuple([data async for data in self.afetch(session, timeout=timeout)])
+
+    async def afetchone(
+        self, session: Optional["AsyncProlog"] = None, timeout: Optional[float] = None
+    ) -> T:
+        fetch = self.first(session).afetch(session, timeout=timeout)
+        try:
+            async for data in fetch:
+                return data
+        finally:
+            await fetch.aclose()
+
+    async def aprove(
+        self, session: Optional["AsyncProlog"] = None, timeout: Optional[float] = None
+    ) -> bool:
+        fetch = self.first(session).afetch(session, True, timeout)
+        try:
+            async for data in fetch:
+                return data
+        finally:
+            await fetch.aclose()
 
     @property
     def expression(self) -> str:
         return str(self.prolog) + "."
+
+
+class GroupBy:
+    """ Solutions of a query set grouped by fields, aggregated with aggregate/3 """
+
+    def __init__(self, query_set: QuerySet, fields: Sequence[str]):
+        assert fields, "Fields to group by must be set"
+        self.query_set = query_set
+        self.fields = tuple(fields)
+
+    def aggregate(
+        self, session: Optional[Session] = None, **aggregates: Union[str, tuple]
+    ) -> List[Dict[str, Any]]:
+        """ Aggregates every group inside the engine, one row per group
+        aggregates are "count" or (function, field) with function of sum, min,
+        max, bag and set
+        Usage: group.aggregate(n="count", oldest=("max", "age")) """
+        query_set = self.query_set
+        session = session or query_set.session
+        assert session, "Session must be set"
+        assert aggregates, "Aggregates must be set"
+        session = route(session, query_set)
+
+        pre_set = query_set.pre_set
+        groups = [query_set.variable(f) for f in self.fields if f not in pre_set]
+        functions, names = [], []
+        for spec in aggregates.values():
+            function, *field = (spec,) if isinstance(spec, str) else spec
+            if function not in AGGREGATES or (function == "count") != (not field):
+                raise QueryError(f"Unknown aggregate {spec!r}")
+            names.append(function)
+            functions.append(
+                f"{function}({query_set.variable(field[0])})" if field else function
+            )
+
+        # variables not grouped by are quantified so bagof/3 does not group by them
+        free = [
+            v for v in Swipl.query_variables(query_set.prolog) if v not in groups
+        ]
+        results = [f"{AGGREGATE_VAR}{i}" for i in range(len(functions))]
+        goal = (
+            f"aggregate(r({', '.join(functions)}), "
+            f"[{', '.join(free)}]^({query_set.prolog}), r({', '.join(results)}))."
+        )
+        constants = {f: pre_set[f] for f in self.fields if f in pre_set}
+
+        # shards answer a group each, their rows are combined by the group
+        grouped: Dict[str, Dict[str, Any]] = {}
+        with closing(session.query(goal)) as answers:
+            for data in answers:
+                if not isinstance(data, dict):
+                    continue
+                row = {f: data.get(f.lower(), constants.get(f)) for f in self.fields}
+                key = repr([row[f] for f in self.fields])
+                group = grouped.get(key)
+                for alias, name, result in zip(aggregates, names, results):
+                    value = data[result.lower()]
+                    row[alias] = (
+                        value if group is None else combine(name, [group[alias], value])
+                    )
+                grouped[key] = row
+        return list(grouped.values())
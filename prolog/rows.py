@@ -0,0 +1,99 @@
+import typing
+
+from collections import namedtuple
+from prolog.columns import field_types
+from prolog.swipl.swipl import decode
+
+ROWS = ("object", "tuple", "namedtuple", "slots")
+ROW_CLASSES: typing.Dict[typing.Tuple[str, str, typing.Tuple[str, ...]], type] = {}
+
+
+class LazyField:
+    """ Field of a slots row, its value is decoded on the first access """
+
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __get__(self, row: typing.Optional["SlotsRow"], owner: type) -> typing.Any:
+        if row is None:
+            return self
+        value = row._values[self.index]
+        decoded = decode(value)
+        if decoded is not value:
+            row._values[self.index] = decoded
+        return decoded
+
+    def __set__(self, row: "SlotsRow", value: typing.Any) -> None:
+        row._values[self.index] = value
+
+
+class SlotsRow:
+    """ Base of the row classes made for every model, a row keeps one list of
+    values which are decoded when read """
+
+    __slots__ = ("_values",)
+    _fields: typing.Tuple[str, ...] = ()
+
+    def __init__(self, values: list):
+        self._values = values
+
+    def __iter__(self) -> typing.Iterator:
+        return (getattr(self, name) for name in self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __eq__(self, other: typing.Any) -> bool:
+        return type(self) is type(other) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{n}={getattr(self, n)!r}" for n in self._fields)
+        return f"{type(self).__name__}({values})"
+
+    def _asdict(self) -> typing.Dict[str, typing.Any]:
+        return dict(zip(self._fields, self))
+
+
+def row_class(kind: str, name: str, fields: typing.Tuple[str, ...]) -> type:
+    """ Namedtuple or slots row class, made once per model """
+    key = (kind, name, fields)
+    cls = ROW_CLASSES.get(key)
+    if cls is None:
+        if kind == "namedtuple":
+            cls = namedtuple(name, fields)
+        else:
+            namespace = {field: LazyField(i) for i, field in enumerate(fields)}
+            namespace.update(__slots__=(), _fields=fields)
+            cls = type(name, (SlotsRow,), namespace)
+        ROW_CLASSES[key] = cls
+    return cls
+
+
+def row_maker(
+    kind: str, dataclass: type, pre_set: typing.Dict[str, typing.Any], data: dict
+) -> typing.Callable[[dict], typing.Any]:
+    """ Makes rows of answers, fields are ordered as fields of the dataclass
+    or as variables of the first answer followed by pre_set fields for dicts """
+    fields = tuple(field_types(dataclass)) or (
+        *data,
+        *(k for k in pre_set if k not in data),
+    )
+    name = f"{dataclass.__name__.capitalize()}Row"
+    template = [pre_set.get(f) for f in fields]
+    fetched = [(i, f) for i, f in enumerate(fields) if f not in pre_set]
+
+    def values(answer: dict) -> list:
+        row = template.copy()
+        for i, key in fetched:
+            row[i] = answer.get(key)
+        return row
+
+    if kind == "tuple":
+        return lambda answer: tuple(values(answer))
+    elif kind == "namedtuple":
+        make = row_class(kind, name, fields)._make
+        return lambda answer: make(values(answer))
+    cls = row_class(kind, name, fields)
+    return lambda answer: cls(values(answer))
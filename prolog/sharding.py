@@ -0,0 +1,378 @@
+import queue
+import re
+import threading
+import typing
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
+from functools import partial
+from inspect import isclass
+from prolog.encoder import encode, fact_encoder
+from prolog.ingest import Source, Progress, rows
+from prolog.orm import Predicate
+from prolog.orm.partial_fields import PartialField
+from prolog.prolog import Prolog
+from prolog.query import QueryError, QuerySet, unbatch
+from prolog.swipl import Swipl, Observer
+from prolog.swipl.exception import SWIQueryError
+from prolog.swipl.swipl import BULK_CHUNK_SIZE, QueryResponse
+from prolog.swipl.syntax import QUOTED
+from prolog.term import Atom
+
+DONE = object()
+# goals whose solutions depend on the solutions of the other shards
+MODIFIERS = re.compile(r"(?<![\w'])(limit|offset|order_by|distinct)\(")
+
+
+def shard_key(model: type) -> typing.Optional[str]:
+    """ Field set with Meta.shard_key of the model """
+    return getattr(getattr(model, "Meta", None), "shard_key", None)
+
+
+class Shard(Prolog):
+    """ Engine of a shard, used by one thread at a time. The lock is held while
+    the answers of a query are read, other threads wait for them to be closed
+    and a query of the same thread raises """
+
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.RLock()
+        # thread reading the answers of a query
+        self.reader: typing.Optional[int] = None
+        super().__init__(*args, **kwargs)
+
+    def check(self) -> None:
+        """ Raises: SWIQueryError if the thread is reading answers of the shard """
+        if self.reader == threading.get_ident():
+            raise SWIQueryError(
+                "The shard is reading the answers of another query of this thread, "
+                "they have to be read or closed first"
+            )
+
+    def locked(self, answers: typing.Iterator) -> typing.Iterator:
+        """ Holds the lock of the shard until the answers are read or closed """
+        with self.lock:
+            self.check()
+            self.reader = threading.get_ident()
+            try:
+                with closing(answers):
+                    yield from answers
+            finally:
+                self.reader = None
+
+    def query(
+        self, query: str, lazy: bool = False, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        return self.locked(super().query(query, lazy, timeout))
+
+    def query_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        return self.locked(super().query_batches(query, batch_size, timeout))
+
+    def execute_many(self, *args, **kwargs) -> typing.List[list]:
+        with self.lock:
+            self.check()
+            return super().execute_many(*args, **kwargs)
+
+    def call(self, goal: str, timeout: float = 5) -> bool:
+        with self.lock:
+            self.check()
+            return super().call(goal, timeout)
+
+    def load(self, path: str, timeout: float = 3) -> None:
+        with self.lock:
+            self.check()
+            super().load(path, timeout)
+
+    def load_lines(self, lines: typing.List[str]):
+        with self.lock:
+            self.check()
+            super().load_lines(lines)
+
+    def load_chunk(self, lines: typing.List[str], timeout: float = 30) -> int:
+        with self.lock:
+            self.check()
+            return super().load_chunk(lines, timeout)
+
+
+class ShardedProlog:
+    """ Knowledge base spread over several engine processes
+    Facts of models with Meta.shard_key are partitioned by a hash of the key,
+    everything else (facts of other models, rules) is replicated to every shard.
+    Queries of a model with the key set go to its shard, queries of models
+    without a key to the first shard, the others run on every shard in
+    parallel and their answers are merged as they come, proofs are true if any
+    shard proves them. Other queries (rshift) run on every shard if they read
+    sharded facts or rules using them, else on the first shard. Aggregations
+    are combined on the python side. A rule only sees the facts of its own
+    shard. Query sets running on every shard can't use limit, offset,
+    order_by and distinct, they would apply to the solutions of every shard """
+
+    shard_class: typing.Type[Shard] = Shard
+
+    def __init__(
+        self,
+        path_to_swipl: str,
+        shards: int = 4,
+        args: typing.Optional[typing.List[str]] = None,
+        protocol: str = "toplevel",
+        observer: typing.Optional[Observer] = None,
+        timeout: typing.Optional[float] = None,
+        translation_cache: typing.Optional[str] = None,
+    ):
+        """
+        :param shards: number of engine processes
+        :param observer: receives timing events of every shard, it has to be
+        thread-safe (the built-in observers are)
+        :param timeout: default deadline of queries of every shard
+        :param translation_cache: directory of translated definitions shared by
+        the shards, see Prolog
+        """
+        assert shards > 0, "There has to be a shard"
+        self.observer = observer
+        self.shards = [
+            self.shard_class(
+                path_to_swipl,
+                args,
+                protocol=protocol,
+                observer=observer,
+                timeout=timeout,
+                translation_cache=translation_cache,
+            )
+            for _ in range(shards)
+        ]
+        self.executor = ThreadPoolExecutor(shards)
+        self.declared: typing.List[typing.Type[Predicate]] = []
+        # predicates whose solutions are spread over the shards
+        self.scattered: typing.Set[str] = set()
+
+    def shard_index(self, value: typing.Any) -> int:
+        """ Index of the shard holding the facts with the key value """
+        return zlib.crc32(encode(value).encode()) % len(self.shards)
+
+    def declare(self, model: typing.Type[Predicate]) -> None:
+        """ Declares the model on every shard, a sharded model is dynamic so the
+        shards without its facts answer no solutions instead of an error """
+        if model in self.declared:
+            return
+        self.declared.append(model)
+        if shard_key(model) is not None:
+            self.scattered.add(model.template().name)
+        for shard in self.shards:
+            shard.declare(model)
+            if shard_key(model) is not None:
+                shard << f":- dynamic({model.template().indicator})."
+
+    def depends(self, text: str) -> bool:
+        """ Whether the goals read sharded facts or rules using them """
+        text = QUOTED.sub('""', text)
+        return any(
+            re.search(r"(?<![\w'])" + re.escape(encode(Atom(name))) + r"\(", text)
+            for name in self.scattered
+        )
+
+    def follow(self, clauses: typing.Iterable[str]) -> None:
+        """ Marks heads of the rules reading sharded facts as sharded """
+        for clause in clauses:
+            head, neck, body = str(clause).partition(":-")
+            if neck and head.strip() and self.depends(body):
+                self.scattered.add(head.split("(", 1)[0].strip().strip("'"))
+
+    def __lshift__(self, pred: typing.Any):
+        """ Adds the fact to its shard, other predicates to every shard """
+        if not isinstance(pred, Predicate):
+            self.follow([pred])
+            for shard in self.shards:
+                shard << pred
+            return
+
+        self.declare(type(pred))
+        key = shard_key(type(pred))
+        if key is not None:
+            self.shards[self.shard_index(getattr(pred, key))] << pred
+            return
+        for shard in self.shards:
+            shard << pred
+
+    def __rshift__(self, query: str) -> QuerySet[dict]:
+        return QuerySet(str(query), session=self)
+
+    def predicate(self, func=None, **kwargs):
+        """ Translates the predicate on every shard, see Prolog.predicate """
+        if func is None and kwargs.get("source") is None:
+            return partial(self.predicate, **kwargs)
+        start = len(self.shards[0].predicates)
+        for shard in self.shards:
+            result = shard.predicate(func, **kwargs)
+        self.follow(self.shards[0].predicates[start:])
+        return result
+
+    def check(self) -> None:
+        """ Raises: SWIQueryError if the thread is reading answers of a shard,
+        the workers would wait for the shard forever """
+        for shard in self.shards:
+            shard.check()
+
+    def map(self, call: typing.Callable[[Prolog], typing.Any]) -> list:
+        """ Calls every shard in parallel """
+        self.check()
+        return list(self.executor.map(call, self.shards))
+
+    def load_predicates(self, chunk_size: typing.Optional[int] = None) -> None:
+        self.map(lambda shard: shard.load_predicates(chunk_size))
+
+    def ingest(
+        self,
+        model: type,
+        source: Source,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        progress: typing.Optional[Progress] = None,
+        format: typing.Optional[str] = None,
+    ) -> int:
+        """ Streams facts of the model to their shards, see Prolog.ingest
+        Facts of a model without a shard key are loaded to every shard """
+        if issubclass(model, Predicate):
+            self.declare(model)
+        self.load_predicates()
+
+        encoder = fact_encoder(model)
+        key = shard_key(model)
+        index = encoder.fields.index(key) if key is not None else None
+        everywhere = range(len(self.shards))
+        chunks: typing.List[typing.List[str]] = [[] for _ in self.shards]
+        loaded = 0
+
+        for values in rows(model, source, format):
+            clause = encoder.clause(values)
+            if index is not None:
+                targets: typing.Iterable[int] = (self.shard_index(values[index]),)
+            else:
+                targets = everywhere
+            for i in targets:
+                chunks[i].append(clause)
+                if len(chunks[i]) >= chunk_size:
+                    self.shards[i].load_chunk(chunks[i])
+                    chunks[i] = []
+            loaded += 1
+            if progress is not None and not loaded % chunk_size:
+                progress(loaded)
+
+        # the last chunks are loaded in parallel
+        rest = [(shard, chunk) for shard, chunk in zip(self.shards, chunks) if chunk]
+        list(self.executor.map(lambda item: item[0].load_chunk(item[1]), rest))
+        if progress is not None and loaded % chunk_size:
+            progress(loaded)
+
+        if issubclass(model, Predicate):
+            for goal in model.index_goals():
+                self.map(lambda shard: shard.call(goal))
+        return loaded
+
+    def route(self, query_set: QuerySet) -> typing.Union[Prolog, "ShardedProlog"]:
+        """ Shard answering the query set, self scatters it to every shard
+        Raises: QueryError of limit, offset, order_by or distinct of query sets
+        scattered to every shard """
+        session = self.target(query_set)
+        if session is self and MODIFIERS.search(QUOTED.sub('""', query_set.prolog)):
+            raise QueryError(
+                "limit, offset, order_by and distinct would apply to every shard, "
+                f"apply them to the merged solutions of {query_set.prolog!r}"
+            )
+        return session
+
+    def target(self, query_set: QuerySet) -> typing.Union[Prolog, "ShardedProlog"]:
+        model = query_set.dataclass
+        if not isclass(model) or not issubclass(model, Predicate):
+            # replicated facts are answered by one shard
+            return self if self.depends(query_set.prolog) else self.shards[0]
+        key = shard_key(model)
+        if key is None:
+            return self.shards[0]
+        value = query_set.pre_set.get(key)
+        if key not in query_set.pre_set or isinstance(value, PartialField):
+            return self
+        return self.shards[self.shard_index(value)]
+
+    def scatter(
+        self, call: typing.Callable[[Prolog], typing.Iterator]
+    ) -> typing.Iterator:
+        """ Runs the call on every shard in parallel, answers are yielded in the
+        order they arrive. Closing the generator stops every shard
+        Raises: SWIQueryError if the thread is reading answers of a shard """
+        self.check()
+        answers: queue.Queue = queue.Queue()
+        stop = threading.Event()
+
+        def produce(shard: Prolog) -> None:
+            try:
+                with closing(call(shard)) as shard_answers:
+                    for answer in shard_answers:
+                        if stop.is_set():
+                            return
+                        answers.put((None, answer))
+            except BaseException as e:
+                answers.put((e, None))
+            finally:
+                answers.put(DONE)
+
+        futures = [self.executor.submit(produce, shard) for shard in self.shards]
+        running = len(futures)
+        try:
+            while running:
+                item = answers.get()
+                if item is DONE:
+                    running -= 1
+                    continue
+                error, answer = item
+                if error is not None:
+                    raise error
+                yield answer
+        finally:
+            stop.set()
+            # the shards are free for the next query only when every one stopped
+            wait(futures)
+
+    def query(
+        self, query: str, lazy: bool = False, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        answers = self.scatter(lambda shard: shard.query(query, lazy, timeout))
+        if Swipl.query_variables(query):
+            return answers
+        return self.proof(answers)
+
+    def query_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        batches = self.scatter(
+            lambda shard: shard.query_batches(query, batch_size, timeout)
+        )
+        if Swipl.query_variables(query):
+            return batches
+        return self.proof_batches(unbatch(batches))
+
+    @staticmethod
+    def proof(answers: typing.Iterator[QueryResponse]) -> typing.Iterator[bool]:
+        """ One proof of every shard's proofs, the others stop at the first true """
+        with closing(answers):
+            yield any(answer is True for answer in answers)
+
+    def proof_batches(
+        self, answers: typing.Iterator[QueryResponse]
+    ) -> typing.Iterator[typing.List[bool]]:
+        for proof in self.proof(answers):
+            yield [proof]
+
+    def retract(self, clause: typing.Any) -> bool:
+        """ Retracts the fact from its shard, other clauses from every shard """
+        key = shard_key(type(clause)) if isinstance(clause, Predicate) else None
+        if key is not None:
+            return self.shards[self.shard_index(getattr(clause, key))].retract(clause)
+        return all(self.map(lambda shard: shard.retract(clause)))
+
+    def retractall(self, head: typing.Any) -> None:
+        self.map(lambda shard: shard.retractall(head))
+
+    def halt(self) -> None:
+        self.map(lambda shard: shard.halt())
+        self.executor.shutdown()
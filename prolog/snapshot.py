@@ -0,0 +1,27 @@
+import hashlib
+import os
+import typing
+
+KEY_SUFFIX = ".key"
+
+
+def snapshot_key(predicates: typing.Iterable[str]) -> str:
+    """ Hash of the predicates a snapshot is made of """
+    digest = hashlib.sha256()
+    for predicate in predicates:
+        digest.update(predicate.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def read_key(state: str) -> typing.Optional[str]:
+    """ Key of the saved state or None if there is no complete snapshot """
+    if not os.path.exists(state) or not os.path.exists(state + KEY_SUFFIX):
+        return None
+    with open(state + KEY_SUFFIX) as file:
+        return file.read().strip()
+
+
+def write_key(state: str, key: str) -> None:
+    with open(state + KEY_SUFFIX, "w") as file:
+        file.write(key)
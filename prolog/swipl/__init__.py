@@ -1 +1,6 @@
 from .swipl import Swipl
+from .libswipl import LibSwipl
+from .async_swipl import AsyncSwipl
+from .cache import QueryCache
+from .pool import SwiplPool
+from .observer import Observer, Observers, Metrics, SlowQueryLog
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import shlex
+import tempfile
+import typing
+
+from .driver import DRIVER, END, ERROR, quote_atom
+from .swipl import json, QueryResponse, DRAIN_TIMEOUT
+from .syntax import TIME_LIMIT
+from prolog.swipl.exception import (
+    SwiplError,
+    SWIExecutableNotFound,
+    SWICompileError,
+    SWIQueryError,
+    SWIQueryTimeout,
+)
+
+LINE_LIMIT = 2 ** 26
+
+
+class AsyncSwipl:
+    """ Asyncio interface to SWI Prolog working through stdin/stdout pipes
+    The engine runs the json protocol driver instead of the interactive toplevel """
+
+    def __init__(
+        self,
+        path_to_swipl: str = "/path/to/swipl",
+        args: typing.Optional[typing.List[str]] = None,
+        timeout: typing.Optional[float] = None,
+    ):
+        """ Constructor method, the process is started with await instance.spawn()
+        path - path to SWI executable
+        args - command line arguments (default: '-q')
+        timeout - max time to wait for a line of the answer, the process is
+        killed after it """
+        if args is None:
+            args = ["-q"]
+
+        self.path_to_swipl = path_to_swipl
+        self.args = args
+        self.timeout = timeout
+        self.process: typing.Optional[asyncio.subprocess.Process] = None
+        self.lock: typing.Optional[asyncio.Lock] = None
+        self.pending = False
+
+    async def spawn(self) -> None:
+        """ Starts SWI Prolog serving the driver
+        Raises: SWIExecutableNotFound """
+        fd, path = tempfile.mkstemp(suffix=".pl")
+        with os.fdopen(fd, "w") as file:
+            file.write(DRIVER)
+
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *shlex.split(self.path_to_swipl),
+                *self.args,
+                "-g",
+                "swi_py_serve",
+                "-t",
+                "halt",
+                path,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                limit=LINE_LIMIT,
+            )
+            self.pending = False
+            if self.lock is None:
+                self.lock = asyncio.Lock()
+            # the driver is consulted once the first answer arrives
+            await self.call("true")
+        except OSError:
+            raise SWIExecutableNotFound(
+                "SWI-Prolog executable not found on the specified path. "
+                "Try installing swi-prolog or using "
+                f'AsyncSwipl( "{self.path_to_swipl}" )'
+            )
+        finally:
+            os.unlink(path)
+
+    async def __aenter__(self):
+        await self.spawn()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.halt()
+
+    async def send(
+        self, goals: typing.Iterable[str], timeout: typing.Optional[float] = None
+    ) -> None:
+        """ Writes queries for the driver to stdin
+        :param timeout: deadline of every goal, enforced with call_with_time_limit
+        Raises: SwiplError if the process is not running """
+        if self.process is None or self.process.returncode is not None:
+            raise SwiplError("SWI-Prolog process is not running, spawn it again")
+        limit = "" if timeout is None else f", {repr(float(timeout))}"
+        self.process.stdin.write(
+            "".join(f"swi_py_query({quote_atom(g)}{limit}).\n" for g in goals).encode()
+        )
+        await self.process.stdin.drain()
+
+    async def readline(self) -> str:
+        """ Reads a line of the answer, the process not answering in timeout
+        seconds is killed
+        Raises: SWIQueryTimeout, SwiplError """
+        try:
+            line = await asyncio.wait_for(
+                self.process.stdout.readline(), self.timeout
+            )
+        except asyncio.TimeoutError:
+            await self.kill()
+            raise SWIQueryTimeout(
+                f"No answer from SWI-Prolog in {self.timeout}s, SWI-Prolog was killed"
+            )
+        if not line:
+            raise SwiplError("SWI-Prolog process exited")
+        return line.decode().strip()
+
+    async def read_answer(
+        self,
+    ) -> typing.AsyncIterator[typing.Union[QueryResponse, str]]:
+        """ Reads an answer up to the END marker, errors are yielded as strings """
+        self.pending = True
+        while self.pending:
+            line = await self.readline()
+            if line == END:
+                self.pending = False
+            elif line.startswith(ERROR):
+                yield line[len(ERROR) :]
+            elif line.startswith("ERROR"):
+                yield line
+            elif line.startswith("{"):
+                yield {k.lower(): v for k, v in json.loads(line).items()}
+            elif line in ("true", "false"):
+                yield line == "true"
+
+    async def drain(self, timeout: typing.Optional[float] = None) -> None:
+        """ Skips the rest of the pending answer, the process still answering
+        after timeout seconds is killed (the goal may have endless solutions)
+        Raises: SWIQueryTimeout """
+        try:
+            await asyncio.wait_for(self.skip_answer(), timeout)
+        except asyncio.TimeoutError:
+            await self.kill()
+            raise SWIQueryTimeout(
+                f"The answer was not over in {timeout}s, SWI-Prolog was killed"
+            )
+
+    async def skip_answer(self) -> None:
+        while self.pending:
+            if await self.readline() == END:
+                self.pending = False
+
+    async def kill(self) -> None:
+        """ Kills the process, the loaded clauses are lost and the engine has to
+        be spawned again """
+        self.pending = False
+        if self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+
+    async def call(self, goal: str) -> bool:
+        """ Proves the goal once, bindings of its variables are not reported
+        Raises: SWIQueryError """
+        rows = [r async for r in self.query(f"\\+ \\+ ({goal})")]
+        return bool(rows) and rows[0] is not False
+
+    async def retract(self, clause: str) -> bool:
+        """ Retracts the first clause unifying with the given one """
+        return await self.call(f"retract(({clause}))")
+
+    async def retractall(self, head: str) -> None:
+        """ Retracts all facts and clauses whose head unifies with the given one """
+        await self.call(f"retractall({head})")
+
+    async def load(self, path: str) -> None:
+        """ Loads module into the engine
+        Raises: SWICompileError """
+        try:
+            await self.call(f"load_files({quote_atom(path)}, [])")
+        except SWIQueryError as e:
+            raise SWICompileError(
+                f'Error while compiling module "{path}". Error from SWI:\n{e}'
+            )
+
+    async def load_lines(
+        self, lines: typing.Iterable[str], chunk_size: int = 1000
+    ) -> None:
+        """ Asserts lines, a chunk of lines is written at once and acknowledged together
+        Lines starting with ':-' are directives which are called instead
+        Raises: SWICompileError """
+        chunk = []
+        async with self.lock:
+            for line in lines:
+                chunk.append(line[:-1] if line.endswith(".") else line)
+                if len(chunk) >= chunk_size:
+                    await self.load_chunk(chunk)
+                    chunk = []
+            if chunk:
+                await self.load_chunk(chunk)
+
+    async def load_chunk(self, lines: typing.List[str]) -> None:
+        await self.send(
+            line[2:] if line.startswith(":-") else f"assertz(({line}))"
+            for line in lines
+        )
+        errors = []
+        for line in lines:
+            async for answer in self.read_answer():
+                if isinstance(answer, str):
+                    errors.append(f'"{line}": {answer}')
+                elif answer is False:
+                    errors.append(f'"{line}": failed')
+        if errors:
+            raise SWICompileError(
+                "Error while compiling lines. Error from SWI:\n" + "\n".join(errors)
+            )
+
+    async def query(
+        self, query: str, timeout: typing.Optional[float] = None
+    ) -> typing.AsyncIterator[QueryResponse]:
+        """ Queries current engine state
+        The engine is locked until the answer is read or the generator is closed,
+        a generator left unread has to be closed (await answers.aclose()). The
+        rest of its answer is skipped for DRAIN_TIMEOUT seconds, then the process
+        is killed
+        :param timeout: deadline in seconds, the goal is stopped inside the
+        engine and SWIQueryTimeout is raised
+        Raises: SWIQueryError, SWIQueryTimeout """
+        query = query.strip()
+
+        if query.endswith("."):
+            query = query[:-1]
+
+        async with self.lock:
+            await self.send([query], timeout)
+            error = None
+            try:
+                async for answer in self.read_answer():
+                    if isinstance(answer, str):
+                        error = answer
+                    else:
+                        yield answer
+            finally:
+                await self.drain(DRAIN_TIMEOUT)
+
+        if error is not None:
+            raise (SWIQueryTimeout if TIME_LIMIT.search(error) else SWIQueryError)(
+                f'Error while executing query "{query}". Error from SWI:\n{error}'
+            )
+
+    async def halt(self) -> None:
+        if self.process.returncode is None:
+            self.process.stdin.write(b"halt.\n")
+            await self.process.stdin.drain()
+            await self.process.wait()
@@ -0,0 +1,90 @@
+import re
+import threading
+import time
+import typing
+
+from collections import OrderedDict
+from .syntax import QUOTED
+
+SPACES = re.compile(r"\s+")
+PUNCTUATION_SPACES = re.compile(r"\s*([(),\[\]|])\s*")
+# goals changing the knowledge base are never cached
+MUTATING = re.compile(r"\b(?:assert[az]?|retract(?:all)?|abolish|consult)\(")
+
+
+def normalize_query(query: str) -> str:
+    """ Collapses insignificant whitespace outside of quoted text """
+    query = query.strip()
+    if query.endswith("."):
+        query = query[:-1]
+
+    parts = []
+    last = 0
+    for match in QUOTED.finditer(query):
+        parts.append(_normalize(query[last : match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(_normalize(query[last:]))
+    return "".join(parts).strip() + "."
+
+
+def _normalize(text: str) -> str:
+    return PUNCTUATION_SPACES.sub(r"\1", SPACES.sub(" ", text))
+
+
+class QueryCache:
+    """ LRU cache of query answers with optional time to live
+    Answers are dropped every time the knowledge base of the session changes """
+
+    def __init__(self, maxsize: int = 1024, ttl: typing.Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, typing.Tuple[float, list]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def cacheable(query: str) -> bool:
+        return not MUTATING.search(query)
+
+    def get(self, key: str) -> typing.Optional[list]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (
+                self.ttl is None or time.monotonic() - entry[0] < self.ttl
+            ):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, answers: list) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic(), answers)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
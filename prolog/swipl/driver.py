@@ -0,0 +1,92 @@
+END = "%swi-py-end"
+ERROR = "%swi-py-error "
+
+# Prints every solution of the goal as one line of JSON and terminates
+# the answer with the END marker. Queries without named variables are
+# proved with once/1 and print true/false instead of the solutions.
+# swi_py_query/2 stops the goal with time_limit_exceeded after Time seconds.
+# swi_py_serve/0 runs the goals read from stdin for pipe based engines
+DRIVER = r"""
+:- use_module(library(http/json)).
+
+swi_py_query(Text) :-
+    catch(swi_py_run(Text), E, swi_py_error(E)),
+    format("~w~n", ['%swi-py-end']),
+    flush_output.
+
+swi_py_query(Text, Time) :-
+    catch(call_with_time_limit(Time, swi_py_run(Text)), E, swi_py_error(E)),
+    format("~w~n", ['%swi-py-end']),
+    flush_output.
+
+swi_py_run(Text) :-
+    term_string(Goal, Text, [variable_names(Names)]),
+    exclude(swi_py_anonymous, Names, Bindings),
+    (   Bindings == []
+    ->  ( once(Goal) -> writeln(true) ; writeln(false) )
+    ;   forall(Goal, swi_py_solution(Bindings))
+    ).
+
+swi_py_anonymous(Name=_) :-
+    sub_atom(Name, 0, _, _, '_').
+
+swi_py_solution(Bindings) :-
+    maplist(swi_py_pair, Bindings, Pairs),
+    dict_pairs(Dict, json, Pairs),
+    json_write_dict(current_output, Dict, [width(0)]),
+    nl.
+
+swi_py_pair(Name=Value, Name-Json) :-
+    swi_py_json(Value, Json).
+
+swi_py_json(V, null) :- var(V), !.
+swi_py_json(V, V) :- number(V), !.
+swi_py_json(V, V) :- string(V), !.
+swi_py_json(V, J) :- is_list(V), !, maplist(swi_py_json, V, J).
+swi_py_json(V, S) :- atom(V), !, atom_string(V, S).
+swi_py_json(V, S) :- format(string(S), "~q", [V]).
+
+swi_py_error(E) :-
+    format("~w~q~n", ['%swi-py-error ', E]).
+
+% Serves goals read from standard input when there is no interactive toplevel
+swi_py_serve :-
+    repeat,
+    read_term(user_input, Goal, []),
+    (   Goal == end_of_file
+    ->  !
+    ;   ignore(catch(Goal, E, swi_py_error(E))),
+        fail
+    ).
+"""
+
+# Loads files for the in-process engine collecting the printed errors,
+# which the toplevel would show as ERROR lines
+LIB_DRIVER = r"""
+:- thread_local swi_py_loading/0, swi_py_message/1.
+
+:- multifile user:message_hook/3.
+user:message_hook(_, error, Lines) :-
+    swi_py_loading,
+    with_output_to(
+        string(S),
+        print_message_lines(current_output, kind(error), Lines)
+    ),
+    assertz(swi_py_message(S)),
+    fail.
+
+swi_py_load(Path, Errors) :-
+    retractall(swi_py_message(_)),
+    setup_call_cleanup(
+        assertz(swi_py_loading),
+        load_files(Path, []),
+        retractall(swi_py_loading)
+    ),
+    findall(E, retract(swi_py_message(E)), Errors).
+"""
+
+
+def quote_atom(text: str) -> str:
+    """ Quotes text as a prolog atom """
+    text = text.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n")
+    return f"'{text}'"
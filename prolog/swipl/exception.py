@@ -22,3 +22,9 @@ class SWIQueryError(SwiplError):
 
 class SWIQueryTimeout(SwiplError):
     pass
+
+
+class SwiplPoolTimeout(SwiplError):
+    """Exception raised if no engine of the pool was released in time."""
+
+    pass
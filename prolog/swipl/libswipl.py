@@ -0,0 +1,484 @@
+import ctypes
+import ctypes.util
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+
+from .swipl import Swipl, QueryResponse
+from .syntax import BATCH_VAR, TIME_LIMIT
+from .driver import LIB_DRIVER, quote_atom
+from prolog.swipl.exception import (
+    SWIExecutableNotFound,
+    SWICompileError,
+    SWIQueryError,
+    SWIQueryTimeout,
+)
+
+# constants of SWI-Prolog.h (SWI-Prolog 9)
+PL_VARIABLE = 1
+PL_ATOM = 2
+PL_INTEGER = 3
+PL_FLOAT = 5
+PL_STRING = 6
+PL_NIL = 8
+PL_LIST_PAIR = 10
+
+CVT_ATOM = 0x1
+CVT_STRING = 0x2
+CVT_INTEGER = 0x8
+CVT_WRITEQ = 0x200
+BUF_STACK = 0x10000
+REP_UTF8 = 0x100000
+
+PL_Q_NODEBUG = 0x4
+PL_Q_CATCH_EXCEPTION = 0x8
+QUERY_FLAGS = PL_Q_NODEBUG | PL_Q_CATCH_EXCEPTION
+
+term_t = ctypes.c_size_t
+SIGNATURES = {
+    "PL_initialise": (ctypes.c_int, [ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]),
+    "PL_thread_self": (ctypes.c_int, []),
+    "PL_thread_attach_engine": (ctypes.c_int, [ctypes.c_void_p]),
+    "PL_predicate": (
+        ctypes.c_void_p,
+        [ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p],
+    ),
+    "PL_open_foreign_frame": (term_t, []),
+    "PL_discard_foreign_frame": (None, [term_t]),
+    "PL_new_term_ref": (term_t, []),
+    "PL_new_term_refs": (term_t, [ctypes.c_size_t]),
+    "PL_copy_term_ref": (term_t, [term_t]),
+    "PL_put_chars": (
+        ctypes.c_int,
+        [term_t, ctypes.c_int, ctypes.c_size_t, ctypes.c_char_p],
+    ),
+    "PL_chars_to_term": (ctypes.c_int, [ctypes.c_char_p, term_t]),
+    "PL_call_predicate": (
+        ctypes.c_int,
+        [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, term_t],
+    ),
+    "PL_open_query": (
+        ctypes.c_void_p,
+        [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, term_t],
+    ),
+    "PL_next_solution": (ctypes.c_int, [ctypes.c_void_p]),
+    "PL_cut_query": (ctypes.c_int, [ctypes.c_void_p]),
+    "PL_exception": (term_t, [ctypes.c_void_p]),
+    "PL_clear_exception": (None, []),
+    "PL_term_type": (ctypes.c_int, [term_t]),
+    "PL_get_int64": (ctypes.c_int, [term_t, ctypes.POINTER(ctypes.c_int64)]),
+    "PL_get_float": (ctypes.c_int, [term_t, ctypes.POINTER(ctypes.c_double)]),
+    "PL_get_nchars": (
+        ctypes.c_int,
+        [
+            term_t,
+            ctypes.POINTER(ctypes.c_size_t),
+            ctypes.POINTER(ctypes.c_void_p),
+            ctypes.c_uint,
+        ],
+    ),
+    "PL_get_list": (ctypes.c_int, [term_t, term_t, term_t]),
+    "PL_get_nil": (ctypes.c_int, [term_t]),
+    "PL_get_arg": (ctypes.c_int, [ctypes.c_size_t, term_t, term_t]),
+}
+# atoms read as the values the toplevel answers decode to
+ATOMS = {"true": True, "false": False, "null": None}
+
+LIBRARY: typing.Optional[ctypes.CDLL] = None
+LOCK = threading.Lock()
+# queries opened by solutions and not closed yet, [frame, qid] per query. Every
+# thread has its own Prolog engine, its queries nest like the frames of a stack
+OPEN = threading.local()
+
+
+def find_library(path_to_swipl: str) -> typing.Optional[str]:
+    """ Path of libswipl: $LIBSWIPL, the runtime variables of the executable
+    or the library found by the linker """
+    path = os.environ.get("LIBSWIPL")
+    if path:
+        return path
+
+    try:
+        variables = subprocess.run(
+            [path_to_swipl, "--dump-runtime-variables"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        variables = ""
+
+    home = re.search(r'PLBASE="([^"]+)"', variables)
+    if home is not None:
+        os.environ.setdefault("SWI_HOME_DIR", home.group(1))
+    library = re.search(r'PLLIBSWIPL="([^"]+)"', variables)
+    if library is not None:
+        return library.group(1)
+    return ctypes.util.find_library("swipl")
+
+
+def initialise(path_to_swipl: str, args: typing.List[str]) -> ctypes.CDLL:
+    """ Loads and initialises libswipl, once per process
+    Raises: SWIExecutableNotFound """
+    global LIBRARY
+    with LOCK:
+        if LIBRARY is not None:
+            return LIBRARY
+
+        path = find_library(path_to_swipl)
+        try:
+            if path is None:
+                raise OSError(path)
+            lib = ctypes.CDLL(path, mode=ctypes.RTLD_GLOBAL)
+        except OSError:
+            raise SWIExecutableNotFound(
+                "libswipl not found. Set LIBSWIPL to the path of the library "
+                "or use the pexpect backend"
+            )
+        for name, (restype, argtypes) in SIGNATURES.items():
+            function = getattr(lib, name)
+            function.restype = restype
+            function.argtypes = argtypes
+
+        # python keeps its signal handlers, there is no terminal to drive
+        argv = [path_to_swipl, "--no-signals", "--no-tty"]
+        argv += [arg for arg in args if arg not in ("+tty", "--no-tty")]
+        encoded = (ctypes.c_char_p * (len(argv) + 1))(
+            *(arg.encode() for arg in argv), None
+        )
+        if not lib.PL_initialise(len(argv), encoded):
+            raise SWIExecutableNotFound(f"libswipl failed to initialise ({path})")
+
+        LIBRARY = lib
+        load_lib_driver(lib)
+        return lib
+
+
+def open_queries() -> typing.List[list]:
+    """ Open queries of the calling thread, innermost last """
+    if not hasattr(OPEN, "queries"):
+        OPEN.queries = []
+    return OPEN.queries
+
+
+def load_lib_driver(lib: ctypes.CDLL) -> None:
+    fd, path = tempfile.mkstemp(suffix=".pl")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(LIB_DRIVER)
+        goal = lib.PL_new_term_ref()
+        lib.PL_chars_to_term(f"load_files({quote_atom(path)}, [])".encode(), goal)
+        call = lib.PL_predicate(b"call", 1, b"user")
+        lib.PL_call_predicate(None, QUERY_FLAGS, call, goal)
+    finally:
+        os.unlink(path)
+
+
+class LibSwipl(Swipl):
+    """ In-process SWI Prolog loaded from libswipl through ctypes
+    Goals run with PL_open_query/PL_next_solution and bindings are read from
+    term refs, nothing is printed or parsed. There is one embedded engine per
+    process: every LibSwipl instance shares its database, threads get their
+    own Prolog engine attached on first use. Values are read as toplevel
+    answers decode: atoms true/false/null to True/False/None, other atoms and
+    strings to str, compound terms to their quoted text
+    Queries nest: goals can run while the answers of a query are read, but
+    the answers of the outer query can't be read before the nested query is
+    closed """
+
+    lib: ctypes.CDLL
+
+    def spawn(self) -> None:
+        """ Initialises the embedded engine (once per process) """
+        self.invalidate()
+        self.full_answers = True
+        start = time.perf_counter()
+
+        self.lib = initialise(self.path_to_swipl, self.args)
+        self.predicate_call = self.lib.PL_predicate(b"call", 1, b"user")
+        self.predicate_parse = self.lib.PL_predicate(b"term_string", 3, b"system")
+
+        if self.observer is not None:
+            self.observer.spawned(time.perf_counter() - start)
+
+    def is_alive(self) -> bool:
+        """ Whether the calling thread has no query left open """
+        return not open_queries()
+
+    def attach(self) -> None:
+        """ Creates a Prolog engine for the calling thread if it has none """
+        if self.lib.PL_thread_self() == -1:
+            if self.lib.PL_thread_attach_engine(None) < 0:
+                raise SWIQueryError("Can't attach a Prolog engine to the thread")
+
+    def load(self, path: str, timeout: float = 3) -> None:
+        """ Loads module into the engine
+        Raises: SWICompileError """
+        self.invalidate()
+        try:
+            answers = list(self.solutions(f"swi_py_load({quote_atom(path)}, Errors)"))
+        except SWIQueryError as e:
+            raise SWICompileError(f'Error while compiling module "{path}". {e}')
+        if answers and answers[0]["errors"]:
+            raise SWICompileError(
+                'Error while compiling module "'
+                + path
+                + '". Error from SWI:\n'
+                + "".join(answers[0]["errors"])
+            )
+
+    def load_lines(self, lines: typing.List[str]):
+        """ Asserts the lines, lines starting with ':-' are directives which
+        are called instead """
+        self.invalidate()
+        start = time.perf_counter()
+
+        for line in lines:
+            if line.endswith("."):
+                line = line[:-1]
+
+            if line.startswith(":-"):
+                self.load_directive(line)
+                continue
+
+            try:
+                self.call(f"assert(({line}))")
+            except SWIQueryError as e:
+                raise SWICompileError(f'Error while compiling line "{line}". {e}')
+
+        if self.observer is not None:
+            self.observer.loaded(len(lines), time.perf_counter() - start)
+
+    def load_driver(self) -> None:
+        """ Answers are read from term refs, the json driver is not needed """
+
+    def execute(
+        self,
+        query: str,
+        lazy: bool = False,
+        timeout: typing.Optional[float] = None,
+    ) -> typing.Iterator[QueryResponse]:
+        """ Queries the engine, values are decoded (lazy has no effect) """
+        timeout = self.timeout if timeout is None else timeout
+        query = query.strip()
+
+        if query.endswith("."):
+            query = query[:-1]
+
+        if timeout is None:
+            yield from self.solutions(query)
+            return
+
+        lvars = self.query_variables(query)
+        limit = repr(float(timeout))
+
+        if not lvars:
+            yield from self.solutions(f"call_with_time_limit({limit}, ({query}))")
+            return
+
+        keys = [v.lower() for v in lvars]
+        for answer in self.solutions(
+            f"call_with_time_limit({limit}, "
+            f"findall([{', '.join(lvars)}], ({query}), {BATCH_VAR}))"
+        ):
+            for row in answer[BATCH_VAR.lower()]:
+                yield dict(zip(keys, row))
+
+    def execute_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        """ Groups solutions to batches, there are no round trips to save """
+        batch = []
+        for data in self.execute(query, timeout=timeout):
+            batch.append(data)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def read_many(
+        self, goal: str, timeout: typing.Optional[float]
+    ) -> typing.Iterator[list]:
+        for answer in self.solutions(goal):
+            yield answer[BATCH_VAR.lower()]
+
+    def solutions(
+        self, query: str, once: bool = False
+    ) -> typing.Iterator[QueryResponse]:
+        """ Runs the query, queries without named variables (or once) are proved
+        once. The query stays open until its answers are read or the generator
+        is closed, queries opened meanwhile nest in it
+        Raises: SWIQueryError, SWIQueryTimeout """
+        self.attach()
+        entry = [self.lib.PL_open_foreign_frame(), None]
+        open_queries().append(entry)
+
+        try:
+            goal, names, refs = self.parse_goal(query)
+
+            if once or not names:
+                proved = self.lib.PL_call_predicate(
+                    None, QUERY_FLAGS, self.predicate_call, goal
+                )
+                if not proved:
+                    self.raise_exception(self.lib.PL_exception(None), query)
+                self.close_query(entry)
+                yield bool(proved)
+                return
+
+            qid = entry[1] = self.lib.PL_open_query(
+                None, QUERY_FLAGS, self.predicate_call, goal
+            )
+            while True:
+                self.check_open(entry, query)
+                if not self.lib.PL_next_solution(qid):
+                    break
+                yield {name: self.value(ref) for name, ref in zip(names, refs)}
+            self.raise_exception(self.lib.PL_exception(qid), query)
+        finally:
+            self.close_query(entry)
+
+    @staticmethod
+    def check_open(entry: list, query: str) -> None:
+        """ Checks the query can read its next answer
+        Raises: SWIQueryError if the query was closed or a query opened during
+        its answers is still open """
+        queries = open_queries()
+        if not any(e is entry for e in queries):
+            raise SWIQueryError(
+                f'The answers of query "{query}" were closed before they were read'
+            )
+        if queries[-1] is not entry:
+            raise SWIQueryError(
+                f'Can\'t read the next answer of query "{query}", a query opened '
+                "during its answers is still open. Close the nested query first"
+            )
+
+    def close_query(self, entry: list) -> None:
+        """ Cuts the query and drops its term refs, queries nested in it are
+        closed first """
+        queries = open_queries()
+        if not any(e is entry for e in queries):
+            return
+        while queries:
+            closed = queries.pop()
+            frame, qid = closed
+            if qid is not None:
+                self.lib.PL_cut_query(qid)
+            self.lib.PL_discard_foreign_frame(frame)
+            if closed is entry:
+                return
+
+    def close_answer(self) -> None:
+        """ Closes every open query of the calling thread """
+        queries = open_queries()
+        if queries:
+            self.close_query(queries[0])
+
+    def parse_goal(self, query: str) -> typing.Tuple[int, typing.List[str], list]:
+        """ Reads the goal with term_string/3, returns its term ref and the
+        lowercase names and term refs of its named variables """
+        refs = self.lib.PL_new_term_refs(3)
+        text = query.encode()
+        self.lib.PL_put_chars(refs + 1, PL_STRING | REP_UTF8, len(text), text)
+        self.lib.PL_chars_to_term(b"[variable_names(_)]", refs + 2)
+
+        if not self.lib.PL_call_predicate(
+            None, QUERY_FLAGS, self.predicate_parse, refs
+        ):
+            self.raise_exception(self.lib.PL_exception(None), query)
+
+        option, bindings, pair = (self.lib.PL_new_term_ref() for _ in range(3))
+        self.lib.PL_get_list(refs + 2, option, bindings)
+        self.lib.PL_get_arg(1, option, bindings)
+
+        names, variables = [], []
+        while self.lib.PL_get_list(bindings, pair, bindings):
+            name = self.lib.PL_new_term_refs(2)
+            variable = name + 1
+            self.lib.PL_get_arg(1, pair, name)
+            self.lib.PL_get_arg(2, pair, variable)
+            name = self.text(name, CVT_ATOM)
+            if not name.startswith("_"):
+                names.append(name.lower())
+                variables.append(variable)
+        return refs, names, variables
+
+    def raise_exception(self, exception: int, query: str) -> None:
+        """ Raises the exception of the goal if it has one """
+        if not exception:
+            return
+        error = self.text(exception, CVT_WRITEQ)
+        self.lib.PL_clear_exception()
+        raise (SWIQueryTimeout if TIME_LIMIT.search(error) else SWIQueryError)(
+            'Error while executing query "' + query + '". Error from SWI:\n' + error
+        )
+
+    def text(self, term: int, flags: int) -> str:
+        length = ctypes.c_size_t()
+        chars = ctypes.c_void_p()
+        flags |= BUF_STACK | REP_UTF8
+        self.lib.PL_get_nchars(term, ctypes.byref(length), ctypes.byref(chars), flags)
+        return ctypes.string_at(chars, length.value).decode()
+
+    def value(self, term: int) -> typing.Any:
+        """ Python value of the term """
+        kind = self.lib.PL_term_type(term)
+
+        if kind == PL_VARIABLE:
+            return None
+        elif kind == PL_INTEGER:
+            integer = ctypes.c_int64()
+            if self.lib.PL_get_int64(term, ctypes.byref(integer)):
+                return integer.value
+            return int(self.text(term, CVT_INTEGER))
+        elif kind == PL_FLOAT:
+            number = ctypes.c_double()
+            self.lib.PL_get_float(term, ctypes.byref(number))
+            return number.value
+        elif kind == PL_STRING:
+            return self.text(term, CVT_STRING)
+        elif kind == PL_ATOM:
+            text = self.text(term, CVT_ATOM)
+            return ATOMS.get(text, text)
+        elif kind == PL_NIL:
+            return []
+        elif kind == PL_LIST_PAIR:
+            items = []
+            head = self.lib.PL_new_term_ref()
+            tail = self.lib.PL_copy_term_ref(term)
+            while self.lib.PL_get_list(tail, head, tail):
+                items.append(self.value(head))
+            if self.lib.PL_get_nil(tail):
+                return items
+        return self.text(term, CVT_WRITEQ)
+
+    def call(self, goal: str, timeout: float = 5) -> bool:
+        """ Proves the goal once within timeout seconds, bindings of its
+        variables are not reported
+        Raises: SWIQueryError, SWIQueryTimeout """
+        goal = goal.strip()
+
+        if goal.endswith("."):
+            goal = goal[:-1]
+
+        for proved in self.solutions(
+            f"call_with_time_limit({repr(float(timeout))}, ({goal}))", once=True
+        ):
+            return proved
+        return False
+
+    def halt(self):
+        """ Closes the open answer, the embedded engine lives with the process """
+        self.close_answer()
+
+    def send_dot(self):
+        self.close_answer()
+
+    def interrupt(self) -> None:
+        self.close_answer()
@@ -0,0 +1,184 @@
+import bisect
+import logging
+import threading
+import typing
+
+from collections import deque
+
+logger = logging.getLogger("prolog.slow_query")
+
+
+class Observer:
+    """ Receives timing events of an engine, every duration is in seconds
+    Methods do nothing by default, subclasses override the events they need """
+
+    def spawned(self, seconds: float) -> None:
+        """ The engine process started and printed the prompt """
+
+    def loaded(self, lines: int, seconds: float) -> None:
+        """ A chunk of lines was loaded by load_lines or load_chunk """
+
+    def sent(self, query: str, seconds: float) -> None:
+        """ The query was written to the engine """
+
+    def first_solution(self, query: str, seconds: float) -> None:
+        """ The first answer arrived, counted from the start of the query """
+
+    def solution(self, query: str, seconds: float) -> None:
+        """ The engine produced an answer (or a batch of them) """
+
+    def parsed(self, seconds: float) -> None:
+        """ Answer text of the toplevel was parsed to python values """
+
+    def query_done(self, query: str, solutions: int, seconds: float) -> None:
+        """ The answer was exhausted or closed, seconds exclude the time
+        the consumer spent between solutions """
+
+    def hydrated(self, dataclass: type, seconds: float) -> None:
+        """ QuerySet.fetch made a result out of an answer """
+
+
+class Observers(Observer):
+    """ Passes the events to every observer """
+
+    def __init__(self, *observers: Observer):
+        self.observers = observers
+
+    def spawned(self, seconds: float) -> None:
+        for observer in self.observers:
+            observer.spawned(seconds)
+
+    def loaded(self, lines: int, seconds: float) -> None:
+        for observer in self.observers:
+            observer.loaded(lines, seconds)
+
+    def sent(self, query: str, seconds: float) -> None:
+        for observer in self.observers:
+            observer.sent(query, seconds)
+
+    def first_solution(self, query: str, seconds: float) -> None:
+        for observer in self.observers:
+            observer.first_solution(query, seconds)
+
+    def solution(self, query: str, seconds: float) -> None:
+        for observer in self.observers:
+            observer.solution(query, seconds)
+
+    def parsed(self, seconds: float) -> None:
+        for observer in self.observers:
+            observer.parsed(seconds)
+
+    def query_done(self, query: str, solutions: int, seconds: float) -> None:
+        for observer in self.observers:
+            observer.query_done(query, solutions, seconds)
+
+    def hydrated(self, dataclass: type, seconds: float) -> None:
+        for observer in self.observers:
+            observer.hydrated(dataclass, seconds)
+
+
+class Histogram:
+    """ Counts of durations falling into exponential buckets """
+
+    BOUNDS = (1e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": {
+                **{f"<={b}": n for b, n in zip(self.BOUNDS, self.buckets)},
+                f">{self.BOUNDS[-1]}": self.buckets[-1],
+            },
+        }
+
+
+class Metrics(Observer):
+    """ Counters and histograms of durations of every event """
+
+    EVENTS = (
+        "spawned",
+        "loaded",
+        "sent",
+        "first_solution",
+        "solution",
+        "parsed",
+        "query_done",
+        "hydrated",
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {event: Histogram() for event in self.EVENTS}
+        self.lines = 0
+        self.solutions = 0
+
+    def add(self, event: str, seconds: float) -> None:
+        with self.lock:
+            self.histograms[event].add(seconds)
+
+    def spawned(self, seconds: float) -> None:
+        self.add("spawned", seconds)
+
+    def loaded(self, lines: int, seconds: float) -> None:
+        with self.lock:
+            self.lines += lines
+            self.histograms["loaded"].add(seconds)
+
+    def sent(self, query: str, seconds: float) -> None:
+        self.add("sent", seconds)
+
+    def first_solution(self, query: str, seconds: float) -> None:
+        self.add("first_solution", seconds)
+
+    def solution(self, query: str, seconds: float) -> None:
+        self.add("solution", seconds)
+
+    def parsed(self, seconds: float) -> None:
+        self.add("parsed", seconds)
+
+    def query_done(self, query: str, solutions: int, seconds: float) -> None:
+        with self.lock:
+            self.solutions += solutions
+            self.histograms["query_done"].add(seconds)
+
+    def hydrated(self, dataclass: type, seconds: float) -> None:
+        self.add("hydrated", seconds)
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        with self.lock:
+            return {
+                "lines": self.lines,
+                "solutions": self.solutions,
+                **{e: h.stats() for e, h in self.histograms.items()},
+            }
+
+
+class SlowQueryLog(Observer):
+    """ Keeps the last maxsize queries which took threshold seconds or longer
+    and logs them as warnings to the prolog.slow_query logger """
+
+    def __init__(self, threshold: float = 1.0, maxsize: int = 100):
+        self.threshold = threshold
+        self.entries: "deque[typing.Tuple[str, int, float]]" = deque(maxlen=maxsize)
+
+    def query_done(self, query: str, solutions: int, seconds: float) -> None:
+        if seconds >= self.threshold:
+            self.entries.append((query, solutions, seconds))
+            logger.warning(
+                "Slow query %r: %d solutions in %.3fs", query, solutions, seconds
+            )
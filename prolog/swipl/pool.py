@@ -0,0 +1,187 @@
+import queue
+import threading
+import typing
+
+from contextlib import contextmanager
+from .swipl import Swipl, QueryResponse
+from .observer import Observer
+from prolog.swipl.exception import SwiplPoolTimeout
+
+if typing.TYPE_CHECKING:
+    from prolog.prolog import Prolog
+
+
+class SwiplPool:
+    """ Thread-safe pool of preloaded SWI Prolog engines """
+
+    engine_class: typing.Type[Swipl] = Swipl
+
+    def __init__(
+        self,
+        path_to_swipl: str,
+        size: int = 4,
+        args: typing.Optional[typing.List[str]] = None,
+        predicates: typing.Optional[typing.List[str]] = None,
+        protocol: str = "toplevel",
+        timeout: typing.Optional[float] = None,
+        chunk_size: typing.Optional[int] = None,
+        observer: typing.Optional[Observer] = None,
+        index_goals: typing.Optional[typing.List[str]] = None,
+    ):
+        """ Spawns size engines and replays predicates into each one
+        :param timeout: max time to wait for a free engine on checkout
+        :param chunk_size: replay predicates in bulk with chunks of chunk_size
+        :param observer: receives timing events of every engine, it has to be
+        thread-safe (the built-in observers are)
+        :param index_goals: goals called after loading the predicates, they
+        build the JIT indexes of the models (see Prolog.index_goals)
+        """
+        self.path_to_swipl = path_to_swipl
+        self.args = args
+        self.predicates = predicates if predicates is not None else []
+        self.index_goals = index_goals if index_goals is not None else []
+        self.protocol = protocol
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.observer = observer
+
+        self.idle: "queue.Queue[Swipl]" = queue.Queue()
+        self.engines: typing.List[Swipl] = []
+        self.lock = threading.Lock()
+
+        for _ in range(size):
+            self.idle.put(self.spawn())
+
+    @classmethod
+    def from_prolog(cls, prolog: "Prolog", size: int = 4, **kwargs) -> "SwiplPool":
+        """ Makes a pool of engines preloaded with predicates of the prolog
+        instance, indexed like it """
+        kwargs.setdefault("index_goals", prolog.index_goals())
+        return cls(
+            prolog.path_to_swipl,
+            size,
+            args=prolog.args,
+            predicates=prolog.predicates,
+            protocol=prolog.protocol,
+            **kwargs,
+        )
+
+    def spawn(self) -> Swipl:
+        """ Spawns an engine, loads predicates to it and builds their indexes
+        The engine is terminated if loading fails """
+        engine = self.engine_class(
+            self.path_to_swipl, self.args, self.protocol, observer=self.observer
+        )
+        try:
+            if self.chunk_size:
+                engine.load_bulk(self.predicates, self.chunk_size)
+            else:
+                engine.load_lines(self.predicates)
+            for goal in self.index_goals:
+                engine.call(goal)
+        except BaseException:
+            engine.engine.terminate(force=True)
+            raise
+        with self.lock:
+            self.engines.append(engine)
+        return engine
+
+    def replace(self, engine: Swipl) -> Swipl:
+        """ Kills the engine and spawns a new one instead """
+        with self.lock:
+            if engine in self.engines:
+                self.engines.remove(engine)
+        engine.engine.terminate(force=True)
+        return self.spawn()
+
+    def acquire(self, timeout: typing.Optional[float] = None) -> Swipl:
+        """ Takes a healthy engine out of the pool
+        Raises: SwiplPoolTimeout """
+        timeout = timeout if timeout is not None else self.timeout
+        try:
+            engine = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise SwiplPoolTimeout(f"No free engine in the pool after {timeout}s")
+
+        if not engine.is_alive():
+            try:
+                engine = self.replace(engine)
+            except BaseException:
+                # keep the dead engine in the pool to retry the replacement later
+                self.idle.put(engine)
+                raise
+        return engine
+
+    def release(self, engine: Swipl, broken: bool = False) -> None:
+        """ Returns the engine to the pool, broken engines are replaced """
+        if broken:
+            engine.engine.terminate(force=True)
+        self.idle.put(engine)
+
+    @contextmanager
+    def checkout(
+        self, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[Swipl]:
+        """ Checkouts an engine for the time of the block
+        Usage: with pool.checkout() as engine: ... """
+        engine = self.acquire(timeout)
+        try:
+            yield engine
+        except GeneratorExit:
+            self.release(engine)
+            raise
+        except BaseException:
+            # the engine may be left in the middle of an answer
+            self.release(engine, broken=True)
+            raise
+        else:
+            self.release(engine)
+
+    def query(
+        self, query: str, lazy: bool = False, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        """ Queries an engine which is checked out until the answer is consumed """
+        with self.checkout() as engine:
+            yield from engine.query(query, lazy, timeout)
+
+    def query_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        with self.checkout() as engine:
+            yield from engine.query_batches(query, batch_size, timeout)
+
+    def execute_many(
+        self, queries: typing.Sequence[str], timeout: typing.Optional[float] = None
+    ) -> typing.List[typing.List[QueryResponse]]:
+        """ Runs the queries in one round trip on one engine """
+        with self.checkout() as engine:
+            return engine.execute_many(queries, timeout)
+
+    def health_check(self) -> int:
+        """ Pings idle engines, dead ones are replaced
+        Returns the number of replaced engines """
+        replaced = 0
+        for _ in range(self.idle.qsize()):
+            try:
+                engine = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                healthy = engine.is_alive() and list(engine.query("true.")) == [True]
+            except BaseException:
+                healthy = False
+            try:
+                if not healthy:
+                    engine = self.replace(engine)
+                    replaced += 1
+            finally:
+                self.idle.put(engine)
+        return replaced
+
+    def halt(self) -> None:
+        """ Halts all engines of the pool """
+        with self.lock:
+            engines = list(self.engines)
+        for engine in engines:
+            if engine.engine.isalive():
+                engine.halt()
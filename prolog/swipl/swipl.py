@@ -1,9 +1,32 @@
 import pexpect as px
 import typing
 import re
+import os
+import tempfile
+import time
 import choicelib
 
-from .syntax import SWI_PROMPT, SWI_ERROR, VAR, RES, SWI_MULTIPLE, MULTI_RES
+from contextlib import closing
+
+from .syntax import (
+    SWI_PROMPT,
+    SWI_ERROR,
+    SWI_FALSE,
+    SWI_TRUE,
+    SWI_ACTION,
+    VAR,
+    RES,
+    SWI_MULTIPLE,
+    MULTI_RES,
+    QUOTED,
+    BATCH_VAR,
+    BATCH_ANSWER,
+    BATCH_RES,
+    TIME_LIMIT,
+)
+from .driver import DRIVER, END, ERROR, quote_atom
+from .cache import QueryCache, normalize_query
+from .observer import Observer
 from prolog.swipl.exception import (
     SWIExecutableNotFound,
     SWICompileError,
@@ -18,52 +41,159 @@ json = choicelib.choice_in_order(
 QueryResponse = typing.Union[dict, bool]
 
 
+class Raw(str):
+    """ Value of a toplevel answer which is decoded on demand """
+
+
+def decode(value: typing.Any) -> typing.Any:
+    return json.loads(value) if value.__class__ is Raw else value
+
+
+DEFAULT_ARGS = ["-q", "+tty"]
+BULK_CHUNK_SIZE = 10000
+PROTOCOLS = ("toplevel", "json")
+# seconds to wait for the next answer (or a proof) when no deadline is set
+ANSWER_TIMEOUT = 3
+PROOF_TIMEOUT = 5
+# seconds to wait over a deadline before the engine is interrupted
+GRACE = 1.0
+# seconds to skip the rest of an answer left unread before the goal is stopped
+DRAIN_TIMEOUT = 5
+# prefix of the variables of execute_many goals
+MANY_VAR = "SwiPyMany"
+
+
+def bound_values(lvars: typing.List[str]) -> typing.Tuple[str, str]:
+    """ Template of the values of the variables and the goal setting them,
+    unbound variables are null as in the answers of the json driver """
+    values = [f"{BATCH_VAR}V{i}" for i in range(len(lvars))]
+    goal = ", ".join(
+        f"(var({var}) -> {value} = null ; {value} = {var})"
+        for var, value in zip(lvars, values)
+    )
+    return f"[{', '.join(values)}]", goal
+
+
+def many_goal(queries: typing.List[str], lvars: typing.List[typing.List[str]]) -> str:
+    """ One goal running every query, the answer is a list of [1, Solutions]
+    (or [1, 1]/[1, 0] for proofs) and [0, Error] for queries which raised.
+    Everything but the list is left unbound, so only it is printed """
+    parts = []
+    for i, (query, variables) in enumerate(zip(queries, lvars)):
+        result, solutions = f"{MANY_VAR}R{i}", f"{MANY_VAR}L{i}"
+        error, text = f"{MANY_VAR}E{i}", f"{MANY_VAR}S{i}"
+        if variables:
+            run = (
+                f"findall([{', '.join(variables)}], ({query}), {solutions}), "
+                f"{result} = [1, {solutions}]"
+            )
+        else:
+            run = f"\\+ \\+ ({query}) -> {result} = [1, 1] ; {result} = [1, 0]"
+        parts.append(
+            f"catch(({run}), {error}, "
+            f'(format(string({text}), "~q", [{error}]), {result} = [0, {text}]))'
+        )
+    results = ", ".join(f"{MANY_VAR}R{i}" for i in range(len(queries)))
+    return f"findall([{results}], ({', '.join(parts)}), [{BATCH_VAR}])"
+
+
 class Swipl:
     """ Python interface to SWI Prolog (http://www.swi-prolog.org) """
 
     def __init__(
-        self, path_to_swipl: str = "/path/to/swipl", args: typing.List[str] = None
+        self,
+        path_to_swipl: str = "/path/to/swipl",
+        args: typing.List[str] = None,
+        protocol: str = "toplevel",
+        cache: typing.Optional[QueryCache] = None,
+        observer: typing.Optional[Observer] = None,
+        timeout: typing.Optional[float] = None,
     ):
         """ Constructor method
         Usage: swipl( path, args )
         path - path to SWI executable (default: 'swipl')
         args - command line arguments (default: '-q +tty')
+        protocol - 'toplevel' scrapes answers from the interactive toplevel,
+        'json' loads a driver predicate which prints every solution as a json line
+        cache - opt-in cache of answers, dropped when the knowledge base changes
+        observer - receives timing events of the engine, see prolog.swipl.observer
+        timeout - default deadline of queries in seconds, enforced in the engine
         self.engine becomes pexpect spawn instance of SWI Prolog shell
         Raises: SWIExecutableNotFound """
+        assert protocol in PROTOCOLS, f"Protocol must be one of {PROTOCOLS}"
         if args is None:
-            args = ["-q", "+tty"]
+            args = list(DEFAULT_ARGS)
+
+        self.path_to_swipl = path_to_swipl
+        self.args = args
+        self.protocol = protocol
+        self.cache = cache
+        self.observer = observer
+        self.timeout = timeout
+        self.spawn()
+
+    def spawn(self) -> None:
+        """ Spawns a new SWI Prolog shell for self.engine """
+        self.invalidate()
+        self.pending = False
+        self.full_answers = False
+        start = time.perf_counter()
 
         try:
-            self.engine = px.spawn(path_to_swipl + " " + " ".join(args))
+            self.engine = px.spawn(self.path_to_swipl + " " + " ".join(self.args))
             self.engine.expect(SWI_PROMPT, timeout=3)
         except px.ExceptionPexpect:
             raise SWIExecutableNotFound(
                 "SWI-Prolog executable not found on the specified path. "
-                f'Try installing swi-prolog or using swipl( "{path_to_swipl}" )'
+                f'Try installing swi-prolog or using swipl( "{self.path_to_swipl}" )'
             )
 
-    def load(self, path: str) -> None:
+        if self.observer is not None:
+            self.observer.spawned(time.perf_counter() - start)
+
+        if self.protocol == "json":
+            self.load_driver()
+
+    def is_alive(self) -> bool:
+        """ Checks the engine process is running and ready for a query """
+        return self.engine.isalive() and not self.pending
+
+    def load(self, path: str, timeout: float = 3) -> None:
         """ Loads module into self.engine
         Usage: instance.load( path )
         module - path to module file
         Raises: SWICompileError """
+        self.invalidate()
         self.engine.sendline("['" + path + "'].")
         self.engine.readline()
-        index = self.engine.expect([SWI_ERROR, SWI_PROMPT], timeout=3)
+        index = self.engine.expect([SWI_ERROR, SWI_PROMPT], timeout=timeout)
         if not index:
+            error = self.engine.after.decode()
+            if not error.endswith("?- "):
+                # SWI keeps compiling after the first error, wait for the prompt
+                self.engine.expect(SWI_PROMPT, timeout=timeout)
+                error += self.engine.before.decode()
             raise SWICompileError(
                 'Error while compiling module "'
                 + path
                 + '". Error from SWI:\n'
-                + str(self.engine.after)
+                + error
             )
 
     def load_lines(self, lines: typing.List[str]):
-        """ Simply loads line for base swi compiler """
+        """ Simply loads line for base swi compiler, lines starting with ':-'
+        are directives which are called instead """
+        self.invalidate()
+        start = time.perf_counter()
+
         for line in lines:
             if line.endswith("."):
                 line = line[:-1]
 
+            if line.startswith(":-"):
+                self.load_directive(line)
+                continue
+
             self.engine.sendline(f"assert(({line})).")
             self.engine.readline()
 
@@ -77,25 +207,214 @@ class Swipl:
                     + self.engine.after.decode()
                 )
 
-    def query(self, query: str) -> typing.Iterator[QueryResponse]:
-        """ Queries current engine state """
+        if self.observer is not None:
+            self.observer.loaded(len(lines), time.perf_counter() - start)
+
+    def load_directive(self, directive: str) -> None:
+        """ Calls the directive
+        Raises: SWICompileError """
+        try:
+            succeeded = self.call(directive[2:])
+        except SWIQueryError as e:
+            raise SWICompileError(
+                f'Error while calling directive "{directive}". {e}'
+            )
+        if not succeeded:
+            raise SWICompileError(f'Directive "{directive}" failed')
+
+    def load_bulk(
+        self,
+        lines: typing.Iterable[str],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        timeout: float = 30,
+    ) -> int:
+        """ Loads lines in chunks, one consult (and one acknowledgement) per chunk
+        Every line is written to a temporary file as an assertz directive
+        which is consulted with self.load
+        Returns the number of loaded lines
+        Raises: SWICompileError with the lines which failed to compile """
+        loaded = 0
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                loaded += self.load_chunk(chunk, timeout)
+                chunk = []
+        if chunk:
+            loaded += self.load_chunk(chunk, timeout)
+        return loaded
+
+    def load_chunk(self, lines: typing.List[str], timeout: float = 30) -> int:
+        """ Consults one chunk of lines through a temporary file """
+        start = time.perf_counter()
+        fd, path = tempfile.mkstemp(suffix=".pl")
+        try:
+            with os.fdopen(fd, "w") as file:
+                for line in lines:
+                    if line.endswith("."):
+                        line = line[:-1]
+                    # one clause per line so SWI error positions map back to lines
+                    line = line.replace("\n", " ")
+                    if line.startswith(":-"):
+                        file.write(f"{line}.\n")
+                    else:
+                        file.write(f":- assertz(({line})).\n")
+            try:
+                self.load(path, timeout=timeout)
+            except SWICompileError as e:
+                failed = sorted(
+                    set(map(int, re.findall(re.escape(path) + r":(\d+):", str(e))))
+                )
+                raise SWICompileError(
+                    "Error while compiling lines "
+                    + ", ".join(f'"{lines[n - 1]}"' for n in failed if 0 < n <= len(lines))
+                    + ". Error from SWI:\n"
+                    + str(e)
+                )
+        finally:
+            os.unlink(path)
+
+        if self.observer is not None:
+            self.observer.loaded(len(lines), time.perf_counter() - start)
+        return len(lines)
+
+    def load_driver(self) -> None:
+        """ Loads the driver predicate of the json protocol """
+        fd, path = tempfile.mkstemp(suffix=".pl")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(DRIVER)
+            self.load(path)
+        finally:
+            os.unlink(path)
+
+    def invalidate(self) -> None:
+        """ Drops cached answers after a change of the knowledge base """
+        if self.cache is not None:
+            self.cache.clear()
+
+    def query(
+        self, query: str, lazy: bool = False, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        """ Queries current engine state, answers are cached if the cache is set
+        :param lazy: values of toplevel answers are left Raw to be decoded with
+        decode() when used, lazy answers are not cached
+        :param timeout: deadline of the query in seconds (default: self.timeout),
+        the goal is stopped by call_with_time_limit/2 in the engine
+        Raises: SWIQueryTimeout """
+        if self.cache is None:
+            yield from self.answers(query, lazy, timeout)
+            return
+        elif not self.cache.cacheable(query):
+            self.invalidate()
+            yield from self.answers(query, lazy, timeout)
+            return
+
+        key = normalize_query(query)
+        answers = self.cache.get(key)
+
+        if answers is not None:
+            for data in answers:
+                yield data.copy() if isinstance(data, dict) else data
+            return
+        elif lazy:
+            yield from self.answers(query, lazy, timeout)
+            return
+
+        answers = []
+        for data in self.answers(query, timeout=timeout):
+            answers.append(data.copy() if isinstance(data, dict) else data)
+            yield data
+        # only complete answers are cached
+        self.cache.put(key, answers)
+
+    def answers(
+        self, query: str, lazy: bool = False, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        """ Answers of the engine, timed when the observer is set """
+        if self.observer is None:
+            return self.execute(query, lazy, timeout)
+        return self.observe(query, self.execute(query, lazy, timeout))
+
+    def observe(self, query: str, answers: typing.Iterator) -> typing.Iterator:
+        """ Reports time to the first solution, time of every solution and time
+        of the whole answer to the observer, time of the consumer is excluded """
+        observer = self.observer
+        solutions = 0
+        total = 0.0
+
+        try:
+            with closing(answers):
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        data = next(answers)
+                    except StopIteration:
+                        total += time.perf_counter() - start
+                        break
+                    elapsed = time.perf_counter() - start
+                    total += elapsed
+
+                    if not solutions:
+                        observer.first_solution(query, total)
+                    observer.solution(query, elapsed)
+                    solutions += len(data) if isinstance(data, list) else 1
+                    yield data
+        finally:
+            observer.query_done(query, solutions, total)
+
+    def send_query(self, query: str) -> None:
+        """ Writes the query and skips its echo """
+        if self.observer is None:
+            self.engine.sendline(query)
+            self.engine.readline()
+            return
+
+        start = time.perf_counter()
+        self.engine.sendline(query)
+        self.engine.readline()
+        self.observer.sent(query, time.perf_counter() - start)
+
+    def parse(self, after: bytes, lazy: bool = False) -> dict:
+        """ Parses an answer of the toplevel """
+        process = self.process_raw_res if lazy else self.process_multi_res
+        if self.observer is None:
+            return process(after)
+
+        start = time.perf_counter()
+        data = process(after)
+        self.observer.parsed(time.perf_counter() - start)
+        return data
+
+    def execute(
+        self,
+        query: str,
+        lazy: bool = False,
+        timeout: typing.Optional[float] = None,
+    ) -> typing.Iterator[QueryResponse]:
+        """ Queries the engine """
+        timeout = self.timeout if timeout is None else timeout
+
+        if self.protocol == "json":
+            yield from self.query_json(query, timeout)
+            return
+
         query = query.strip()
 
         if not query.endswith("."):
             query += "."
 
-        lvars = VAR.findall(query)
-        lvars = list(set(lvars))
+        lvars = self.query_variables(query)
+
+        if timeout is not None:
+            yield from self.execute_limited(query[:-1], lvars, timeout)
+            return
 
         if not lvars:
-            self.engine.sendline(query)
-            self.engine.readline()
-            try:
-                index = self.engine.expect(
-                    [".*true.*", SWI_ERROR, ".*false.*", SWI_PROMPT], timeout=5
-                )
-            except SWIQueryTimeout:
-                raise SWIQueryTimeout("Timeout exceeded")
+            self.send_query(query)
+            index = self.wait(
+                [SWI_TRUE, SWI_ERROR, SWI_FALSE, SWI_PROMPT], PROOF_TIMEOUT
+            )
 
             if index == 1:
                 raise SWIQueryError(
@@ -104,42 +423,440 @@ class Swipl:
                     + '". Error from SWI:\n'
                     + self.engine.after.decode()
                 )
+            # nondeterministic proofs wait for ';' until send_dot
+            self.pending = not self.engine.after.endswith(b"?- ")
             yield "true" in str(self.engine.after)
         else:
-            self.engine.sendline(query)
+            self.send_query(query)
+            self.pending = True
+
+            try:
+                while True:
+                    index = self.wait(
+                        [SWI_ERROR, SWI_MULTIPLE, SWI_FALSE], ANSWER_TIMEOUT
+                    )
+
+                    if index == 0:
+                        self.pending = False
+                        raise SWIQueryError(
+                            'Error while executing query "'
+                            + query
+                            + '". Error from SWI:\n'
+                            + self.engine.after.decode()
+                        )
+                    elif index == 2:
+                        self.pending = False
+                        return
+
+                    if self.engine.after.endswith(b"?- "):
+                        self.pending = False
+
+                    yield self.parse(self.engine.after, lazy)
+
+                    if not self.pending:
+                        return
+                    self.engine.send(";")
+            finally:
+                if self.pending:
+                    self.send_dot()
+
+    def execute_limited(
+        self, query: str, lvars: typing.List[str], timeout: float
+    ) -> typing.Iterator[QueryResponse]:
+        """ Queries the toplevel with a deadline, solutions are collected with
+        findall/3 under call_with_time_limit/2 and read as one answer
+        Variables left unbound by a solution are None """
+        limit = repr(float(timeout))
+
+        if not lvars:
+            self.send_query(f"call_with_time_limit({limit}, ({query})).")
+        else:
+            self.full_answers_flag()
+            template, bound = bound_values(lvars)
+            self.send_query(
+                f"call_with_time_limit({limit}, "
+                f"findall({template}, (({query}), {bound}), {BATCH_VAR}))."
+            )
+
+        pattern = SWI_TRUE if not lvars else BATCH_ANSWER
+        index = self.wait([pattern, SWI_ERROR, SWI_FALSE], timeout + GRACE)
+        after = self.engine.after.decode()
+
+        if index == 1:
+            error = SWIQueryTimeout if TIME_LIMIT.search(after) else SWIQueryError
+            raise error(
+                f'Error while executing query "{query}". Error from SWI:\n{after}'
+            )
+        elif not lvars:
+            yield index == 0
+            return
+        elif index == 2:
+            return
+
+        keys = [v.lower() for v in lvars]
+        for row in json.loads(BATCH_RES.search(after).group(1)):
+            yield dict(zip(keys, row))
+
+    def execute_many(
+        self, queries: typing.Sequence[str], timeout: typing.Optional[float] = None
+    ) -> typing.List[typing.List[QueryResponse]]:
+        """ Runs independent queries in one round trip instead of one per query
+        Solutions of every query are collected with findall/3 (queries without
+        variables are proved once) and returned in the order of the queries
+        :param timeout: deadline of the whole batch in seconds
+        Raises: SWIQueryError of the first query which raised, SWIQueryTimeout """
+        queries = [q.strip() for q in queries]
+        queries = [q[:-1] if q.endswith(".") else q for q in queries]
+        if not queries:
+            return []
+        if self.cache is not None and not all(map(self.cache.cacheable, queries)):
+            self.invalidate()
+
+        timeout = self.timeout if timeout is None else timeout
+        lvars = [self.query_variables(q) for q in queries]
+        goal = many_goal(queries, lvars)
+        if timeout is not None:
+            goal = f"call_with_time_limit({repr(float(timeout))}, ({goal}))"
+
+        answers = self.read_many(goal, timeout)
+        if self.observer is not None:
+            answers = self.observe(goal, answers)
+        with closing(answers):
+            results = next(answers)
+
+        demultiplexed = []
+        for query, variables, (ok, result) in zip(queries, lvars, results):
+            if not ok:
+                error = SWIQueryTimeout if TIME_LIMIT.search(result) else SWIQueryError
+                raise error(
+                    f'Error while executing query "{query}". Error from SWI:\n{result}'
+                )
+            elif not variables:
+                demultiplexed.append([bool(result)])
+            else:
+                keys = [v.lower() for v in variables]
+                demultiplexed.append([dict(zip(keys, row)) for row in result])
+        return demultiplexed
+
+    def read_many(
+        self, goal: str, timeout: typing.Optional[float]
+    ) -> typing.Iterator[list]:
+        """ Runs the goal of execute_many, yields its list of results once """
+        if self.protocol == "json":
+            for data in self.query_json(goal):
+                if isinstance(data, dict):
+                    yield data[BATCH_VAR.lower()]
+            return
+
+        self.full_answers_flag()
+        self.send_query(goal + ".")
+        index = self.wait(
+            [BATCH_ANSWER, SWI_ERROR],
+            PROOF_TIMEOUT if timeout is None else timeout + GRACE,
+        )
+        after = self.engine.after.decode()
+
+        if index == 1:
+            error = SWIQueryTimeout if TIME_LIMIT.search(after) else SWIQueryError
+            raise error(f"Error while executing queries. Error from SWI:\n{after}")
+        yield json.loads(BATCH_RES.search(after).group(1))
+
+    def wait(self, patterns: typing.List[str], timeout: float) -> int:
+        """ Expects one of the patterns, the goal still running after timeout
+        seconds is interrupted to get the toplevel back to the prompt
+        Raises: SWIQueryTimeout """
+        try:
+            return self.engine.expect(patterns, timeout=timeout)
+        except px.TIMEOUT:
+            self.interrupt()
+            raise SWIQueryTimeout(f"No answer from SWI-Prolog in {timeout}s")
+
+    def interrupt(self) -> None:
+        """ Aborts the running goal with SIGINT and waits for the prompt
+        The engine stays pending (is_alive() is False) if the prompt is not back """
+        self.pending = True
+        self.engine.sendintr()
+        try:
+            if self.engine.expect([SWI_ACTION, SWI_PROMPT], ANSWER_TIMEOUT) == 0:
+                self.engine.send("a")
+                self.engine.expect(SWI_PROMPT, timeout=ANSWER_TIMEOUT)
+        except px.ExceptionPexpect:
+            return
+        self.pending = False
+
+    def full_answers_flag(self) -> None:
+        """ Makes the toplevel print whole answers instead of abbreviating them """
+        if not self.full_answers:
+            self.engine.sendline(
+                "set_prolog_flag(answer_write_options, "
+                "[quoted(true), portray(true), max_depth(0), spacing(next_argument)])."
+            )
             self.engine.readline()
+            self.engine.expect(SWI_PROMPT, timeout=ANSWER_TIMEOUT)
+            self.full_answers = True
 
-            index = self.engine.expect([SWI_ERROR, SWI_MULTIPLE], timeout=3)
-            # print(self.engine.before)
+    def query_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        """ Queries current engine state fetching batch_size solutions per round trip
+        Solutions are collected with findnsols/4, every ';' returns the next batch
+        With a deadline all solutions are collected at once and split to batches """
+        if self.cache is None or not self.cache.cacheable(query):
+            yield from self.batches(query, batch_size, timeout)
+            return
 
-            if index == 0:
-                raise SWIQueryError(
-                    'Error while executing query "'
-                    + query
-                    + '". Error from SWI:\n'
-                    + self.engine.after.decode()
+        key = normalize_query(query)
+        answers = self.cache.get(key)
+
+        if answers is not None:
+            for i in range(0, len(answers), batch_size):
+                yield [
+                    data.copy() if isinstance(data, dict) else data
+                    for data in answers[i : i + batch_size]
+                ]
+            return
+
+        answers = []
+        for batch in self.batches(query, batch_size, timeout):
+            answers.extend(
+                data.copy() if isinstance(data, dict) else data for data in batch
+            )
+            yield batch
+        self.cache.put(key, answers)
+
+    def batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        """ Batches of the engine, timed when the observer is set """
+        if self.observer is None:
+            return self.execute_batches(query, batch_size, timeout)
+        return self.observe(query, self.execute_batches(query, batch_size, timeout))
+
+    def execute_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        """ Queries the engine fetching batch_size solutions per round trip """
+        query = query.strip()
+        timeout = self.timeout if timeout is None else timeout
+
+        if query.endswith("."):
+            query = query[:-1]
+
+        lvars = self.query_variables(query)
+
+        if not lvars or self.protocol == "json" or timeout is not None:
+            batch = []
+            for data in self.execute(query, timeout=timeout):
+                batch.append(data)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            return
+
+        self.full_answers_flag()
+
+        keys = [v.lower() for v in lvars]
+        self.send_query(
+            f"findnsols({batch_size}, [{', '.join(lvars)}], ({query}), {BATCH_VAR})."
+        )
+        self.pending = True
+
+        try:
+            while True:
+                index = self.wait(
+                    [SWI_ERROR, BATCH_ANSWER, SWI_FALSE], ANSWER_TIMEOUT
                 )
 
-            elif index == 1:
-                yield self.process_multi_res(self.engine.after)
+                if index == 0:
+                    self.pending = False
+                    raise SWIQueryError(
+                        'Error while executing query "'
+                        + query
+                        + '". Error from SWI:\n'
+                        + self.engine.after.decode()
+                    )
+                elif index == 2:
+                    self.pending = False
+                    return
 
-                while index == 1:
-                    self.engine.send(";")
-                    # self.engine.readline()
+                after = self.engine.after.decode()
+                if after.endswith("?- "):
+                    self.pending = False
 
-                    index = self.engine.expect([SWI_ERROR, SWI_MULTIPLE], timeout=3)
-                    # print(self.engine.before.decode())
+                start = time.perf_counter()
+                rows = json.loads(BATCH_RES.search(after).group(1))
+                if self.observer is not None:
+                    self.observer.parsed(time.perf_counter() - start)
+                if rows:
+                    yield [dict(zip(keys, row)) for row in rows]
 
-                    yield self.process_multi_res(self.engine.after)
+                if len(rows) < batch_size or not self.pending:
+                    return
+                self.engine.send(";")
+        finally:
+            if self.pending:
+                self.send_dot()
 
-                    if self.engine.after.endswith(b"?- "):
-                        break
+    def query_json(
+        self, query: str, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        """ Queries through the driver predicate, every solution is a json line
+        Lines are read until the deadline of the query (with GRACE seconds to
+        print the answer), the engine is interrupted after it
+        Raises: SWIQueryError, SWIQueryTimeout """
+        query = query.strip()
+
+        if query.endswith("."):
+            query = query[:-1]
+
+        if timeout is None:
+            deadline = None
+            self.send_query(f"swi_py_query({quote_atom(query)}).")
+        else:
+            deadline = time.monotonic() + timeout + GRACE
+            self.send_query(
+                f"swi_py_query({quote_atom(query)}, {repr(float(timeout))})."
+            )
+        self.pending = True
+        error = None
+
+        try:
+            while self.pending:
+                line = self.read_line(deadline)
+                if line == END:
+                    self.end_query()
+                elif line.startswith(ERROR):
+                    error = line[len(ERROR) :]
+                elif line.startswith("{"):
+                    yield {k.lower(): v for k, v in json.loads(line).items()}
+                elif line in ("true", "false"):
+                    yield line == "true"
+        finally:
+            if self.pending:
+                # an answer left unread, a goal with endless solutions is stopped
+                limit = time.monotonic() + DRAIN_TIMEOUT
+                self.drain(limit if deadline is None else min(deadline, limit))
+
+        if error is not None:
+            raise (SWIQueryTimeout if TIME_LIMIT.search(error) else SWIQueryError)(
+                'Error while executing query "'
+                + query
+                + '". Error from SWI:\n'
+                + error
+            )
+
+    def end_query(self) -> None:
+        """ Waits for the prompt after the end of the answer """
+        self.engine.expect(SWI_PROMPT, timeout=ANSWER_TIMEOUT)
+        self.pending = False
+
+    def drain(self, deadline: typing.Optional[float] = None) -> None:
+        """ Skips the rest of the pending json answer until the deadline
+        (time.monotonic, DRAIN_TIMEOUT seconds from now by default), the goal
+        still answering is interrupted
+        Raises: SWIQueryTimeout """
+        if deadline is None:
+            deadline = time.monotonic() + DRAIN_TIMEOUT
+        while self.pending:
+            if self.read_line(deadline) == END:
+                self.end_query()
+
+    def read_line(self, deadline: typing.Optional[float]) -> str:
+        """ Reads a line of the json answer, the goal still running at the
+        deadline (time.monotonic) is interrupted
+        Raises: SWIQueryTimeout """
+        timeout = -1 if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            self.engine.expect("\r\n", timeout=timeout)
+        except px.TIMEOUT:
+            self.interrupt()
+            raise SWIQueryTimeout("No answer from SWI-Prolog before the deadline")
+        return self.engine.before.decode().strip()
+
+    def call(self, goal: str, timeout: float = 5) -> bool:
+        """ Proves the goal once, bindings of its variables are not reported
+        Raises: SWIQueryError """
+        goal = goal.strip()
+
+        if goal.endswith("."):
+            goal = goal[:-1]
+
+        if self.protocol == "json":
+            answers = list(self.query_json(f"\\+ \\+ ({goal})"))
+            return bool(answers) and answers[0] is not False
+
+        self.engine.sendline(f"\\+ \\+ ({goal}).")
+        self.engine.readline()
+        index = self.wait([SWI_TRUE, SWI_ERROR, SWI_FALSE], timeout)
+
+        if index == 1:
+            raise SWIQueryError(
+                'Error while executing goal "'
+                + goal
+                + '". Error from SWI:\n'
+                + self.engine.after.decode()
+            )
+        return index == 0
+
+    def save_state(self, path: str, timeout: float = 60) -> None:
+        """ Saves the loaded program with qsave_program/2 to boot from it later
+        Raises: SWIQueryError """
+        tmp = path + ".tmp"
+        if not self.call(f"qsave_program({quote_atom(tmp)}, [])", timeout=timeout):
+            raise SWIQueryError(f'Saving state to "{path}" failed')
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        path_to_swipl: str,
+        state: str,
+        args: typing.Optional[typing.List[str]] = None,
+        **kwargs,
+    ) -> "Swipl":
+        """ Boots an engine from a state saved with save_state """
+        args = list(DEFAULT_ARGS) if args is None else args
+        return cls(path_to_swipl, ["-x", state, *args], **kwargs)
+
+    def retract(self, clause: str) -> bool:
+        """ Retracts the first clause unifying with the given one """
+        if clause.endswith("."):
+            clause = clause[:-1]
+        self.invalidate()
+        return self.call(f"retract(({clause}))")
+
+    def retractall(self, head: str) -> None:
+        """ Retracts all facts and clauses whose head unifies with the given one """
+        if head.endswith("."):
+            head = head[:-1]
+        self.invalidate()
+        self.call(f"retractall({head})")
 
     def halt(self):
         self.engine.sendline("halt(0).")
 
     def send_dot(self):
-        self.engine.send(".")
+        if self.protocol == "json":
+            self.drain()
+            return
+        if self.pending:
+            self.engine.send(".")
+            try:
+                self.engine.expect(SWI_PROMPT, timeout=ANSWER_TIMEOUT)
+            except px.TIMEOUT:
+                # the engine stays pending, is_alive() is False
+                raise SWIQueryTimeout(
+                    f"SWI-Prolog is not back to the prompt in {ANSWER_TIMEOUT}s"
+                )
+            self.pending = False
+
+    @staticmethod
+    def query_variables(query: str) -> typing.List[str]:
+        """ Named variables of the query in order of appearance """
+        lvars = VAR.findall(" " + QUOTED.sub('""', query))
+        return list(dict.fromkeys(lvars))
 
     @staticmethod
     def process_data(before: bytes) -> typing.Any:
@@ -148,6 +865,11 @@ class Swipl:
         res = RES.search(str(state))
         return res
 
+    @staticmethod
+    def process_raw_res(b: bytes) -> dict:
+        """ Splits the answer to Raw values without decoding them """
+        return {k.lower(): Raw(v) for k, v in MULTI_RES.findall(b.decode())}
+
     @staticmethod
     def process_multi_res(b: bytes) -> dict:
         multi_res = re.findall(MULTI_RES, b.decode())
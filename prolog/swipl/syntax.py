@@ -1,9 +1,17 @@
-from re import compile
+from re import compile, DOTALL
 
 SWI_PROMPT = "[?][-][ ]"
 SWI_ERROR = "ERROR.*"
 SWI_MULTIPLE = r"\w+ = .*? $"
+SWI_TRUE = r"true(?: |[.]\s*[?][-][ ])$"
+SWI_FALSE = r"false[.]\s*[?][-][ ]"
+SWI_ACTION = r"Action [(]h for help[)] [?] "
 
 VAR = compile(r"[^a-zA-Z0-9_]([A-Z][a-zA-Z0-9_]*)")
 RES = compile(r"L = (\[.*\])[., ]")
 MULTI_RES = compile(r"(\w+) = (.*?)(?:,\r\n| $|\.\r\n\r\n\?- $| .*\.)")
+QUOTED = compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
+BATCH_VAR = "SwiPyBatch"
+BATCH_ANSWER = BATCH_VAR + r" = \[.*\](?: |[.]\s*[?][-][ ])$"
+BATCH_RES = compile(BATCH_VAR + r" = (\[.*\])", DOTALL)
+TIME_LIMIT = compile(r"[Tt]ime[ _]limit[ _]exceeded")
@@ -0,0 +1,171 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+TOKEN = re.compile(
+    r"""\s*(?:
+    (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    |(?P<string>"(?:[^"\\]|\\.)*")
+    |(?P<quoted>'(?:[^'\\]|\\.)*')
+    |(?P<var>[A-Z_][a-zA-Z0-9_]*)
+    |(?P<atom>[a-z][a-zA-Z0-9_]*|\[\]|\{\}|!|;)
+    |(?P<punct>[(),\[\]|])
+    )""",
+    re.VERBOSE,
+)
+ESCAPES = re.compile(r"\\(.)")
+ESCAPE_CHARS = {"n": "\n", "t": "\t", "r": "\r", "0": "\0"}
+
+
+class Var(str):
+    """ Named prolog variable, every _ is a fresh one """
+
+
+class Atom(str):
+    """ Prolog atom """
+
+
+class Compound(NamedTuple):
+    name: str
+    args: Tuple[Any, ...]
+
+
+class TermError(ValueError):
+    pass
+
+
+def parse_term(text: str) -> Any:
+    """ Reads a term made of numbers, strings, atoms, variables, lists and compounds
+    Operators are not supported
+    Raises: TermError """
+    tokens = tokenize(text.strip().rstrip("."))
+    term, position = _read(tokens, 0)
+    if position != len(tokens):
+        raise TermError(f"Unexpected {tokens[position][1]!r} in {text!r}")
+    return term
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise TermError(f"Unexpected {text[position:]!r}")
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+def _unescape(text: str) -> str:
+    return ESCAPES.sub(lambda m: ESCAPE_CHARS.get(m.group(1), m.group(1)), text)
+
+
+def _read(tokens: List[Tuple[str, str]], i: int) -> Tuple[Any, int]:
+    if i >= len(tokens):
+        raise TermError("Unexpected end of term")
+    kind, value = tokens[i]
+
+    if kind == "number":
+        number = float(value) if any(c in value for c in ".eE") else int(value)
+        return number, i + 1
+    elif kind == "string":
+        return _unescape(value[1:-1]), i + 1
+    elif kind == "var":
+        return Var(value), i + 1
+    elif kind == "punct" and value == "[":
+        return _read_list(tokens, i + 1)
+    elif kind in ("atom", "quoted"):
+        name = _unescape(value[1:-1]) if kind == "quoted" else value
+        if name == "[]":
+            return [], i + 1
+        if i + 1 < len(tokens) and tokens[i + 1] == ("punct", "("):
+            args, i, closed = _read_args(tokens, i + 2, ")")
+            if not closed:
+                raise TermError(f"Unclosed arguments of {name!r}")
+            return Compound(name, tuple(args)), i
+        return Atom(name), i + 1
+    raise TermError(f"Unexpected {value!r}")
+
+
+def _read_args(
+    tokens: List[Tuple[str, str]], i: int, close: str
+) -> Tuple[list, int, bool]:
+    """ Reads comma separated terms, returns whether the close token was met """
+    args = []
+    while True:
+        term, i = _read(tokens, i)
+        args.append(term)
+        if i < len(tokens) and tokens[i] == ("punct", ","):
+            i += 1
+        elif i < len(tokens) and tokens[i] == ("punct", close):
+            return args, i + 1, True
+        else:
+            return args, i, False
+
+
+def _read_list(tokens: List[Tuple[str, str]], i: int) -> Tuple[Any, int]:
+    if i < len(tokens) and tokens[i] == ("punct", "]"):
+        return [], i + 1
+    items, i, closed = _read_args(tokens, i, "]")
+    if closed:
+        return items, i
+    if i < len(tokens) and tokens[i] == ("punct", "|"):
+        tail, i = _read(tokens, i + 1)
+        if i < len(tokens) and tokens[i] == ("punct", "]"):
+            for item in reversed(items):
+                tail = _cons(item, tail)
+            return tail, i + 1
+    raise TermError("Unclosed list")
+
+
+def _cons(head: Any, tail: Any) -> Any:
+    if isinstance(tail, list):
+        return [head, *tail]
+    return Compound("[|]", (head, tail))
+
+
+def deref(term: Any, bindings: Dict[str, Any]) -> Any:
+    while isinstance(term, Var) and term in bindings:
+        term = bindings[term]
+    return term
+
+
+def unify(a: Any, b: Any, bindings: Optional[Dict[str, Any]] = None) -> bool:
+    """ Unifies terms extending bindings, anonymous variables never bind """
+    bindings = {} if bindings is None else bindings
+    a, b = deref(a, bindings), deref(b, bindings)
+
+    if isinstance(a, Var) or isinstance(b, Var):
+        if isinstance(a, Var) and a != "_":
+            if a != b:
+                bindings[a] = b
+        elif isinstance(b, Var) and b != "_":
+            bindings[b] = a
+        return True
+    elif isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(unify(x, y, bindings) for x, y in zip(a, b))
+    elif isinstance(a, list) or isinstance(b, list):
+        items, other = (a, b) if isinstance(a, list) else (b, a)
+        if not items or not isinstance(other, Compound) or other.name != "[|]":
+            return False
+        return unify(items[0], other.args[0], bindings) and unify(
+            items[1:], other.args[1], bindings
+        )
+    elif isinstance(a, Compound) and isinstance(b, Compound):
+        return (
+            a.name == b.name
+            and len(a.args) == len(b.args)
+            and all(unify(x, y, bindings) for x, y in zip(a.args, b.args))
+        )
+    return type(a) is type(b) and a == b
+
+
+def resolve(term: Any, bindings: Dict[str, Any]) -> Any:
+    """ Substitutes bound variables in the term """
+    term = deref(term, bindings)
+    if isinstance(term, list):
+        return [resolve(t, bindings) for t in term]
+    elif isinstance(term, Compound):
+        return Compound(term.name, tuple(resolve(t, bindings) for t in term.args))
+    return term
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import tempfile
+import types
+import typing
+
+from prolog.version import __version__
+
+
+class Translation(typing.NamedTuple):
+    """ Clauses added by the translation of a definition and the pattern of the
+    returned predicate, None if the translation returns nothing """
+
+    clauses: typing.List[str]
+    pattern: typing.Optional[str]
+
+
+def code_fingerprint(code: types.CodeType) -> tuple:
+    """ Parts of the compiled function the translation depends on, they change
+    with the source but not with comments or formatting """
+    consts = tuple(
+        code_fingerprint(const)
+        if isinstance(const, types.CodeType)
+        # frozensets of strings are ordered by the randomized hash
+        else sorted(map(repr, const))
+        if isinstance(const, frozenset)
+        else repr(const)
+        for const in code.co_consts
+    )
+    return (
+        code.co_name,
+        code.co_argcount,
+        code.co_kwonlyargcount,
+        code.co_varnames,
+        code.co_names,
+        code.co_freevars,
+        code.co_cellvars,
+        code.co_code,
+        consts,
+    )
+
+
+class TranslationCache:
+    """ Translated predicate definitions kept in a directory, one json file per
+    definition. Entries are keyed by the compiled function and the library
+    version, so warm starts don't read the source of the definitions.
+    Unreadable entries are translated again """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+        func: typing.Optional[typing.Callable],
+        source: typing.Optional[str],
+        table: typing.Union[bool, str],
+    ) -> str:
+        definition = source if source else code_fingerprint(func.__code__)
+        name = getattr(func, "__name__", None)
+        parts = (__version__, name, table, definition)
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def entry(self, key: str) -> str:
+        return os.path.join(self.path, key + ".json")
+
+    def get(self, key: str) -> typing.Optional[Translation]:
+        try:
+            with open(self.entry(key)) as file:
+                data = json.load(file)
+            translation = Translation(list(data["clauses"]), data["pattern"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return translation
+
+    def set(self, key: str, translation: Translation) -> None:
+        """ Writes the entry atomically, a cache which can't be written is
+        skipped """
+        try:
+            fd, temp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "w") as file:
+                json.dump(translation._asdict(), file)
+            os.replace(temp, self.entry(key))
+        except OSError:
+            pass
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
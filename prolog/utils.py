@@ -1,3 +1,8 @@
 def pythonize(value: str) -> str:
     value = value.replace("...", "null").replace("|", ", ")
     return value
+
+
+def strip_dot(clause: str) -> str:
+    clause = clause.strip()
+    return clause[:-1] if clause.endswith(".") else clause
@@ -0,0 +1,248 @@
+import typing
+
+from collections import Counter
+from contextlib import closing
+from prolog.encoder import encode
+from prolog.planner import goal_text
+from prolog.query import QuerySet
+from prolog.swipl.swipl import Swipl
+from prolog.term import Atom, Compound, Var, TermError, parse_term, unify, resolve
+from prolog.utils import strip_dot
+
+if typing.TYPE_CHECKING:
+    from prolog.prolog import Prolog
+
+T = typing.TypeVar("T")
+ViewCallback = typing.Callable[[typing.List[typing.Any], typing.List[typing.Any]], None]
+
+
+def plain(term: typing.Any) -> typing.Any:
+    """ The term with atoms as strings, as values of answers are decoded """
+    if isinstance(term, Var):
+        return term
+    elif isinstance(term, Atom):
+        return str(term)
+    elif isinstance(term, list):
+        return [plain(item) for item in term]
+    elif isinstance(term, Compound):
+        return Compound(term.name, tuple(plain(arg) for arg in term.args))
+    return term
+
+
+def decoded(term: typing.Any, variables: bool = False) -> bool:
+    """ Whether answers of the engine have the value as it is: numbers, strings,
+    atoms and lists of them. Compounds are answered as their text """
+    if isinstance(term, Var):
+        return variables
+    elif isinstance(term, list):
+        return all(decoded(item, variables) for item in term)
+    return isinstance(term, (str, int, float))
+
+
+def answer_key(data: dict) -> str:
+    return repr(sorted(data.items()))
+
+
+class MaterializedView(typing.Generic[T]):
+    """ Solutions of a query set kept in memory
+    A view of a single goal of a dynamic predicate made of facts
+    (Person.filter(age=13)) follows the facts loaded with load_predicates and
+    removed with retract and retractall without querying the engine. Other
+    views, and every view after ingest, a loaded rule or directive or a fact
+    with compound values, are fetched again on the next read.
+    Changes made by goals of raw queries (assert/retract) are not seen, call
+    refresh() after them """
+
+    def __init__(self, query_set: QuerySet[T], session: "Prolog"):
+        self.query_set = query_set
+        self.session = session
+        self.variables = Swipl.query_variables(query_set.prolog)
+        self.callbacks: typing.List[ViewCallback] = []
+        self.entries: typing.List[typing.Tuple[dict, T]] = []
+        self.stale = True
+        self.incremental = False
+
+        try:
+            goal = plain(parse_term(query_set.prolog))
+        except TermError:
+            goal = None
+        self.goal = goal if isinstance(goal, Compound) else None
+        # clauses of other predicates don't change the solutions of the goal
+        self.prefix = encode(Atom(goal.name)) + "(" if self.goal is not None else ""
+        self.refresh()
+
+    def __iter__(self) -> typing.Iterator[T]:
+        return iter(self.fetchall())
+
+    def __len__(self) -> int:
+        return len(self.fetchall())
+
+    def fetchall(self) -> typing.Tuple[T, ...]:
+        """ Solutions of the query set, fetched only if the view is stale """
+        if self.stale:
+            self.refresh()
+        return tuple(row for _, row in self.entries)
+
+    def on_change(self, callback: ViewCallback) -> ViewCallback:
+        """ Calls back with the lists of added and removed rows after every
+        change, a stale view with callbacks is fetched right away
+        Usage: @view.on_change """
+        self.callbacks.append(callback)
+        return callback
+
+    def close(self) -> None:
+        """ Stops following the changes of the session """
+        self.session.views.discard(self)
+
+    def refresh(self) -> None:
+        """ Fetches the solutions from the engine """
+        self.incremental = self.goal is not None and self.dynamic_facts()
+        entries = []
+        expression = self.query_set.plan(self.session).expression
+        with closing(self.session.query(expression)) as answers:
+            for data in answers:
+                if isinstance(data, bool):
+                    if not data:
+                        continue
+                    data = {}
+                entries.append((data, self.row(data)))
+
+        previous, self.entries = self.entries, entries
+        self.stale = False
+        if self.callbacks:
+            self.notify(
+                self.difference(entries, previous), self.difference(previous, entries)
+            )
+
+    def invalidate(self) -> None:
+        """ Marks the view to be fetched again """
+        self.stale = True
+        if self.callbacks:
+            self.refresh()
+
+    def loaded(self, clauses: typing.Iterable[str]) -> None:
+        """ Adds solutions of the facts loaded to the engine """
+        if self.stale:
+            return
+        if not self.incremental:
+            return self.invalidate()
+
+        added = []
+        for clause in clauses:
+            clause = clause.lstrip()
+            if clause.startswith(":-"):
+                self.notify(added, [])
+                return self.invalidate()
+            if not clause.startswith(self.prefix):
+                continue
+            try:
+                data = self.match(clause)
+            except TermError:
+                # a rule of the predicate
+                self.notify(added, [])
+                return self.invalidate()
+            if data is not None:
+                self.entries.append((data, self.row(data)))
+                added.append(self.entries[-1][1])
+        self.notify(added, [])
+
+    def retracted(self, clause: str) -> None:
+        """ Removes the solution of the fact retracted from the engine """
+        if self.stale:
+            return
+        clause = clause.lstrip()
+        if not self.incremental:
+            return self.invalidate()
+        if not clause.startswith(self.prefix):
+            return
+
+        try:
+            data = self.match(clause)
+        except TermError:
+            # which clause was retracted is known only to the engine
+            return self.invalidate()
+        if data is None:
+            return
+
+        key = answer_key(data)
+        for i, (entry, row) in enumerate(self.entries):
+            if answer_key(entry) == key:
+                del self.entries[i]
+                return self.notify([], [row])
+
+    def retracted_all(self, head: str) -> None:
+        """ Removes the solutions of the facts unifying with the head """
+        if self.stale:
+            return
+        head = head.lstrip()
+        if not self.incremental:
+            return self.invalidate()
+        if not head.startswith(self.prefix):
+            return
+
+        try:
+            term = plain(parse_term(head))
+        except TermError:
+            return self.invalidate()
+        if not isinstance(term, Compound) or not all(
+            decoded(arg, True) for arg in term.args
+        ):
+            return self.invalidate()
+
+        kept, removed = [], []
+        for data, row in self.entries:
+            bindings = {Var(v): data.get(v.lower(), Var("_")) for v in self.variables}
+            if unify(term, resolve(self.goal, bindings)):
+                removed.append(row)
+            else:
+                kept.append((data, row))
+        self.entries = kept
+        self.notify([], removed)
+
+    def match(self, clause: str) -> typing.Optional[dict]:
+        """ Values of the variables of the goal if the fact unifies with it
+        Raises: TermError of clauses which are not facts of values answered as
+        they are (see decoded) """
+        term = plain(parse_term(strip_dot(clause)))
+        if not isinstance(term, Compound) or not all(map(decoded, term.args)):
+            raise TermError(f"{clause!r} is not a fact of plain values")
+        bindings: typing.Dict[str, typing.Any] = {}
+        if not unify(self.goal, term, bindings):
+            return None
+        return {v.lower(): resolve(Var(v), bindings) for v in self.variables}
+
+    def dynamic_facts(self) -> bool:
+        """ Whether the predicate of the goal is a dynamic user predicate without
+        rules, so only the facts loaded or retracted change its solutions """
+        head = goal_text(self.goal.name, ["_"] * len(self.goal.args))
+        return self.session.call(
+            f"predicate_property({head}, dynamic), "
+            f"\\+ predicate_property({head}, built_in), "
+            f"\\+ predicate_property({head}, foreign), "
+            f"\\+ (predicate_property({head}, number_of_rules(SwiPyRules)), "
+            f"SwiPyRules > 0)"
+        )
+
+    def row(self, data: dict) -> T:
+        return self.query_set.hydrate(dict(data))
+
+    def notify(self, added: typing.List[T], removed: typing.List[T]) -> None:
+        if added or removed:
+            for callback in self.callbacks:
+                callback(added, removed)
+
+    @staticmethod
+    def difference(
+        entries: typing.List[typing.Tuple[dict, T]],
+        other: typing.List[typing.Tuple[dict, T]],
+    ) -> typing.List[T]:
+        """ Rows of entries without the answers of other """
+        counts = Counter(answer_key(data) for data, _ in other)
+        rows = []
+        for data, row in entries:
+            key = answer_key(data)
+            if counts[key]:
+                counts[key] -= 1
+            else:
+                rows.append(row)
+        return rows
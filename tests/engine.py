@@ -0,0 +1,366 @@
+""" In-process stand-in of an engine for the tests
+Understands just enough of the goals the library sends: facts, conjunctions,
+once/1, limit/2, ignore/1, \\+, aggregate_all/3 of count, sum, min and max,
+comparisons with numbers, predicate_property/2 of dynamic, built_in, foreign,
+imported_from and number_of_rules, current_predicate/1, clause/2, \\==, distinct/2,
+retract/1 and retractall/1. Rules are recorded, not run.
+A query, call or load while the answers of another query are read raises
+AssertionError, as the goals would interleave on a real engine
+Script stands in for the process of a toplevel engine with scripted output """
+import re
+import time
+import typing
+
+from contextlib import closing
+
+import pexpect
+
+from prolog.encoder import encode
+from prolog.planner import split_goals
+from prolog.prolog import Prolog
+from prolog.swipl import Swipl
+from prolog.swipl.swipl import QueryResponse
+from prolog.term import Atom, Compound, Var, parse_term, resolve, unify
+from prolog.utils import strip_dot
+
+Bindings = typing.Dict[str, typing.Any]
+
+ONCE = re.compile(r"once\(\((.*)\)\)$", re.DOTALL)
+LIMIT = re.compile(r"limit\((\d+), \((.*)\)\)$", re.DOTALL)
+IGNORE = re.compile(r"ignore\((.*)\)$", re.DOTALL)
+NOT = re.compile(r"\\\+ ?(.*)$", re.DOTALL)
+AGGREGATE = re.compile(
+    r"aggregate_all\((count|(sum|min|max)\((\w+)\)), \((.*)\), (\w+)\)$", re.DOTALL
+)
+COMPARE = re.compile(r"(\w+) (>|<|>=|=<) (-?\d+)$")
+PROPERTY = re.compile(
+    r"predicate_property\((.*), "
+    r"(dynamic|built_in|foreign|imported_from\(\w+\)|number_of_rules\((\w+)\))\)$"
+)
+CURRENT = re.compile(r"current_predicate\((.*)/(\d+)\)$")
+CLAUSE = re.compile(r"clause\((.*), (\w+)\)$", re.DOTALL)
+NOT_IDENTICAL = re.compile(r"(\w+) \\== (\w+)$")
+DISTINCT = re.compile(r"distinct\((\w+), (.*)\)$", re.DOTALL)
+RETRACT = re.compile(r"retract\(\((.*)\)\)$", re.DOTALL)
+RETRACTALL = re.compile(r"retractall\((.*)\)$", re.DOTALL)
+DYNAMIC = re.compile(r":- ?dynamic\((.*)/\d+\)$")
+COMPARISONS = {
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+    ">=": lambda a, b: a >= b,
+    "=<": lambda a, b: a <= b,
+}
+
+
+def name(term: typing.Any) -> str:
+    return term.name if isinstance(term, Compound) else str(term)
+
+
+def value(term: typing.Any) -> typing.Any:
+    """ The term as the decoder returns it """
+    if isinstance(term, Atom):
+        return str(term)
+    elif isinstance(term, list):
+        return [value(item) for item in term]
+    elif isinstance(term, Compound):
+        return encode(term)
+    return term
+
+
+class FakeEngine(Swipl):
+    # seconds between two answers, widens the window of interleaved goals
+    delay = 0.0
+
+    def spawn(self) -> None:
+        self.facts: typing.List[typing.Any] = []
+        self.rules: typing.Dict[str, int] = {}
+        self.dynamic: typing.Set[str] = set()
+        self.queries: typing.List[str] = []
+        self.busy = False
+        self.pending = False
+        self.full_answers = False
+
+    def halt(self) -> None:
+        pass
+
+    def enter(self) -> None:
+        assert not self.busy, "Goals of two queries interleaved on one engine"
+
+    def execute(
+        self, query: str, lazy: bool = False, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[QueryResponse]:
+        self.enter()
+        self.busy = True
+        try:
+            query = strip_dot(query.strip())
+            self.queries.append(query)
+            names = self.query_variables(query)
+            solutions = list(self.solve(query, {}))
+            if not names:
+                time.sleep(self.delay)
+                yield bool(solutions)
+                return
+            for bindings in solutions:
+                time.sleep(self.delay)
+                answer = {}
+                for n in names:
+                    term = resolve(Var(n), bindings)
+                    if not isinstance(term, Var):
+                        answer[n.lower()] = value(term)
+                yield answer
+        finally:
+            self.busy = False
+
+    def execute_batches(
+        self, query: str, batch_size: int, timeout: typing.Optional[float] = None
+    ) -> typing.Iterator[typing.List[QueryResponse]]:
+        batch: typing.List[QueryResponse] = []
+        with closing(self.execute(query, timeout=timeout)) as answers:
+            for data in answers:
+                batch.append(data)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def call(self, goal: str, timeout: float = 5) -> bool:
+        self.enter()
+        goal = strip_dot(goal.strip())
+
+        match = RETRACT.match(goal)
+        if match:
+            term = parse_term(match.group(1))
+            for i, fact in enumerate(self.facts):
+                if unify(term, fact):
+                    del self.facts[i]
+                    return True
+            return False
+
+        match = RETRACTALL.match(goal)
+        if match:
+            term = parse_term(match.group(1))
+            self.facts = [fact for fact in self.facts if not unify(term, fact)]
+            self.dynamic.add(name(term))
+            return True
+
+        return next(self.solve(goal, {}), None) is not None
+
+    def load_lines(self, lines: typing.List[str]) -> None:
+        self.load_chunk(lines)
+
+    def load_chunk(self, lines: typing.List[str], timeout: float = 30) -> int:
+        self.enter()
+        self.invalidate()
+        for line in lines:
+            self.add(strip_dot(line.strip()))
+        return len(lines)
+
+    def add(self, clause: str) -> None:
+        if clause.startswith(":-"):
+            match = DYNAMIC.match(clause)
+            if match:
+                self.dynamic.add(match.group(1))
+            return
+
+        head, neck, _ = clause.partition(":-")
+        if neck:
+            functor = head.split("(", 1)[0].strip()
+            self.rules[functor] = self.rules.get(functor, 0) + 1
+            self.dynamic.add(functor)
+            return
+
+        term = parse_term(clause)
+        self.facts.append(term)
+        self.dynamic.add(name(term))
+
+    def solve(self, goal: str, bindings: Bindings) -> typing.Iterator[Bindings]:
+        goals = split_goals(goal, ",")
+        if len(goals) > 1:
+            yield from self.conjunction(goals, bindings)
+            return
+
+        goal = goals[0]
+        if goal.startswith("(") and goal.endswith(")"):
+            yield from self.solve(goal[1:-1].strip(), bindings)
+            return
+
+        match = ONCE.match(goal)
+        if match:
+            for solution in self.solve(match.group(1), bindings):
+                yield solution
+                return
+            return
+
+        match = LIMIT.match(goal)
+        if match:
+            for i, solution in enumerate(self.solve(match.group(2), bindings)):
+                if i >= int(match.group(1)):
+                    return
+                yield solution
+            return
+
+        match = IGNORE.match(goal)
+        if match:
+            yield next(self.solve(match.group(1), bindings), bindings)
+            return
+
+        match = NOT.match(goal)
+        if match:
+            if next(self.solve(match.group(1).strip(), dict(bindings)), None) is None:
+                yield bindings
+            return
+
+        match = AGGREGATE.match(goal)
+        if match:
+            yield from self.aggregate(match, bindings)
+            return
+
+        match = COMPARE.match(goal)
+        if match:
+            left = resolve(Var(match.group(1)), bindings)
+            compare = COMPARISONS[match.group(2)]
+            if not isinstance(left, Var) and compare(left, int(match.group(3))):
+                yield bindings
+            return
+
+        match = PROPERTY.match(goal)
+        if match:
+            yield from self.property(match, bindings)
+            return
+
+        match = CURRENT.match(goal)
+        if match:
+            functor = str(parse_term(match.group(1)))
+            arity = int(match.group(2))
+            if functor in self.rules or any(
+                name(fact) == functor and len(getattr(fact, "args", ())) == arity
+                for fact in self.facts
+            ):
+                yield bindings
+            return
+
+        match = CLAUSE.match(goal)
+        if match:
+            yield from self.clause(match, bindings)
+            return
+
+        match = NOT_IDENTICAL.match(goal)
+        if match:
+            if resolve(Var(match.group(1)), bindings) != parse_term(match.group(2)):
+                yield bindings
+            return
+
+        match = DISTINCT.match(goal)
+        if match:
+            seen = []
+            for solution in self.solve(match.group(2), bindings):
+                term = resolve(Var(match.group(1)), solution)
+                if term not in seen:
+                    seen.append(term)
+                    yield solution
+            return
+
+        term = parse_term(goal)
+        for fact in list(self.facts):
+            solution = dict(bindings)
+            if unify(term, fact, solution):
+                yield solution
+
+    def conjunction(
+        self, goals: typing.List[str], bindings: Bindings
+    ) -> typing.Iterator[Bindings]:
+        if not goals:
+            yield bindings
+            return
+        for solution in self.solve(goals[0], bindings):
+            yield from self.conjunction(goals[1:], solution)
+
+    def aggregate(self, match: typing.Match, bindings: Bindings):
+        solutions = list(self.solve(match.group(4), dict(bindings)))
+        if match.group(1) == "count":
+            result: typing.Any = len(solutions)
+        else:
+            values = [resolve(Var(match.group(3)), s) for s in solutions]
+            if not values and match.group(2) != "sum":
+                return
+            result = {"sum": sum, "min": min, "max": max}[match.group(2)](values)
+        solution = dict(bindings)
+        if unify(Var(match.group(5)), result, solution):
+            yield solution
+
+    def clause(self, match: typing.Match, bindings: Bindings):
+        """ Facts have the body true, recorded rules the body rule """
+        term = parse_term(match.group(1))
+        for fact in list(self.facts):
+            solution = dict(bindings)
+            if unify(term, fact, solution) and unify(
+                Var(match.group(2)), Atom("true"), solution
+            ):
+                yield solution
+        for _ in range(self.rules.get(name(term), 0)):
+            solution = dict(bindings)
+            if unify(Var(match.group(2)), Atom("rule"), solution):
+                yield solution
+
+    def property(self, match: typing.Match, bindings: Bindings):
+        functor = name(parse_term(match.group(1)))
+        defined = functor in self.dynamic
+        if match.group(2) == "dynamic":
+            if defined:
+                yield bindings
+        elif match.group(3) is not None and defined:
+            solution = dict(bindings)
+            if unify(Var(match.group(3)), self.rules.get(functor, 0), solution):
+                yield solution
+
+
+class FakeProlog(Prolog, FakeEngine):
+    pass
+
+
+class Script:
+    """ Stand-in of the pexpect child answering expect() with scripted output,
+    pexpect.TIMEOUT when the script is over """
+
+    def __init__(self, outputs: typing.List[str]):
+        self.outputs = list(outputs)
+        self.sent: typing.List[str] = []
+        self.timeouts: typing.List[typing.Optional[float]] = []
+        self.before = b""
+        self.after = b""
+
+    def sendline(self, line: str) -> None:
+        self.sent.append(line)
+
+    def send(self, text: str) -> None:
+        self.sent.append(text)
+
+    def sendintr(self) -> None:
+        self.sent.append("^C")
+
+    def readline(self) -> bytes:
+        return b""
+
+    def expect(self, patterns, timeout=None) -> int:
+        patterns = [patterns] if isinstance(patterns, str) else patterns
+        self.timeouts.append(timeout)
+        if not self.outputs:
+            raise pexpect.TIMEOUT("over")
+        output = self.outputs.pop(0)
+        for i, pattern in enumerate(patterns):
+            match = re.search(pattern, output)
+            if match:
+                self.before = output[: match.start()].encode()
+                self.after = output.encode()
+                return i
+        raise pexpect.TIMEOUT(output)
+
+
+class ScriptedSwipl(Swipl):
+    outputs: typing.List[str] = []
+
+    def spawn(self) -> None:
+        self.engine = Script(self.outputs)
+        self.pending = False
+        self.full_answers = False
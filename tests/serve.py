@@ -0,0 +1,22 @@
+""" Stand-in of swipl serving the json driver through pipes
+Every goal is proved true, goals calling repeat print solutions forever,
+goals calling sleep exceed their time limit if they have one and goals calling
+hang are never answered """
+import re
+import sys
+
+END = "%swi-py-end"
+ERROR = "%swi-py-error "
+
+for line in sys.stdin:
+    if line.startswith("halt"):
+        break
+    if "repeat" in line:
+        while True:
+            print('{"X":1}', flush=True)
+    if "hang" in line:
+        continue
+    if "sleep" in line and re.search(r"', [0-9.]+\)\.$", line.strip()):
+        print(ERROR + "time_limit_exceeded", END, sep="\n", flush=True)
+        continue
+    print("true", END, sep="\n", flush=True)
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from prolog import AsyncProlog
+from prolog.swipl import AsyncSwipl, async_swipl
+from prolog.swipl.exception import SwiplError, SWIQueryTimeout
+
+SERVE = f"{sys.executable} {os.path.join(os.path.dirname(__file__), 'serve.py')}"
+
+
+def test_unread_answer_is_skipped():
+    async def main():
+        async with AsyncSwipl(SERVE) as swipl:
+            answers = swipl.query("person(X, 13)")
+            assert await answers.__anext__() is True
+            await answers.aclose()
+            assert not swipl.lock.locked()
+            assert await swipl.call("true")
+
+    asyncio.run(main())
+
+
+def test_endless_answer_kills_the_process(monkeypatch):
+    monkeypatch.setattr(async_swipl, "DRAIN_TIMEOUT", 0.2)
+
+    async def main():
+        swipl = AsyncSwipl(SERVE)
+        await swipl.spawn()
+        answers = swipl.query("repeat, X = 1")
+        assert await answers.__anext__() == {"x": 1}
+        with pytest.raises(SWIQueryTimeout):
+            await answers.aclose()
+        assert swipl.process.returncode is not None
+        assert not swipl.lock.locked()
+        with pytest.raises(SwiplError):
+            await swipl.call("true")
+
+        await swipl.spawn()
+        assert await swipl.call("true")
+        await swipl.halt()
+
+    asyncio.run(main())
+
+
+def test_engine_not_answering_is_killed():
+    async def main():
+        swipl = AsyncSwipl(SERVE, timeout=0.2)
+        await swipl.spawn()
+        with pytest.raises(SWIQueryTimeout):
+            await swipl.call("hang")
+        assert swipl.process.returncode is not None
+        assert not swipl.lock.locked()
+
+    asyncio.run(main())
+
+
+def test_deadline_of_query_sets():
+    async def main():
+        async with AsyncProlog(SERVE) as prolog:
+            assert await (prolog >> "true").aprove(timeout=1)
+            with pytest.raises(SWIQueryTimeout):
+                await (prolog >> "sleep(2)").aprove(timeout=1)
+            assert await (prolog >> "sleep(2)").aprove()
+
+    asyncio.run(main())
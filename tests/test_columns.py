@@ -0,0 +1,26 @@
+from dataclasses import dataclass
+
+from prolog import Predicate
+from tests.engine import FakeProlog
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+def test_unbound_values_are_none():
+    prolog = FakeProlog("swipl")
+    prolog.load_lines(["person(Anyone, 50).", 'person("ann", 13).'])
+    columns = (prolog >> "person(Name, Age)").fetch_columns()
+    assert columns == {"name": [None, "ann"], "age": [50, 13]}
+
+
+def test_columns_of_the_variables_and_pre_set_values():
+    prolog = FakeProlog("swipl")
+    prolog.load_lines(['person("ann", 13).', 'person("bob", 13).'])
+    columns = Person.filter(age=13).fetch_columns(prolog, kind="array")
+    assert columns["name"] == ["ann", "bob"]
+    assert list(columns["age"]) == [13, 13]
+    assert Person.filter(age=99).fetch_columns(prolog) == {"name": [], "age": []}
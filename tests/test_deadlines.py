@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+
+import pytest
+
+from prolog import Predicate
+from prolog.swipl.swipl import DRAIN_TIMEOUT, GRACE
+from prolog.swipl.exception import SWIQueryError, SWIQueryTimeout
+from tests.engine import FakeProlog, ScriptedSwipl
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+def test_unbound_variables_under_a_deadline_are_none():
+    ScriptedSwipl.outputs = ["true.\n\n?- ", "SwiPyBatch = [[null,1]].\n\n?- "]
+    swipl = ScriptedSwipl("swipl", timeout=2)
+    answers = list(swipl.query("aggregate_all(count, person(Name, 13), A)."))
+    assert answers == [{"name": None, "a": 1}]
+    query = swipl.engine.sent[-1]
+    assert "var(Name) -> SwiPyBatchV0 = null ; SwiPyBatchV0 = Name" in query
+    assert query.startswith("call_with_time_limit(2.0, findall([SwiPyBatchV0, ")
+
+
+def test_engine_not_back_to_the_prompt_raises_timeout():
+    ScriptedSwipl.outputs = []
+    swipl = ScriptedSwipl("swipl")
+    with pytest.raises(SWIQueryTimeout):
+        list(swipl.query("person(Name, 13)."))
+    # the engine is not ready for another query
+    assert swipl.pending
+
+
+def test_fetchone_and_prove_stop_at_the_first_solution():
+    prolog = FakeProlog("swipl", timeout=2)
+    prolog << Person("a", 1)
+    prolog << Person("b", 2)
+    prolog.load_predicates()
+
+    assert Person.filter().fetchone(prolog) == Person("a", 1)
+    assert prolog.queries[-1] == "once((person(Name, Age)))"
+    assert (prolog >> 'person("b", 2)').prove() is True
+    assert prolog.queries[-1] == 'once((person("b", 2)))'
+
+
+def test_json_answers_are_read_until_the_deadline():
+    ScriptedSwipl.outputs = ['{"Name":"ann"}\r\n']
+    swipl = ScriptedSwipl("swipl", protocol="json", timeout=2)
+    answers = swipl.query("person(Name, 13).")
+    assert next(answers) == {"name": "ann"}
+    with pytest.raises(SWIQueryTimeout):
+        next(answers)
+    # the goal still running was interrupted
+    assert "^C" in swipl.engine.sent
+
+
+def test_unread_json_answer_is_skipped_until_the_drain_timeout():
+    ScriptedSwipl.outputs = ['{"Name":"ann"}\r\n', '{"Name":"bob"}\r\n']
+    swipl = ScriptedSwipl("swipl", protocol="json")
+    answers = swipl.query("person(Name, _).")
+    assert next(answers) == {"name": "ann"}
+    # the goal keeps answering until it is interrupted
+    with pytest.raises(SWIQueryTimeout):
+        answers.close()
+    assert "^C" in swipl.engine.sent
+    drained = swipl.engine.timeouts[1:3]
+    assert all(0 <= timeout <= DRAIN_TIMEOUT for timeout in drained)
+
+
+def test_time_limit_error_raises_timeout():
+    ScriptedSwipl.outputs = [
+        "true.\r\n\r\n?- ",
+        "ERROR: Unhandled exception: Time limit exceeded\r\n",
+        "ERROR: Unknown procedure: q/1\r\n",
+    ]
+    swipl = ScriptedSwipl("swipl", timeout=2)
+    with pytest.raises(SWIQueryTimeout):
+        list(swipl.query("p(X)."))
+    with pytest.raises(SWIQueryError) as error:
+        list(swipl.query("q(X)."))
+    assert not isinstance(error.value, SWIQueryTimeout)
+
+
+def test_proof_under_a_deadline():
+    ScriptedSwipl.outputs = ["true.\r\n\r\n?- ", "false.\r\n\r\n?- "]
+    swipl = ScriptedSwipl("swipl", timeout=2)
+    assert list(swipl.query("p.")) == [True]
+    assert swipl.engine.sent[-1] == "call_with_time_limit(2.0, (p))."
+    assert list(swipl.query("q.")) == [False]
+    # the engine gets the grace period to print the answer
+    assert swipl.engine.timeouts == [2 + GRACE, 2 + GRACE]
+
+
+def test_goal_running_over_the_deadline_is_interrupted():
+    ScriptedSwipl.outputs = ["", "Action (h for help) ? ", "?- "]
+    swipl = ScriptedSwipl("swipl", timeout=2)
+    with pytest.raises(SWIQueryTimeout):
+        list(swipl.query("p."))
+    assert swipl.engine.sent[-2:] == ["^C", "a"]
+    assert not swipl.pending
+
+
+def test_json_time_limit_error_raises_timeout():
+    ScriptedSwipl.outputs = [
+        "%swi-py-error time_limit_exceeded\r\n",
+        "%swi-py-end\r\n",
+        "?- ",
+    ]
+    swipl = ScriptedSwipl("swipl", protocol="json", timeout=2)
+    with pytest.raises(SWIQueryTimeout):
+        list(swipl.query("p(X)."))
+    assert swipl.engine.sent[-1] == "swi_py_query('p(X)', 2.0)."
+    assert not swipl.pending
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+
+from prolog import Atom, Predicate, QueryVar, encode, encode_facts
+from prolog.term import Compound
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+@pytest.mark.parametrize(
+    "value, term",
+    [
+        (True, "true"),
+        (False, "false"),
+        (None, "null"),
+        (13, "13"),
+        (1.5, "1.5"),
+        (1e100, "1.0e+100"),
+        (float("inf"), "1.0Inf"),
+        (float("-inf"), "-1.0Inf"),
+        (float("nan"), "1.5NaN"),
+        ("it's", '"it\'s"'),
+        ('say "hi"\n', '"say \\"hi\\"\\n"'),
+        (Atom("ann"), "ann"),
+        (Atom("Ann"), "'Ann'"),
+        (Atom("it's"), "'it\\'s'"),
+        (Atom("[]"), "[]"),
+        (QueryVar("X"), "X"),
+        ([1, ("a", [None])], '[1, ["a", [null]]]'),
+        ({"a": 1, 2: True}, "_{a: 1, 2: true}"),
+        (Compound("point", (1, Atom("x"))), "point(1, x)"),
+        (Person("ann", 13), 'person("ann", 13)'),
+        ({"b"}, '"{\'b\'}"'),
+        (Decimal("1.5"), '"1.5"'),
+        (datetime(2026, 1, 2, 3, 4), '"2026-01-02 03:04:00"'),
+        (Fraction(1, 3), '"1/3"'),
+    ],
+)
+def test_encode(value, term):
+    assert encode(value) == term
+
+
+def test_encode_facts():
+    rows = [Person("ann", 13), ("bob", 40)]
+    with pytest.raises(TypeError):
+        list(encode_facts(rows))
+    assert list(encode_facts(rows, "person")) == [
+        'person("ann", 13).',
+        'person("bob", 40).',
+    ]
@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+
+from prolog import Predicate
+from tests.engine import FakeProlog
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+def test_retractall_unregisters_facts_and_rules():
+    prolog = FakeProlog("swipl")
+    prolog << Person("ann", 13)
+    prolog << Person("bob", 40)
+    prolog << 'person(X, 13) :- X = "cid".'
+    prolog << "adult(X) :- person(X, A), A > 17."
+    prolog.load_predicates()
+
+    prolog.retractall(Person.filter(age=13))
+    assert prolog.predicates == [
+        'person("bob", 40).',
+        "adult(X) :- person(X, A), A > 17.",
+    ]
+    assert prolog.loaded == 2
+    assert [fact.args[0] for fact in prolog.facts] == ["bob"]
+
+
+def test_heads_which_are_not_parsed_match_on_name_and_arity():
+    prolog = FakeProlog("swipl")
+    prolog << "score(ann, 3)."
+    prolog << "score(bob, 1+2) :- true."
+    prolog << "score(ann)."
+    prolog << "scores(1, 2)."
+    assert prolog.unregister_all("score(X, 1+2)") == 2
+    assert prolog.predicates == ["score(ann).", "scores(1, 2)."]
+    assert prolog.unregister_all("'score'(ann)") == 1
+    assert prolog.predicates == ["scores(1, 2)."]
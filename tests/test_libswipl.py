@@ -0,0 +1,175 @@
+import ctypes
+import typing
+
+import pytest
+
+from prolog.encoder import encode
+from prolog.swipl.exception import SWIQueryError, SWIQueryTimeout
+from prolog.swipl.libswipl import (
+    CVT_WRITEQ,
+    PL_ATOM,
+    PL_FLOAT,
+    PL_INTEGER,
+    PL_LIST_PAIR,
+    PL_NIL,
+    PL_STRING,
+    PL_VARIABLE,
+    LibSwipl,
+    open_queries,
+)
+from prolog.term import Atom, Compound
+
+
+class FakeLib:
+    """ Stand-in of libswipl holding python values in term refs: None for
+    variables, Atom, str for strings, numbers, lists and Compound """
+
+    def __init__(self):
+        self.terms: typing.Dict[int, typing.Any] = {}
+        self.buffers: typing.List[ctypes.Array] = []
+        self.closed: typing.List[typing.Any] = []
+        self.cleared = False
+
+    def put(self, term: typing.Any) -> int:
+        ref = len(self.terms) + 1
+        self.terms[ref] = term
+        return ref
+
+    def PL_new_term_ref(self) -> int:
+        return self.put(None)
+
+    def PL_copy_term_ref(self, ref: int) -> int:
+        return self.put(self.terms[ref])
+
+    def PL_term_type(self, ref: int) -> int:
+        term = self.terms[ref]
+        if term is None:
+            return PL_VARIABLE
+        elif isinstance(term, Atom):
+            return PL_ATOM
+        elif isinstance(term, str):
+            return PL_STRING
+        elif isinstance(term, int):
+            return PL_INTEGER
+        elif isinstance(term, float):
+            return PL_FLOAT
+        elif isinstance(term, list):
+            return PL_LIST_PAIR if term else PL_NIL
+        return 7  # PL_TERM
+
+    def PL_get_int64(self, ref: int, integer) -> int:
+        if abs(self.terms[ref]) >= 2 ** 63:
+            return 0
+        integer._obj.value = self.terms[ref]
+        return 1
+
+    def PL_get_float(self, ref: int, number) -> int:
+        number._obj.value = self.terms[ref]
+        return 1
+
+    def PL_get_nchars(self, ref: int, length, chars, flags: int) -> int:
+        term = self.terms[ref]
+        text = encode(term) if flags & CVT_WRITEQ else str(term)
+        buffer = ctypes.create_string_buffer(text.encode())
+        self.buffers.append(buffer)
+        length._obj.value = len(text.encode())
+        chars._obj.value = ctypes.addressof(buffer)
+        return 1
+
+    def PL_get_list(self, ref: int, head: int, tail: int) -> int:
+        term = self.terms[ref]
+        if not isinstance(term, list) or not term:
+            return 0
+        self.terms[head], self.terms[tail] = term[0], term[1:]
+        return 1
+
+    def PL_get_nil(self, ref: int) -> int:
+        return self.terms[ref] == []
+
+    def PL_clear_exception(self) -> None:
+        self.cleared = True
+
+    def PL_cut_query(self, qid: typing.Any) -> int:
+        self.closed.append(qid)
+        return 1
+
+    def PL_discard_foreign_frame(self, frame: typing.Any) -> None:
+        self.closed.append(frame)
+
+
+class FakeLibSwipl(LibSwipl):
+    # answers of solutions() per query
+    scripted: typing.Dict[str, typing.List[typing.Any]] = {}
+
+    def spawn(self) -> None:
+        self.lib = FakeLib()
+        self.full_answers = True
+        self.queries: typing.List[str] = []
+
+    def solutions(self, query: str, once: bool = False):
+        self.queries.append(query)
+        yield from self.scripted[query]
+
+
+def test_values_are_decoded_as_toplevel_answers():
+    swipl = FakeLibSwipl("swipl")
+    put = swipl.lib.put
+    assert swipl.value(put(None)) is None
+    assert swipl.value(put(13)) == 13
+    assert swipl.value(put(2 ** 70)) == 2 ** 70
+    assert swipl.value(put(1.5)) == 1.5
+    assert swipl.value(put("ann")) == "ann"
+    assert swipl.value(put(Atom("bob"))) == "bob"
+    assert swipl.value(put(Atom("true"))) is True
+    assert swipl.value(put(Atom("null"))) is None
+    assert swipl.value(put([])) == []
+    assert swipl.value(put([1, Atom("false"), ["x"]])) == [1, False, ["x"]]
+    assert swipl.value(put(Compound("f", (Atom("a"), "b c")))) == 'f(a, "b c")'
+
+
+def test_errors_of_goals():
+    swipl = FakeLibSwipl("swipl")
+    swipl.raise_exception(0, "p")
+    assert not swipl.lib.cleared
+
+    with pytest.raises(SWIQueryTimeout):
+        swipl.raise_exception(swipl.lib.put(Atom("time_limit_exceeded")), "p")
+    assert swipl.lib.cleared
+
+    error = Compound("error", (Compound("existence_error", ("procedure",)), None))
+    with pytest.raises(SWIQueryError, match="existence_error") as raised:
+        swipl.raise_exception(swipl.lib.put(error), "q")
+    assert not isinstance(raised.value, SWIQueryTimeout)
+
+
+def test_deadline_collects_solutions_under_a_time_limit():
+    goal = (
+        "call_with_time_limit(2.0, "
+        "findall([Name, Age], (person(Name, Age)), SwiPyBatch))"
+    )
+    FakeLibSwipl.scripted = {
+        goal: [{"swipybatch": [["ann", 13], ["bob", 40]]}],
+        "call_with_time_limit(2.0, (p))": [True],
+    }
+    swipl = FakeLibSwipl("swipl", timeout=2)
+    assert list(swipl.query("person(Name, Age).")) == [
+        {"name": "ann", "age": 13},
+        {"name": "bob", "age": 40},
+    ]
+    assert list(swipl.query("p.")) == [True]
+    assert swipl.queries == [goal, "call_with_time_limit(2.0, (p))"]
+
+
+def test_nested_queries_are_closed_first():
+    swipl = FakeLibSwipl("swipl")
+    outer, inner = ["outer frame", "outer"], ["inner frame", "inner"]
+    open_queries().extend([outer, inner])
+    try:
+        with pytest.raises(SWIQueryError, match="nested query"):
+            swipl.check_open(outer, "p(X)")
+        swipl.close_query(outer)
+        assert swipl.lib.closed == ["inner", "inner frame", "outer", "outer frame"]
+        with pytest.raises(SWIQueryError, match="closed before"):
+            swipl.check_open(outer, "p(X)")
+    finally:
+        open_queries().clear()
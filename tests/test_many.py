@@ -0,0 +1,67 @@
+import pytest
+
+from prolog.swipl.exception import SWIQueryError, SWIQueryTimeout
+from tests.engine import ScriptedSwipl
+
+FLAG = "true.\r\n\r\n?- "
+
+
+def test_results_are_split_per_query():
+    ScriptedSwipl.outputs = [
+        FLAG,
+        'SwiPyBatch = [[1,[["ann",13],["bob",40]]],[1,1],[1,0]].\r\n\r\n?- ',
+    ]
+    swipl = ScriptedSwipl("swipl")
+    results = swipl.execute_many(["person(Name, Age).", "a(1)", "b(2)"])
+    assert results == [
+        [{"name": "ann", "age": 13}, {"name": "bob", "age": 40}],
+        [True],
+        [False],
+    ]
+    # one round trip after the flag of full answers
+    assert len(swipl.engine.sent) == 2
+    goal = swipl.engine.sent[-1]
+    assert goal.startswith("findall([SwiPyManyR0, SwiPyManyR1, SwiPyManyR2], ")
+    assert goal.endswith(", [SwiPyBatch]).")
+
+
+def test_error_of_a_query_is_raised():
+    ScriptedSwipl.outputs = [
+        FLAG,
+        "SwiPyBatch = [[1,1],[0,\"error(existence_error(procedure,q/1),q/1)\"]]"
+        ".\r\n\r\n?- ",
+        "SwiPyBatch = [[0,\"time_limit_exceeded\"]].\r\n\r\n?- ",
+    ]
+    swipl = ScriptedSwipl("swipl")
+    with pytest.raises(SWIQueryError, match="q\\(X\\)"):
+        swipl.execute_many(["a(1)", "q(X)"])
+    with pytest.raises(SWIQueryTimeout):
+        swipl.execute_many(["p(X)"])
+
+
+def test_deadline_of_the_batch():
+    ScriptedSwipl.outputs = [
+        FLAG,
+        "ERROR: Unhandled exception: Time limit exceeded\r\n",
+    ]
+    swipl = ScriptedSwipl("swipl")
+    with pytest.raises(SWIQueryTimeout):
+        swipl.execute_many(["p(X)", "q(Y)"], timeout=2)
+    assert swipl.engine.sent[-1].startswith("call_with_time_limit(2.0, (findall(")
+
+
+def test_json_protocol_reads_the_batch_line():
+    ScriptedSwipl.outputs = [
+        '{"SwiPyBatch":[[1,[[1]]],[1,1]]}\r\n',
+        "%swi-py-end\r\n",
+        "?- ",
+    ]
+    swipl = ScriptedSwipl("swipl", protocol="json")
+    assert swipl.execute_many(["p(X)", "q"]) == [[{"x": 1}], [True]]
+    assert not swipl.pending
+
+
+def test_no_queries():
+    swipl = ScriptedSwipl("swipl")
+    assert swipl.execute_many([]) == []
+    assert swipl.engine.sent == []
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+import pytest
+
+from prolog import Predicate
+
+
+def model(**meta) -> type:
+    @dataclass
+    class Edge(Predicate):
+        a: int
+        b: int
+
+        Meta = type("Meta", (), meta)
+
+    return Edge
+
+
+@pytest.mark.parametrize(
+    "meta, directives",
+    [
+        ({}, []),
+        ({"dynamic": True}, [":- dynamic(edge/2)."]),
+        ({"incremental": True}, [":- dynamic([edge/2], [incremental(true)])."]),
+        ({"table": True}, [":- table(edge/2 as dynamic)."]),
+        ({"table": True, "dynamic": True}, [":- table(edge/2 as dynamic)."]),
+        (
+            {"table": True, "incremental": True},
+            [":- table(edge/2 as (dynamic, incremental))."],
+        ),
+    ],
+)
+def test_declarations_of_meta(meta, directives):
+    assert model(**meta).declarations() == directives
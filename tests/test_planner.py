@@ -0,0 +1,63 @@
+from prolog.query import QuerySet
+from tests.engine import FakeProlog
+
+
+def session() -> FakeProlog:
+    prolog = FakeProlog("swipl", planner=True)
+    for name, age in [("ann", 13), ("bob", 40), ("cid", 25), ("dan", 7)]:
+        prolog << f"person({name}, {age})."
+    prolog << "boss(bob)."
+    prolog << "adult(X) :- person(X, A), A > 17."
+    prolog.load_predicates()
+    return prolog
+
+
+def test_selective_goal_moves_first():
+    prolog = session()
+    query = QuerySet("person(X, A), boss(X)")
+    assert query.plan(prolog).prolog == "boss(X), person(X, A)"
+    assert query.explain(prolog) == (
+        "1. boss(X)  (~1 rows)\n2. person(X, A)  (~1 rows)"
+    )
+    assert list(query.fetch(prolog)) == [{"x": "bob", "a": 40}]
+
+
+def test_goals_which_are_not_facts_stay_in_place():
+    prolog = session()
+    query = QuerySet("person(X, A), A > 17, boss(X), adult(Y)")
+    assert query.plan(prolog).prolog == "person(X, A), A > 17, boss(X), adult(Y)"
+    assert query.explain(prolog) == (
+        "1. person(X, A)  (~4 rows)\n"
+        "2. A > 17  (kept in place)\n"
+        "3. boss(X)  (~1 rows)\n"
+        "4. adult(Y)  (kept in place)"
+    )
+
+
+def test_branches_are_planned_apart():
+    prolog = session()
+    query = QuerySet("person(X, A), boss(X) ; (person(X, A) -> boss(X) ; true)")
+    assert query.plan(prolog).prolog == (
+        "boss(X), person(X, A); (person(X, A) -> boss(X) ; true)"
+    )
+    assert query.explain(prolog) == (
+        "1. boss(X)  (~1 rows)\n"
+        "2. person(X, A)  (~1 rows)\n"
+        ";\n"
+        "1. (person(X, A) -> boss(X) ; true)  (kept in place)"
+    )
+
+
+def test_statistics_are_refreshed_after_retracts():
+    prolog = session()
+    query = QuerySet("person(X, A), boss(X)")
+    assert query.plan(prolog).prolog == "boss(X), person(X, A)"
+
+    prolog.retract("person(ann, 13)")
+    assert prolog.planner.stats("person", 2).size == 3
+
+    for name in ["ann", "bob", "cid", "dan", "eve"]:
+        prolog << f"boss({name})."
+    prolog.load_predicates()
+    prolog.retractall("person(_, _)")
+    assert query.plan(prolog).prolog == "person(X, A), boss(X)"
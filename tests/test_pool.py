@@ -0,0 +1,85 @@
+import typing
+
+from dataclasses import dataclass
+
+import pytest
+
+from prolog import Predicate, SwiplPool
+from prolog.swipl.exception import SWICompileError
+from tests.engine import FakeEngine, FakeProlog
+
+
+class Process:
+    """ Stand-in of the pexpect child of an engine """
+
+    def __init__(self):
+        self.terminated = False
+
+    def isalive(self) -> bool:
+        return not self.terminated
+
+    def terminate(self, force: bool = False) -> bool:
+        self.terminated = True
+        return True
+
+
+class PoolEngine(FakeEngine):
+    spawned: typing.List["PoolEngine"] = []
+    broken = False
+
+    def spawn(self) -> None:
+        super().spawn()
+        self.engine = Process()
+        self.calls: typing.List[str] = []
+        self.spawned.append(self)
+
+    def load_lines(self, lines: typing.List[str]) -> None:
+        if self.broken:
+            raise SWICompileError("broken")
+        super().load_lines(lines)
+
+    def call(self, goal: str, timeout: float = 5) -> bool:
+        self.calls.append(goal)
+        return super().call(goal, timeout)
+
+
+class FakePool(SwiplPool):
+    engine_class = PoolEngine
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+    class Meta:
+        dynamic = True
+        index = ("age",)
+
+
+@pytest.fixture
+def prolog():
+    PoolEngine.spawned = []
+    PoolEngine.broken = False
+    prolog = FakeProlog("swipl")
+    prolog << Person("ann", 13)
+    return prolog
+
+
+def test_engines_build_the_indexes_of_the_models(prolog):
+    pool = FakePool.from_prolog(prolog, size=2)
+    assert len(PoolEngine.spawned) == 2
+    for engine in PoolEngine.spawned:
+        assert engine.calls == prolog.index_goals()
+        assert engine.calls == ["ignore(person(_, '$swi_py_index'))"]
+        assert len(engine.facts) == 1
+    with pool.checkout() as engine:
+        assert list(engine.query("person(Name, 13)")) == [{"name": "ann"}]
+
+
+def test_engine_failing_to_load_is_terminated(prolog):
+    PoolEngine.broken = True
+    with pytest.raises(SWICompileError):
+        FakePool.from_prolog(prolog, size=2)
+    assert len(PoolEngine.spawned) == 1
+    assert PoolEngine.spawned[0].engine.terminated
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+import pytest
+
+from prolog import Param, Predicate
+from prolog.orm.exceptions import ORMException
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+def test_bind():
+    query = Person.prepare(name=Param, age=Param)
+    assert str(query.bind("ann", 13)) == 'person("ann", 13)'
+    assert str(query.bind("ann", age=13)) == 'person("ann", 13)'
+    assert query.bind(age=13, name="ann").pre_set == {"name": "ann", "age": 13}
+
+
+@pytest.mark.parametrize(
+    "args, kwargs",
+    [
+        (("ann", 13, 14), {}),
+        (("ann",), {}),
+        (("ann",), {"age": 13, "city": "rome"}),
+        (("ann",), {"name": "bob", "age": 13}),
+        ((), {"name": "ann", "years": 13}),
+    ],
+)
+def test_bind_raises(args, kwargs):
+    with pytest.raises(ORMException):
+        Person.prepare(name=Param, age=Param).bind(*args, **kwargs)
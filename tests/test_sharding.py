@@ -0,0 +1,187 @@
+import threading
+
+from dataclasses import dataclass
+
+import pytest
+
+from prolog import Predicate, ShardedProlog
+from prolog.query import QueryError, route
+from prolog.sharding import Shard
+from prolog.swipl.exception import SWIQueryError
+from tests.engine import FakeEngine
+
+
+class FakeShard(Shard, FakeEngine):
+    pass
+
+
+class FakeShardedProlog(ShardedProlog):
+    shard_class = FakeShard
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+    class Meta:
+        shard_key = "name"
+
+
+@dataclass
+class City(Predicate):
+    name: str
+
+
+PEOPLE = [Person(f"a{i}", 10 + i % 2) for i in range(9)]
+
+
+@pytest.fixture
+def sharded():
+    sharded = FakeShardedProlog("swipl", shards=3)
+    for person in PEOPLE:
+        sharded << person
+    sharded << City("paris")
+    sharded << City("rome")
+    sharded.load_predicates()
+    yield sharded
+    sharded.halt()
+
+
+def test_facts_are_partitioned_by_key(sharded):
+    for shard in sharded.shards:
+        people = [f for f in shard.facts if f.name == "person"]
+        assert all(
+            sharded.shards[sharded.shard_index(f.args[0])] is shard for f in people
+        )
+        assert len([f for f in shard.facts if f.name == "city"]) == 2
+    assert sum(len(shard.facts) for shard in sharded.shards) == len(PEOPLE) + 2 * 3
+
+
+def test_route(sharded):
+    assert route(sharded, Person.filter(name="a1")) is sharded.shards[
+        sharded.shard_index("a1")
+    ]
+    assert route(sharded, Person.filter(age=10)) is sharded
+    assert route(sharded, City.filter()) is sharded.shards[0]
+    assert route(sharded, sharded >> "city(X)") is sharded.shards[0]
+    assert route(sharded, sharded >> "person(X, 10), city(Y)") is sharded
+    assert route(sharded, sharded >> "X = 'person(a)'") is sharded.shards[0]
+
+
+def test_route_rules(sharded):
+    sharded << "adult(X) :- person(X, A), A > 10."
+    sharded << "capital(X) :- city(X)."
+    sharded << "grown(X) :- adult(X)."
+    assert route(sharded, sharded >> "adult(X)") is sharded
+    assert route(sharded, sharded >> "grown(X)") is sharded
+    assert route(sharded, sharded >> "capital(X)") is sharded.shards[0]
+
+
+def test_proof_is_true_if_any_shard_proves_it(sharded):
+    for person in PEOPLE:
+        query = sharded >> f'person("{person.name}", {person.age})'
+        assert query.prove() is True
+        assert list(query.fetch(only_prove=True)) == [True]
+    assert (sharded >> 'person("a1", 99)').prove() is False
+    assert list(sharded.query_batches('person("a1", 11)', 10)) == [[True]]
+
+
+def test_answers_are_merged(sharded):
+    people = Person.filter().fetchall(sharded)
+    assert sorted(people, key=lambda p: p.name) == PEOPLE
+    assert Person.filter().count(sharded) == 9
+    assert Person.filter(age=11).count(sharded) == 4
+    assert Person.filter().sum("age", sharded) == sum(p.age for p in PEOPLE)
+    assert Person.filter().max("age", sharded) == 11
+    assert Person.filter().min("age", sharded) == 10
+    assert Person.filter(name="a3").fetchall(sharded) == (PEOPLE[3],)
+
+
+def test_replicated_facts_are_answered_once(sharded):
+    cities = (sharded >> "city(X)").fetchall()
+    assert sorted(d["x"] for d in cities) == ["paris", "rome"]
+    assert sorted(c.name for c in City.filter().fetchall(sharded)) == ["paris", "rome"]
+    assert City.filter().count(sharded) == 2
+
+
+def test_concurrent_queries_do_not_interleave(sharded):
+    for shard in sharded.shards:
+        shard.delay = 0.001
+    errors = []
+
+    def run() -> None:
+        try:
+            for i in range(10):
+                assert len(Person.filter().fetchall(sharded)) == 9
+                assert Person.filter(name=f"a{i % 9}").fetchone(sharded) is not None
+                assert Person.filter().count(sharded) == 9
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_nested_query_of_a_shard_raises(sharded):
+    answers = Person.filter(name="a1").fetch(sharded)
+    assert next(answers) == PEOPLE[1]
+    with pytest.raises(SWIQueryError):
+        Person.filter(name="a1").fetchall(sharded)
+    answers.close()
+    assert Person.filter(name="a1").fetchall(sharded) == (PEOPLE[1],)
+
+
+def test_other_threads_wait_for_the_answers(sharded):
+    answers = Person.filter(name="a1").fetch(sharded)
+    next(answers)
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(Person.filter(name="a1").fetchall(sharded))
+    )
+    thread.start()
+    thread.join(0.1)
+    assert thread.is_alive()
+    answers.close()
+    thread.join()
+    assert results == [(PEOPLE[1],)]
+
+
+def test_scattered_query_while_reading_a_shard_raises(sharded):
+    answers = Person.filter(name="a1").fetch(sharded)
+    assert next(answers) == PEOPLE[1]
+    with pytest.raises(SWIQueryError):
+        Person.filter().count(sharded)
+    with pytest.raises(SWIQueryError):
+        sharded.load_predicates()
+    answers.close()
+    assert Person.filter().count(sharded) == 9
+
+
+def test_modifiers_of_scattered_query_sets_raise(sharded):
+    for query_set in (
+        Person.filter().limit(2),
+        Person.filter().offset(2),
+        Person.filter().order_by("age"),
+        Person.filter().distinct("age"),
+        sharded >> "limit(2, person(X, Y))",
+    ):
+        with pytest.raises(QueryError):
+            query_set.fetchall(sharded)
+    assert len(Person.filter(name="a1").limit(2).fetchall(sharded)) == 1
+    assert len(City.filter().limit(1).fetchall(sharded)) == 1
+    assert route(sharded, sharded >> "person(X, 'limit(2)')") is sharded
+
+
+def test_exists_queries_the_shard_of_the_key(sharded):
+    for shard in sharded.shards:
+        shard.queries.clear()
+    assert Person.filter(name="a1").exists(sharded)
+    assert not Person.filter(name="a1", age=99).exists(sharded)
+    shard = sharded.shards[sharded.shard_index("a1")]
+    assert [len(s.queries) for s in sharded.shards if s is not shard] == [0, 0]
+    assert Person.filter(age=11).exists(sharded)
@@ -0,0 +1,43 @@
+import os
+
+from dataclasses import dataclass
+
+from prolog import Predicate
+from tests.engine import FakeProlog
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+class SnapshotProlog(FakeProlog):
+    def save_state(self, path: str, timeout: float = 60) -> None:
+        open(path, "w").close()
+
+
+def names(prolog) -> list:
+    return sorted(p.name for p in Person.filter().fetchall(prolog))
+
+
+def test_ingest_after_booting_from_a_snapshot_does_not_duplicate(tmp_path):
+    state = os.path.join(tmp_path, "kb.state")
+    prolog = SnapshotProlog("swipl", state=state)
+    prolog << Person("ann", 13)
+    prolog.load_predicates()
+    prolog.ingest(Person, [("bob", 40)])
+    assert names(prolog) == ["ann", "bob"]
+    facts = [f'{fact.name}("{fact.args[0]}", {fact.args[1]}).' for fact in prolog.facts]
+
+    # the engine booted from the snapshot holds the ingested facts
+    booted = SnapshotProlog("swipl", state=state)
+    assert booted.args[:2] == ["-x", state]
+    booted.load_chunk(facts)
+    booted << Person("ann", 13)
+    booted.load_predicates()
+    assert booted.loaded == len(booted.predicates)
+    booted.ingest(Person, [("bob", 40)])
+    assert names(booted) == ["ann", "bob"]
+    booted.ingest(Person, [("cid", 50)])
+    assert names(booted) == ["ann", "bob", "cid"]
@@ -0,0 +1,78 @@
+import pytest
+
+from prolog.swipl.exception import SWIQueryError
+from tests.engine import ScriptedSwipl
+
+FLAG = "true.\r\n\r\n?- "
+
+
+def test_answers_are_read_one_by_one():
+    ScriptedSwipl.outputs = [
+        'X = 1,\r\nY = "a" ',
+        'X = 2,\r\nY = "b" ',
+        "false.\r\n\r\n?- ",
+    ]
+    swipl = ScriptedSwipl("swipl")
+    answers = list(swipl.query("p(X, Y)."))
+    assert answers == [{"x": 1, "y": "a"}, {"x": 2, "y": "b"}]
+    assert swipl.engine.sent == ["p(X, Y).", ";", ";"]
+    assert not swipl.pending
+
+
+def test_answers_left_unread_are_closed_with_a_dot():
+    ScriptedSwipl.outputs = ["X = 1 ", "?- "]
+    swipl = ScriptedSwipl("swipl")
+    answers = swipl.query("p(X).")
+    assert next(answers) == {"x": 1}
+    answers.close()
+    assert swipl.engine.sent[-1] == "."
+    assert not swipl.pending
+
+
+def test_proofs_and_errors():
+    ScriptedSwipl.outputs = [
+        "true.\r\n\r\n?- ",
+        "false.\r\n\r\n?- ",
+        "ERROR: Unknown procedure: q/0\r\n",
+    ]
+    swipl = ScriptedSwipl("swipl")
+    assert list(swipl.query("p.")) == [True]
+    assert list(swipl.query("r.")) == [False]
+    with pytest.raises(SWIQueryError, match="Unknown procedure"):
+        list(swipl.query("q."))
+
+
+def test_batches_are_read_per_round_trip():
+    ScriptedSwipl.outputs = [
+        FLAG,
+        'SwiPyBatch = [[1,"a"],[2,"b"]] ',
+        'SwiPyBatch = [[3,"c"]].\r\n\r\n?- ',
+    ]
+    swipl = ScriptedSwipl("swipl")
+    batches = list(swipl.query_batches("p(X, Y).", 2))
+    assert batches == [
+        [{"x": 1, "y": "a"}, {"x": 2, "y": "b"}],
+        [{"x": 3, "y": "c"}],
+    ]
+    assert swipl.engine.sent[1:] == [
+        "findnsols(2, [X, Y], (p(X, Y)), SwiPyBatch).",
+        ";",
+    ]
+    assert not swipl.pending
+
+
+def test_full_batch_is_followed_by_false():
+    ScriptedSwipl.outputs = [FLAG, "SwiPyBatch = [[1],[2]] ", "false.\r\n\r\n?- "]
+    swipl = ScriptedSwipl("swipl")
+    assert list(swipl.query_batches("p(X).", 2)) == [[{"x": 1}, {"x": 2}]]
+    assert not swipl.pending
+
+
+def test_batches_left_unread_are_closed_with_a_dot():
+    ScriptedSwipl.outputs = [FLAG, "SwiPyBatch = [[1],[2]] ", "?- "]
+    swipl = ScriptedSwipl("swipl")
+    batches = swipl.query_batches("p(X).", 2)
+    assert next(batches) == [{"x": 1}, {"x": 2}]
+    batches.close()
+    assert swipl.engine.sent[-1] == "."
+    assert not swipl.pending
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from prolog.translations import TranslationCache
+from tests.engine import FakeProlog
+
+
+def person(name, age):
+    yield name, age
+
+
+def adult(name):
+    return "person(Name, Age), Age > 17"
+
+
+EDITED = adult
+
+
+def adult(name):  # noqa: F811 the definition edited after EDITED was cached
+    return "person(Name, Age), Age > 20"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return str(tmp_path)
+
+
+def translate(cache: str, func, **kwargs) -> FakeProlog:
+    prolog = FakeProlog("swipl", translation_cache=cache)
+    prolog.predicate(func, **kwargs)
+    return prolog
+
+
+def test_hit_replays_clauses_and_pattern(cache, monkeypatch):
+    cold = FakeProlog("swipl", translation_cache=cache)
+    fact = cold.predicate(person)
+    cold.predicate(adult)
+
+    def getsource(func):
+        raise AssertionError("the source is read on a hit")
+
+    monkeypatch.setattr("prolog.prolog.getsource", getsource)
+    warm = FakeProlog("swipl", translation_cache=cache)
+    assert str(warm.predicate(person)("ann", 13)) == str(fact("ann", 13))
+    assert warm.predicate(adult) is None
+    assert warm.predicates == cold.predicates
+    assert warm.translations.stats() == {"hits": 2, "misses": 0}
+
+
+def test_edited_definition_is_translated_again(cache):
+    translate(cache, EDITED)
+    prolog = translate(cache, adult)
+    assert prolog.translations.stats() == {"hits": 0, "misses": 1}
+    assert prolog.predicates == ["adult(NAME) :- person(Name, Age), Age > 20"]
+
+
+def test_corrupt_entry_is_a_miss(cache):
+    translate(cache, adult)
+    for entry in os.listdir(cache):
+        with open(os.path.join(cache, entry), "w") as file:
+            file.write('{"clauses": ')
+    prolog = translate(cache, adult)
+    assert prolog.translations.stats() == {"hits": 0, "misses": 1}
+    assert prolog.predicates == ["adult(NAME) :- person(Name, Age), Age > 20"]
+    # the entry was written again
+    assert translate(cache, adult).translations.stats()["hits"] == 1
+
+
+def test_table_option_changes_the_key(cache):
+    tables = (False, True, "incremental")
+    keys = {TranslationCache.key(adult, None, table) for table in tables}
+    assert len(keys) == 3
+    translate(cache, adult)
+    prolog = translate(cache, adult, table="incremental")
+    assert prolog.translations.stats() == {"hits": 0, "misses": 1}
+    assert prolog.predicates[0] == ":- table(adult/1 as (dynamic, incremental))."
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+
+import pytest
+
+from prolog import Predicate
+from tests.engine import FakeProlog
+
+
+@dataclass
+class Person(Predicate):
+    name: str
+    age: int
+
+
+@pytest.fixture
+def prolog():
+    prolog = FakeProlog("swipl")
+    for person in (Person("ann", 13), Person("bob", 13), Person("cid", 40)):
+        prolog << person
+    prolog.load_predicates()
+    return prolog
+
+
+def names(rows) -> list:
+    return sorted(row.name for row in rows)
+
+
+def test_view_follows_loads_and_retracts(prolog):
+    view = prolog.materialize(Person.filter(age=13))
+    assert view.incremental
+    assert names(view) == ["ann", "bob"]
+
+    events = []
+    view.on_change(lambda added, removed: events.append((added, removed)))
+    queries = len(prolog.queries)
+
+    prolog << Person("dan", 13)
+    prolog << Person("eve", 50)
+    prolog.load_predicates(chunk_size=10)
+    prolog.retract(Person("ann", 13))
+    prolog.retract(Person("eve", 50))
+    prolog.retractall(Person.filter(name="bob"))
+
+    assert events == [
+        ([Person("dan", 13)], []),
+        ([], [Person("ann", 13)]),
+        ([], [Person("bob", 13)]),
+    ]
+    assert names(view) == ["dan"]
+    assert len(prolog.queries) == queries
+    assert names(view) == names(Person.filter(age=13).fetchall(prolog))
+
+
+def test_refresh_reports_differences(prolog):
+    view = prolog.materialize(Person.filter(age=13))
+    events = []
+    view.on_change(lambda added, removed: events.append((added, removed)))
+
+    prolog.ingest(Person, [("fay", 13), ("gus", 20)])
+    assert events == [([Person("fay", 13)], [])]
+
+    # changes of raw goals are seen after refresh
+    prolog.call('retract((person("ann", 13)))')
+    assert names(view) == ["ann", "bob", "fay"]
+    view.refresh()
+    assert events[-1] == ([], [Person("ann", 13)])
+    assert names(view) == ["bob", "fay"]
+
+    view.refresh()
+    assert len(events) == 2
+
+
+def test_rules_make_the_view_fetch_again(prolog):
+    view = prolog.materialize(Person.filter(age=13))
+    prolog << 'person(X, 13) :- X = "zed".'
+    prolog.load_predicates()
+    assert view.stale
+    view.fetchall()
+    assert not view.incremental
+
+
+def test_compound_values_are_fetched_again(prolog):
+    prolog << "edge(a, f(b))."
+    prolog << "edge(a, c)."
+    prolog.load_predicates()
+    view = prolog.materialize(prolog >> "edge(a, Y)")
+    assert view.incremental
+    assert view.fetchall() == ({"y": "f(b)"}, {"y": "c"})
+
+    prolog << "edge(a, d)."
+    prolog << "edge(a, g(c))."
+    prolog.load_predicates()
+    assert view.stale
+    assert view.fetchall() == ({"y": "f(b)"}, {"y": "c"}, {"y": "d"}, {"y": "g(c)"})
+
+    prolog.retract("edge(a, f(b))")
+    assert view.fetchall() == ({"y": "c"}, {"y": "d"}, {"y": "g(c)"})
+    prolog.retractall("edge(a, g(_))")
+    assert view.fetchall() == ({"y": "c"}, {"y": "d"})
+    prolog.retract("edge(a, d)")
+    assert not view.stale
+    assert view.fetchall() == ({"y": "c"},)
+
+
+def test_goals_of_builtins_are_not_incremental(prolog):
+    view = prolog.materialize(prolog >> "not(person(X, 99))")
+    assert not view.incremental
+    prolog << Person("zed", 99)
+    prolog.load_predicates()
+    assert view.stale
+
+
+def test_closed_view_stops_following(prolog):
+    view = prolog.materialize(Person.filter(age=13))
+    view.close()
+    prolog << Person("dan", 13)
+    prolog.load_predicates()
+    assert names(view) == ["ann", "bob"]